@@ -1,15 +1,41 @@
 from rdflib import Graph,URIRef,Namespace,BNode,Literal
 from rdflib.namespace import XSD,RDF
-import pandas as pd
 import argparse
-from collections import defaultdict
+from bisect import bisect_right
+from collections import defaultdict,namedtuple
 from datetime import datetime
+from decimal import Decimal
+import hashlib
 import json
+import multiprocessing
+import os
+from zoneinfo import ZoneInfo,ZoneInfoNotFoundError
+from TSS_columns import ObservationColumns,MemoryReport,EpochNanos,FormatTime,EncodeRow
+from TSS_windows import UNITS,BOUNDS,Windowing
+import TSS_metrics
+import TSS_codec
+import TSS_cache
+from RDF_sort import RUN_SIZE,ExternalSorter
+from RDF_stream import IN_FORMATS,OUT_FORMATS,GuessFormat,ParseIncrementally,ParseNTriples,MappedChunks,ReadChunk,ParseChunk,Formatter,OpenWriter,StreamWriter,GraphWriter
 
-def LoadGraph(directory):
+prefix_tss = Namespace('https://w3id.org/tss#')
+prefix_ex  = Namespace('http://example.org/')
+prefix_sosa = Namespace('http://www.w3.org/ns/sosa/')
+base_snippet_ns = Namespace("https://example.org/tss/snippet/")
+base_template_ns = Namespace("https://example.org/tss/template/")
+output_namespaces = {'tss': prefix_tss, 'sosa': prefix_sosa, 'xsd': XSD}
+
+# Same field names as the rows of base_query, so snippets can be built from either.
+Observation = namedtuple('Observation', ['OBSERVATION', 'TIME', 'READING', 'observedProperty'])
+
+def LoadGraph(directory, fmt="turtle"):
     graph = Graph()
     print("Started loading graph...")
-    graph.parse(directory, format="turtle",publicID="https://example.org/")
+    with TSS_metrics.current.stage('parse'):
+        if fmt in ("nt", "nquads"):
+            ParseNTriples(directory, GraphWriter(graph))
+        else:
+            graph.parse(directory, format="turtle",publicID="https://example.org/")
     print("Graph loaded successfully.")
     return graph
 
@@ -25,23 +51,344 @@ WHERE {
 '''
     print('Started identifying unique sensors')
     # store actual RDF terms (URIRef or Literal), not stringified values
-    for sensor in graph.query(get_sensor_query):
-        sensor_term = sensor[0]   # this is an rdflib term (URIRef or Literal)
-        sensor_set.add(sensor_term)
+    with TSS_metrics.current.stage('sensors'):
+        for sensor in graph.query(get_sensor_query):
+            sensor_term = sensor[0]   # this is an rdflib term (URIRef or Literal)
+            sensor_set.add(sensor_term)
 
     print('Sensors identified successfully')
     return sensor_set
 
-def CreateTSS(sensor_set, graph):
-    prefix_tss = Namespace('https://w3id.org/tss#')
-    prefix_ex  = Namespace('http://example.org/')
-    prefix_sosa = Namespace('http://www.w3.org/ns/sosa/')
-    base_snippet_ns = Namespace("https://example.org/tss/snippet/")
+def SensorSegment(sensor_uri):
+    # last path or fragment segment of a sensor URI
+    return str(sensor_uri).rstrip('/').split('/')[-1].split('#')[-1]
+
+def SensorURI(sensor):
+    # Identify sensor subject (URI or mint one); returns it with the id used in snippet URIs.
+    # Sensors in different places can end in the same segment (.../siteA/temp and
+    # .../siteB/temp), so a URI other than the ex:sensor/<id> ones minted here gets a
+    # short hash of the whole URI after it, or their snippets would share URIs.
+    if isinstance(sensor, URIRef):
+        safe_id = SensorSegment(sensor)
+        if sensor != prefix_ex[f"sensor/{safe_id}"]:
+            safe_id += "_" + hashlib.sha1(str(sensor).encode('utf-8')).hexdigest()[:8]
+        return sensor, safe_id
+    safe_id = str(sensor).replace(" ", "_")
+    return prefix_ex[f"sensor/{safe_id}"], safe_id
+
+# The constant terms of every snippet, built once instead of per snippet
+TSS_SNIPPET = prefix_tss.Snippet
+TSS_POINTS = prefix_tss.points
+TSS_FROM = prefix_tss["from"]
+TSS_TO = prefix_tss.to
+TSS_POINT_TYPE = prefix_tss.pointType
+TSS_ABOUT = prefix_tss.about
+TSS_POINT_TEMPLATE = prefix_tss.PointTemplate
+SOSA_OBSERVATION = prefix_sosa.Observation
+SOSA_MADE_BY_SENSOR = prefix_sosa.madeBySensor
+SOSA_OBSERVED_PROPERTY = prefix_sosa.observedProperty
+TSS_COUNT = prefix_tss["count"]
+TSS_MIN = prefix_tss.min
+TSS_MAX = prefix_tss.max
+TSS_MEAN = prefix_tss.mean
+TSS_AGGREGATE_POINT = prefix_tss.AggregatePoint
+TSS_INTERVAL = prefix_tss.interval
+TSS_SUMMARIZES = prefix_tss.summarizes
+# "2025-08-18T00:00:00" -> "20250818000000" for snippet URIs
+SAFE_TIME = str.maketrans('', '', ':-TZ')
+TIME_CACHE_SIZE = 4096
+
+class TermCache:
+    # Interned terms for minting snippets: sensor URIs and ids, tss:from/tss:to literals
+    # (the same window bounds come back for every sensor) and, with shared templates,
+    # one tss:PointTemplate per (sensor, observedProperty) for all of its snippets.
+    def __init__(self, shared_templates=False):
+        self.shared_templates = shared_templates
+        self.sensors = {}     # sensor term -> (sensor URI, safe id)
+        self.times = {}       # lexical xsd:dateTime -> Literal
+        self.templates = {}   # (sensor URI, observedProperty) -> template URI
+        self.names = {}       # template URI -> (sensor URI, observedProperty) it stands for
+        self.written = set()  # shared templates whose triples were already handed out
+
+    def sensor(self, sensor):
+        minted = self.sensors.get(sensor)
+        if minted is None:
+            minted = self.sensors[sensor] = SensorURI(sensor)
+        return minted
+
+    def time(self, lexical):
+        literal = self.times.get(lexical)
+        if literal is None:
+            if len(self.times) >= TIME_CACHE_SIZE:
+                self.times.clear()
+            literal = self.times[lexical] = Literal(lexical, datatype=XSD.dateTime)
+        return literal
+
+    def template(self, sensor_uri, safe_id, observed_property):
+        # Returns the template node and the triples that describe it. Shared templates get
+        # a URI named after the sensor and property, and their triples only come back the
+        # first time, so the snippets after that only link to them.
+        if not self.shared_templates:
+            template = BNode()
+        else:
+            key = (sensor_uri, observed_property)
+            template = self.templates.get(key)
+            if template is None:
+                name = str(observed_property).rstrip('/').split('/')[-1].split('#')[-1].replace(" ", "_")
+                template = base_template_ns[f"{safe_id}_{name}"]
+                number = 1
+                while self.names.get(template, key) != key:
+                    number += 1
+                    template = base_template_ns[f"{safe_id}_{name}_{number}"]
+                self.templates[key] = template
+                self.names[template] = key
+            if template in self.written:
+                return template, []
+            self.written.add(template)
+        return template, [
+            (template, RDF.type, TSS_POINT_TEMPLATE),
+            # Assign sensor
+            (template, SOSA_MADE_BY_SENSOR, sensor_uri),
+            # observedProperty (use first row)
+            (template, SOSA_OBSERVED_PROPERTY, observed_property),
+        ]
+
+    def known(self, template, sensor_uri, observed_property):
+        # a shared template that is already in the output (--update copies it through)
+        key = (sensor_uri, observed_property)
+        self.templates.setdefault(key, template)
+        self.names[template] = key
+        self.written.add(template)
+
+terms = TermCache()
+
+def SetSharedTemplates(shared_templates):
+    # starts a new cache; templates written by an earlier run are not assumed to exist
+    global terms
+    terms = TermCache(shared_templates)
+    return terms
+
+def TimeNanos(text):
+    # epoch nanoseconds of an xsd:dateTime string (naive times are UTC, as in TSS_columns)
+    t = Literal(text, datatype=XSD.dateTime).toPython()
+    if not isinstance(t, datetime):
+        raise ValueError(f"Not an xsd:dateTime: {text!r}")
+    return EpochNanos(t)
+
+class Selection:
+    # --sensor / --property / --from / --until: the observations a run converts. It is
+    # checked as each observation is assembled from the input, so everything else is
+    # dropped before grouping, encoding and building. Sensors match on the sensor term,
+    # its URI or its id; properties on the observedProperty's string; from is inclusive
+    # and until exclusive, like the windows.
+    def __init__(self, sensors=None, properties=None, start=None, end=None):
+        self.sensors = set(sensors) if sensors else None
+        self.properties = set(properties) if properties else None
+        self.start_ns = TimeNanos(start) if start else None
+        self.end_ns = TimeNanos(end) if end else None
+        self.sensor_matches = {}
+
+    def everything(self):
+        return self.sensors is None and self.properties is None and self.start_ns is None and self.end_ns is None
+
+    def sensor(self, sensor):
+        if self.sensors is None:
+            return True
+        matches = self.sensor_matches.get(sensor)
+        if matches is None:
+            sensor_uri, safe_id = terms.sensor(sensor)
+            matches = self.sensor_matches[sensor] = not self.sensors.isdisjoint((str(sensor), str(sensor_uri), safe_id, SensorSegment(sensor_uri)))
+        return matches
+
+    def time_range(self, nanos):
+        return (self.start_ns is None or nanos >= self.start_ns) and (self.end_ns is None or nanos < self.end_ns)
+
+    def accepts(self, sensor, row):
+        if not self.sensor(sensor):
+            return False
+        if self.properties is not None and str(row.observedProperty) not in self.properties:
+            return False
+        if self.start_ns is None and self.end_ns is None:
+            return True
+        t = row.TIME.toPython()
+        return isinstance(t, datetime) and self.time_range(EpochNanos(t))
+
+selection = Selection()
+
+def SetSelection(sensors=None, properties=None, start=None, end=None):
+    global selection
+    selection = Selection(sensors, properties, start, end)
+    return selection
+
+class Summaries:
+    # --aggregates: tss:count/min/max/mean of every snippet as extra triples on it.
+    # --downsample: per interval (minutes), a companion snippet next to every snippet whose
+    # points are {"time", "count", "min", "max", "mean"} per bucket, typed
+    # tss:pointType tss:AggregatePoint and linked to it with tss:summarizes.
+    # min/max/mean cover the numeric values only (null/absent when there are none).
+    def __init__(self, aggregates=False, downsample=()):
+        self.aggregates = aggregates
+        self.downsample = sorted(set(downsample or ()))
+
+summaries = Summaries()
+
+def SetSummaries(aggregates=False, downsample=()):
+    global summaries
+    summaries = Summaries(aggregates, downsample)
+    return summaries
+
+def DecimalLiteral(number):
+    # xsd:decimal from the shortest repr, like the point values TSS2RDF types; an
+    # xsd:double would be rounded by rdflib's Turtle serializer
+    return Literal(Decimal(repr(number)))
+
+def AggregateTriples(subject, count, low, high, mean):
+    triples = [(subject, TSS_COUNT, Literal(count))]
+    if low is not None:
+        triples.append((subject, TSS_MIN, DecimalLiteral(low)))
+        triples.append((subject, TSS_MAX, DecimalLiteral(high)))
+        triples.append((subject, TSS_MEAN, DecimalLiteral(mean)))
+    return triples
+
+def CompanionTriples(snippet, sensor_uri, safe_id, bucket, from_literal, to_literal, minutes):
+    # the downsampled companion of one snippet
+    interval = f"PT{minutes}M"
+    companion = URIRef(snippet + "_" + interval)
+    points = [{"time": FormatTime(start, offset), "count": count, "min": low, "max": high, "mean": mean}
+              for start, offset, count, low, high, mean in bucket.downsample(minutes * 60 * 1000000000)]
+    template, template_triples = terms.template(sensor_uri, safe_id, bucket.observed_property(0))
+    triples = [
+        (companion, RDF.type, TSS_SNIPPET),
+        (companion, TSS_POINTS, Literal(json.dumps(points))),
+        (companion, TSS_FROM, from_literal),
+        (companion, TSS_TO, to_literal),
+        (companion, TSS_POINT_TYPE, TSS_AGGREGATE_POINT),
+        # as written, rdflib would otherwise turn PT60M into PT1H
+        (companion, TSS_INTERVAL, Literal(interval, datatype=XSD.duration, normalize=False)),
+        (companion, TSS_SUMMARIZES, snippet),
+        (companion, TSS_ABOUT, template),
+    ]
+    if terms.shared_templates:
+        return template_triples + triples
+    return triples + template_triples
+
+# --cache: options left out of the keys since they do not change the output file, and
+# the options the text of one (sensor, window) depends on
+UNCACHED_OPTIONS = ('input', 'output', 'cache', 'cache_size', 'metrics', 'profile', 'index', 'memory_report', 'run_size', 'temp_dir')
+FRAGMENT_OPTIONS = ('out_format', 'window', 'timezone', 'max_points', 'max_bytes', 'bounds', 'json_codec', 'aggregates', 'downsample')
 
+class Fragments:
+    # --cache at the (sensor, window) level: the formatted text of a window is looked up by
+    # the digest of its points, so when only part of the input changed only the windows
+    # whose points changed are built again. Not used with --shared-templates, where a
+    # window's text depends on which template was written before it.
+    def __init__(self, cache=None, options=None):
+        self.cache = cache
+        self.options = options
+
+    def usable(self):
+        return self.cache is not None and not terms.shared_templates
+
+fragments = Fragments()
+
+def SetFragmentCache(cache=None, options=None):
+    global fragments
+    fragments = Fragments(cache, options)
+    return fragments
+
+def SnippetTriples(sensor, bucket, from_time=None, to_time=None, piece=0):
+    # bucket: ObservationColumns of one sensor for one snippet, sorted by time
+    # from_time/to_time: lexical tss:from/tss:to, defaulting to the first and last point
+    # piece: position of the snippet within its window, when the window is cut into several
+    sensor_uri, safe_id = terms.sensor(sensor)
+
+    # JSON list of points, written by the selected codec (straight from the columns by default)
+    json_object = TSS_codec.EncodePoints(bucket)
+    first_time = bucket.time_lexical(0)
+    if from_time is None:
+        from_time = first_time
+    if to_time is None:
+        to_time = bucket.time_lexical(len(bucket) - 1)
+    from_literal = terms.time(from_time)
+    to_literal = terms.time(to_time)
+
+    # Create nodes
+    template, template_triples = terms.template(sensor_uri, safe_id, bucket.observed_property(0))
+
+    # Final snippet URI, from the first timestamp without its separators; later pieces of a
+    # window get their position appended, as they may start at the same timestamp
+    snippet_name = safe_id + "_" + first_time.translate(SAFE_TIME)
+    if piece:
+        snippet_name += f"_{piece}"
+    snippet = URIRef(base_snippet_ns + snippet_name)
+    TSS_metrics.current.snippet(safe_id, len(bucket), len(json_object))
+    triples = [
+        # Snippet
+        (snippet, RDF.type, TSS_SNIPPET),
+        (snippet, TSS_POINTS, Literal(json_object, datatype=TSS_codec.codec.datatype)),
+        (snippet, TSS_FROM, from_literal),
+        (snippet, TSS_TO, to_literal),
+        (snippet, TSS_POINT_TYPE, SOSA_OBSERVATION),
+        # Link to template
+        (snippet, TSS_ABOUT, template),
+    ]
+    if summaries.aggregates:
+        triples.extend(AggregateTriples(snippet, *bucket.aggregate()))
+    if terms.shared_templates:
+        # a shared template's triples come first, so streaming readers have it before its snippets
+        triples = template_triples + triples
+    else:
+        triples.extend(template_triples)
+    for minutes in summaries.downsample:
+        triples.extend(CompanionTriples(snippet, sensor_uri, safe_id, bucket, from_literal, to_literal, minutes))
+    return triples
+
+def WindowFragment(formatter, sensor, key, bucket, windowing):
+    # WindowTriples formatted as text, taken from the fragment cache when it is there
+    if not fragments.usable():
+        return formatter.format(WindowTriples(sensor, key, bucket, windowing))
+    fragment_key = fragments.cache.fragment_key(fragments.options, sensor.n3(), str(key), bucket.digest())
+    cached = fragments.cache.get(fragment_key)
+    if cached is None:
+        with TSS_metrics.current.recording() as snippets:
+            text = formatter.format(WindowTriples(sensor, key, bucket, windowing))
+        fragments.cache.put(fragment_key, text, snippets)
+        return text
+    # the snippets a build would have reported
+    text, snippets = cached
+    for safe_id, points, json_bytes in snippets:
+        TSS_metrics.current.snippet(safe_id, points, json_bytes)
+    return text
+
+def WriteWindow(writer, sensor, key, bucket, windowing):
+    if fragments.usable() and isinstance(writer, StreamWriter):
+        writer.write_fragment(WindowFragment(writer.formatter, sensor, key, bucket, windowing))
+    else:
+        writer.write(WindowTriples(sensor, key, bucket, windowing))
+
+def WindowTriples(sensor, key, bucket, windowing, first_piece=0):
+    # all snippets of one (sensor, window) bucket, after windowing has cut it
+    # first_piece: pieces of this window already written by an earlier call
+    triples = []
+    for n, (piece, from_time, to_time) in enumerate(windowing.pieces(key, bucket), first_piece):
+        triples.extend(SnippetTriples(sensor, piece, from_time, to_time, n))
+    return triples
+
+def NewTSSGraph():
     final_graph = Graph()
     final_graph.bind('tss', prefix_tss)
     final_graph.bind('ex', prefix_ex)
     final_graph.bind('sosa', prefix_sosa)
+    return final_graph
+
+def CreateTSS(sensor_set, graph, windowing=None, writer=None):
+    # Per-sensor SPARQL engine (--engine sparql), kept for comparison with CreateTSSIndexed.
+    # Without a writer the snippets are collected in a new graph and returned.
+    windowing = windowing or Windowing()
+    final_graph = None
+    if writer is None:
+        final_graph = NewTSSGraph()
+        writer = GraphWriter(final_graph)
 
     print("Creating TSS graph...")
 
@@ -60,101 +407,769 @@ def CreateTSS(sensor_set, graph):
     ORDER BY ?TIME
     """
 
-    for sensor in sensor_set:
-        sensor_token = sensor.n3()
+    with TSS_metrics.current.stage('build'):
+        for sensor in sensor_set:
+            if not selection.sensor(sensor):
+                continue
+            sensor_token = sensor.n3()
 
-        q = base_query % sensor_token
-        results = list(graph.query(q))
+            q = base_query % sensor_token
+            results = list(graph.query(q))
 
-        if not results:
-            continue
+            # Group by window (date by default) in Python (FAST)
+            grouped = defaultdict(list)
+            for row in results:
+                if not selection.accepts(sensor, row):
+                    continue
+                t = row.TIME.toPython()
+                grouped[windowing.key(t)].append(row)
 
-        # Group by date in Python (FAST)
-        grouped = defaultdict(list)
-        for row in results:
-            t = row.TIME.toPython()
-            grouped[t.date()].append(row)
+            # Build TSS blocks (none when the sensor has no selected observations)
+            for window_key, rows in grouped.items():
+                writer.write(WindowTriples(sensor, window_key, ObservationColumns(rows), windowing))
 
-        # Identify sensor subject (URI or mint one)
-        if isinstance(sensor, URIRef):
-            sensor_uri = sensor
-        else:
-            safe_id = str(sensor).replace(" ", "_")
-            sensor_uri = prefix_ex[f"sensor/{safe_id}"]
-
-        # Build TSS blocks
-        for date_key, rows in grouped.items():
-
-            # Convert rows into JSON list
-            tss_points = []
-            for r in rows:
-                tss_points.append({
-                    "time": str(r.TIME),
-                    "value": str(r.READING),
-                    "id": str(r.OBSERVATION),
-                    "observedProperty": str(r.observedProperty)
-                })
-
-            json_object = json.dumps(tss_points)
-
-            # Create nodes
-            #snippet = BNode() #this should be changed. 
-            template = BNode()
+    print("TSS graph created.")
+    return final_graph
 
-############replacing blank node snippet############
-            first_obs = str(rows[0].OBSERVATION)
-            first_time = str(rows[0].TIME)
-            # Sanitize time for URI use
-            safe_time = first_time.replace(":", "").replace("-", "").replace("T", "").replace("Z", "")
-            # Example: "2025-08-18T00:00:00" → "20250818000000"
-            # Sanitize observation ID
-            safe_obs = first_obs.replace(":", "%3A").replace("/", "%2F")
-            # Final snippet URI
-            snippet = URIRef(base_snippet_ns[f"{safe_id}_{safe_time}"])
-########################
-            # Add Snippet
-            final_graph.add((snippet, RDF.type, prefix_tss.Snippet))
-            final_graph.add((snippet, prefix_tss.points, Literal(json_object)))
-            final_graph.add((snippet, prefix_tss["from"], Literal(str(rows[0].TIME), datatype=XSD.dateTime)))
-            final_graph.add((snippet, prefix_tss.to, Literal(str(rows[-1].TIME), datatype=XSD.dateTime)))
-            final_graph.add((snippet, prefix_tss.pointType, prefix_sosa.Observation))
-
-            # Link to template
-            final_graph.add((snippet, prefix_tss.about, template))
-            final_graph.add((template, RDF.type, prefix_tss.PointTemplate))
+def GroupObservations(graph, windowing):
+    # One sweep over the graph instead of one SPARQL query per sensor.
+    # Returns sensor -> window key -> ObservationColumns, each window sorted by time once.
+    grouped = defaultdict(lambda: defaultdict(ObservationColumns))
 
-            # Assign sensor
-            if isinstance(sensor, URIRef):
-                final_graph.add((template, prefix_sosa.madeBySensor, sensor))
-            else:
-                final_graph.add((template, prefix_sosa.madeBySensor, sensor_uri))
+    def add(sensor, row):
+        grouped[sensor][windowing.key(row.TIME.toPython())].append(row)
 
-            # observedProperty (use first row)
-            final_graph.add((template, prefix_sosa.observedProperty, rows[0].observedProperty))
+    with TSS_metrics.current.stage('grouping'):
+        assembler = ObservationAssembler(add, selection)
+        for s, p, o in graph.triples((None, None, None)):
+            assembler.triple(s, p, o)
+
+        for days in grouped.values():
+            for bucket in days.values():
+                bucket.sort()
+    return grouped
+
+def CreateTSSIndexed(graph, writer=None, windowing=None):
+    # Without a writer the snippets are collected in a new graph and returned;
+    # with one they are written out as soon as each is built.
+    windowing = windowing or Windowing()
+    final_graph = None
+    if writer is None:
+        final_graph = NewTSSGraph()
+        writer = GraphWriter(final_graph)
+
+    print("Creating TSS graph...")
+    grouped = GroupObservations(graph, windowing)
+    print(f"Indexed observations of {len(grouped)} sensors")
+
+    with TSS_metrics.current.stage('build'):
+        for sensor, windows in grouped.items():
+            for key in sorted(windows):
+                WriteWindow(writer, sensor, key, windows[key], windowing)
 
     print("TSS graph created.")
     return final_graph
 
+def CreateTSSFromStore(store_directory, input_directory, in_format=None, writer=None, windowing=None):
+    # --store: observations come from an SQLite store instead of a Graph. The input is
+    # only parsed (streamed) into the store when the store does not hold it yet; snippets
+    # are then built one sensor at a time from index range scans.
+    # imported here so runs without --store do not load sqlite3
+    from TSS_store import ObservationStore
+    windowing = windowing or Windowing()
+    final_graph = None
+    if writer is None:
+        final_graph = NewTSSGraph()
+        writer = GraphWriter(final_graph)
+
+    with ObservationStore(store_directory) as store:
+        if store.is_current(input_directory):
+            print(f"Using the observations stored in {store_directory}")
+        else:
+            print(f"Storing the observations of {input_directory} in {store_directory}...")
+            with TSS_metrics.current.stage('ingest'):
+                count = store.ingest(input_directory, lambda on_observation: ParseIncrementally(
+                    input_directory, ObservationAssembler(on_observation), in_format))
+            print(f"Stored {count} observations.")
+
+        print("Creating TSS graph...")
+        with TSS_metrics.current.stage('build'):
+            for sensor_id, sensor in store.sensors():
+                if not selection.sensor(sensor):
+                    continue
+                windows = store.windows(sensor_id, windowing, selection)
+                for key in sorted(windows):
+                    WriteWindow(writer, sensor, key, windows[key], windowing)
+    print("TSS graph created.")
+    return final_graph
 
+_fragment_formatter = None
+_fragment_windowing = None
 
+def InitFragmentWorker(out_format, windowing, json_codec=TSS_codec.DEFAULT_CODEC, shared_templates=False, snippet_summaries=None, fragment_cache=None):
+    global _fragment_formatter, _fragment_windowing, summaries
+    TSS_metrics.Reset()
+    TSS_codec.SetCodec(json_codec)
+    # every sensor is built by one task, so its shared templates are written exactly once
+    SetSharedTemplates(shared_templates)
+    summaries = snippet_summaries or Summaries()
+    if fragment_cache is not None:
+        # (cache directory, options); the main process evicts when it closes the cache
+        directory, options = fragment_cache
+        SetFragmentCache(TSS_cache.ResultCache(directory), options)
+    _fragment_formatter = Formatter(out_format, output_namespaces)
+    _fragment_windowing = windowing
 
-def SaveGraph(directory,final_graph):
+def SensorFragment(task):
+    # Runs in a --workers process: builds every snippet of one sensor and returns them
+    # already formatted, so the main process only has to concatenate text. The sensor's
+    # counters go back with the text, since the worker's metrics are not written anywhere.
+    sensor, windows = task
+    if fragments.usable():
+        text = ''.join(WindowFragment(_fragment_formatter, sensor, key, bucket, _fragment_windowing) for key, bucket in windows)
+        return text, TSS_metrics.current.take_sensors()
+    triples = []
+    for key, bucket in windows:
+        triples.extend(WindowTriples(sensor, key, bucket, _fragment_windowing))
+    return _fragment_formatter.format(triples), TSS_metrics.current.take_sensors()
+
+def InitGroupWorker():
+    TSS_metrics.Reset()
+
+def GroupChunk(task):
+    # Runs in a --workers process: parses one chunk of the input and groups its
+    # observations like GroupObservations. Observations whose triples are not all in
+    # this chunk come back as the assembler's pending fields, to be completed by the caller.
+    directory, start, end, header, fmt, windowing, selected = task
+    grouped = {}
+
+    def add(sensor, row):
+        windows = grouped.setdefault(sensor, {})
+        key = windowing.key(row.TIME.toPython())
+        bucket = windows.get(key)
+        if bucket is None:
+            bucket = windows[key] = ObservationColumns()
+        bucket.append(row)
+
+    assembler = ObservationAssembler(add, selected)
+    ParseChunk(header + ReadChunk(directory, start, end), assembler, fmt)
+    return grouped, assembler.pending
+
+def GroupObservationsParallel(directory, fmt, windowing, workers):
+    # Same result as LoadGraph + GroupObservations, but the input is memory-mapped, cut at
+    # statement ends and parsed by `workers` processes; their buckets are merged in file order.
+    chunks = MappedChunks(directory, workers * 4, fmt)
+    print(f"Parsing {len(chunks)} chunks with {workers} workers...")
+    grouped = defaultdict(lambda: defaultdict(ObservationColumns))
+    pending = {}
+    tasks = [(directory, start, end, header, fmt, windowing, selection) for start, end, header in chunks]
+    with TSS_metrics.current.stage('parse'), multiprocessing.Pool(workers, initializer=InitGroupWorker) as pool:
+        for chunk_grouped, chunk_pending in pool.imap(GroupChunk, tasks):
+            for sensor, windows in chunk_grouped.items():
+                for key, bucket in windows.items():
+                    grouped[sensor][key].extend(bucket)
+            for subject, found in chunk_pending.items():
+                pending.setdefault(subject, {}).update(found)
+
+    with TSS_metrics.current.stage('grouping'):
+        # observations that straddled a chunk boundary
+        for subject, found in pending.items():
+            if len(found) == len(ObservationAssembler.fields):
+                row = Observation(subject, found['TIME'], found['READING'], found['observedProperty'])
+                if not selection.accepts(found['sensor'], row):
+                    continue
+                grouped[found['sensor']][windowing.key(row.TIME.toPython())].append(row)
+        for windows in grouped.values():
+            for bucket in windows.values():
+                bucket.sort()
+    return grouped
+
+def CreateTSSParallel(grouped, output_directory, workers, out_format="turtle", windowing=None):
+    # grouped: sensor -> window key -> sorted ObservationColumns (GroupObservations)
+    print(f"Creating TSS file with {workers} workers...")
+    windowing = windowing or Windowing()
+    # Sensors are handed out (and their fragments written) in a fixed order,
+    # so the output does not depend on which worker finishes first.
+    tasks = []
+    for sensor in sorted(grouped, key=lambda sensor: sensor.n3()):
+        windows = grouped[sensor]
+        tasks.append((sensor, [(key, windows[key]) for key in sorted(windows)]))
+    chunksize = max(1, len(tasks) // (workers * 4))
+    fragment_cache = (fragments.cache.directory, fragments.options) if fragments.cache is not None else None
+
+    with OpenWriter(output_directory, out_format, output_namespaces) as writer:
+        with TSS_metrics.current.stage('build'), multiprocessing.Pool(workers, initializer=InitFragmentWorker, initargs=(out_format, windowing, TSS_codec.codec_name, terms.shared_templates, summaries, fragment_cache)) as pool:
+            for fragment, sensors in pool.imap(SensorFragment, tasks, chunksize=chunksize):
+                writer.write_fragment(fragment)
+                TSS_metrics.current.merge_sensors(sensors)
+    print(f"TSS file written: {len(tasks)} sensors.")
+
+class ObservationAssembler:
+    # Sink for the streaming parsers: collects the sosa:Observation triples of each
+    # subject and passes the finished observation on as soon as all five are seen.
+    # Only subjects that are still incomplete are kept in memory.
+    fields = {
+        RDF.type: 'type',
+        prefix_sosa.resultTime: 'TIME',
+        prefix_sosa.hasSimpleResult: 'READING',
+        prefix_sosa.observedProperty: 'observedProperty',
+        prefix_sosa.madeBySensor: 'sensor',
+    }
+
+    def __init__(self, on_observation, selected=None):
+        # selected: Selection the observations have to pass, if any
+        self.on_observation = on_observation
+        self.selected = selected if selected is not None and not selected.everything() else None
+        self.pending = {}
+
+    def triple(self, s, p, o):
+        field = self.fields.get(p)
+        if field is None or (field == 'type' and o != prefix_sosa.Observation):
+            return
+        found = self.pending.setdefault(s, {})
+        found[field] = o
+        if len(found) == len(self.fields):
+            del self.pending[s]
+            row = Observation(s, found['TIME'], found['READING'], found['observedProperty'])
+            if self.selected is None or self.selected.accepts(found['sensor'], row):
+                self.on_observation(found['sensor'], row)
+
+class SnippetStream:
+    # Holds the open (sensor, window) buckets of a streaming run. A sensor's earlier windows
+    # are closed and written out as soon as it reports an observation from a later window,
+    # so input grouped by time keeps at most one bucket per sensor in memory.
+    # Observations that arrive for a window that was already written end up in a second snippet.
+    def __init__(self, writer, windowing=None):
+        self.writer = writer
+        self.windowing = windowing or Windowing()
+        self.open = defaultdict(dict)
+        self.written = {}  # (sensor, window) -> snippets written for it so far
+        self.snippet_count = 0
+        self.reopened_count = 0
+
+    def observation(self, sensor, row):
+        key = self.windowing.key(row.TIME.toPython())
+        buckets = self.open[sensor]
+        if key not in buckets:
+            if (sensor, key) in self.written:
+                self.reopened_count += 1
+            for closed in [k for k in buckets if k < key]:
+                self.flush(sensor, closed)
+            buckets[key] = ObservationColumns()
+        buckets[key].append(row)
+
+    def flush(self, sensor, key):
+        bucket = self.open[sensor].pop(key)
+        bucket.sort()
+        written = self.written.get((sensor, key), 0)
+        for n, (piece, from_time, to_time) in enumerate(self.windowing.pieces(key, bucket), written):
+            self.writer.write(SnippetTriples(sensor, piece, from_time, to_time, n))
+            self.snippet_count += 1
+        self.written[(sensor, key)] = n + 1
+
+    def close(self):
+        for sensor in list(self.open):
+            for key in sorted(self.open[sensor]):
+                self.flush(sensor, key)
+        self.open.clear()
+        if self.reopened_count:
+            print(f"Warning: {self.reopened_count} windows received observations after their snippet was written and were split into extra snippets. Sort the input by time to avoid this.")
+
+def StreamTSS(input_directory, output_directory, in_format=None, out_format="turtle", windowing=None):
+    print("Creating TSS file in streaming mode...")
+    with OpenWriter(output_directory, out_format, output_namespaces) as writer:
+        with TSS_metrics.current.stage('stream'):
+            snippets = SnippetStream(writer, windowing)
+            ParseIncrementally(input_directory, ObservationAssembler(snippets.observation, selection), in_format)
+            snippets.close()
+    print(f"TSS file written: {snippets.snippet_count} snippets.")
+
+class ObservationRuns:
+    # --engine external: parser sink that spills every observation to an ExternalSorter as
+    # one record line, sorted by sensor (in order of first appearance), window, time and
+    # input order, so the merge hands the windows out in the order GroupObservations
+    # builds them. Only the sensor and observedProperty tables stay in memory.
+    TIME_BIAS = 1 << 63  # nanoseconds before 1970 are negative
+
+    def __init__(self, sorter, windowing):
+        self.sorter = sorter
+        self.windowing = windowing
+        self.sensors = {}
+        self.properties = {}
+
+    def intern(self, table, term):
+        index = table.get(term)
+        if index is None:
+            index = table[term] = len(table)
+        return index
+
+    def observation(self, sensor, row):
+        nanos, offset, value, kind, observation_id, observed_property, keep_time, keep_value = EncodeRow(row)
+        key = self.windowing.key(row.TIME.toPython())
+        record = json.dumps([offset, value, kind, observation_id, self.intern(self.properties, observed_property), keep_time, keep_value])
+        self.sorter.add(f"{self.intern(self.sensors, sensor):08x}\t{key.isoformat()}\t"
+                        f"{nanos + self.TIME_BIAS:016x}{self.sorter.count:012x}\t{record}\n")
+
+    def windows(self):
+        # (sensor, window key, sorted ObservationColumns) from the merged runs, one window at a time
+        sensors = list(self.sensors)
+        properties = list(self.properties)
+        current = None
+        bucket = None
+        for line in self.sorter.merged():
+            sensor_index, key_text, order, record = line.split('\t', 3)
+            if (sensor_index, key_text) != current:
+                if bucket is not None:
+                    yield sensors[int(current[0], 16)], datetime.fromisoformat(current[1]), bucket
+                current = (sensor_index, key_text)
+                bucket = ObservationColumns()
+            offset, value, kind, observation_id, property_index, keep_time, keep_value = json.loads(record)
+            bucket.append_encoded(int(order[:16], 16) - self.TIME_BIAS, offset, value, kind, observation_id,
+                                  properties[property_index], keep_time, keep_value)
+        if bucket is not None:
+            yield sensors[int(current[0], 16)], datetime.fromisoformat(current[1]), bucket
+
+def CreateTSSExternal(input_directory, output_directory, in_format=None, out_format="turtle", windowing=None,
+                      run_size=RUN_SIZE, temp_dir=None):
+    # Groups with an external merge sort instead of in memory: the observations are spilled
+    # to sorted runs of run_size records and merged back one (sensor, window) at a time,
+    # so memory is bounded by run_size and the largest window, not by a sensor's history,
+    # and the input may be in any order. The output is written as it is built, like --stream.
+    windowing = windowing or Windowing()
+    print("Creating TSS file with an external sort...")
+    with ExternalSorter(run_size, temp_dir) as sorter:
+        runs = ObservationRuns(sorter, windowing)
+        with TSS_metrics.current.stage('parse'):
+            ParseIncrementally(input_directory, ObservationAssembler(runs.observation, selection), in_format)
+        print(f"Sorting {sorter.count} observations of {len(runs.sensors)} sensors ({len(sorter.runs)} runs spilled to disk)...")
+        count = 0
+        with OpenWriter(output_directory, out_format, output_namespaces) as writer, TSS_metrics.current.stage('build'):
+            for sensor, key, bucket in runs.windows():
+                WriteWindow(writer, sensor, key, bucket, windowing)
+                count += 1
+    print(f"TSS file written: {count} windows.")
+
+def SnippetBlock(graph, snippet):
+    # the snippet's own triples plus those of its tss:about templates; a shared (URI)
+    # template is only copied with the first snippet that refers to it
+    triples = list(graph.triples((snippet, None, None)))
+    for template in graph.objects(snippet, prefix_tss.about):
+        if isinstance(template, URIRef):
+            if template in terms.written:
+                continue
+            terms.written.add(template)
+            triples = list(graph.triples((template, None, None))) + triples
+        else:
+            triples.extend(graph.triples((template, None, None)))
+    return triples
+
+def MergeSnippetPoints(graph, snippet, bucket, delta_ids):
+    # Adds the points of an existing snippet to the delta bucket of its window.
+    # Points the delta delivers again (same id) are left out; the delta's copy wins.
+    properties = {str(term): term for term in bucket.property_table}
+    for template in graph.objects(snippet, prefix_tss.about):
+        for term in graph.objects(template, prefix_sosa.observedProperty):
+            properties.setdefault(str(term), term)
+    for points in graph.objects(snippet, prefix_tss.points):
+        for point in TSS_codec.DecodeLiteral(points):
+            if point['id'] in delta_ids:
+                continue
+            observed_property = properties.get(point['observedProperty'])
+            if observed_property is None:
+                observed_property = properties[point['observedProperty']] = Literal(point['observedProperty'])
+            bucket.append(Observation(URIRef(point['id']),
+                                      Literal(point['time'], datatype=XSD.dateTime),
+                                      Literal(point['value']),
+                                      observed_property))
+
+def UpdateTSS(tss_directory, delta_directory, output_directory, in_format=None, out_format="turtle", windowing=None, index=False):
+    # Incremental mode: merges a delta of new observations into an existing TSS file.
+    # Only the (sensor, window) snippets the delta touches are decoded, merged in time
+    # order and rebuilt. With a current index of the file in the output format, the other
+    # snippets are copied through as bytes (SpliceTSS); without one the whole file is
+    # loaded and written again (RewriteTSS).
+    # index: also write the index of the output
+    from TSS_index import CurrentIndex  # only needed for --update
+    windowing = windowing or Windowing()
+    print("Updating TSS file...")
+    delta = defaultdict(lambda: defaultdict(ObservationColumns))
+
+    def add(sensor, row):
+        delta[sensor][windowing.key(row.TIME.toPython())].append(row)
+
+    with TSS_metrics.current.stage('delta'):
+        ParseIncrementally(delta_directory, ObservationAssembler(add, selection), in_format)
+    touched = {}
+    for sensor, windows in delta.items():
+        sensor_uri = terms.sensor(sensor)[0]
+        for key, bucket in windows.items():
+            touched[(sensor_uri, key)] = (bucket, set(bucket.ids))
+
+    tss_index = CurrentIndex(tss_directory)
+    if tss_index is not None and tss_index['format'] == out_format:
+        SpliceTSS(tss_directory, tss_index, delta, touched, output_directory, windowing, index)
+        return
+    if tss_index is None:
+        print(f"No current index of {tss_directory}, so the whole file is read and written again. "
+              f"Build one with: python TSS_index.py build -i {tss_directory}")
+    else:
+        print(f"{tss_directory} is {tss_index['format']}, not {out_format}, so the whole file is read and written again.")
+    RewriteTSS(tss_directory, delta, touched, output_directory, out_format, windowing)
+    if index:
+        from TSS_index import WriteIndex
+        WriteIndex(output_directory, out_format)
+
+def RewriteTSS(tss_directory, delta, touched, output_directory, out_format, windowing):
+    # --update without a usable index: every snippet goes through a Graph
+    existing = LoadGraph(tss_directory, GuessFormat(tss_directory))
+    if not StreamedOutput(out_format):
+        final_graph = NewTSSGraph()
+        writer = GraphWriter(final_graph)
+    else:
+        final_graph = None
+        writer = OpenWriter(output_directory, out_format, output_namespaces)
+
+    kept = merged = 0
+    with TSS_metrics.current.stage('merge'):
+        for snippet in list(existing.subjects(RDF.type, prefix_tss.Snippet)):
+            template = existing.value(snippet, prefix_tss.about)
+            sensor_uri = existing.value(template, prefix_sosa.madeBySensor)
+            key = windowing.key(existing.value(snippet, prefix_tss["from"]).toPython())
+            if existing.value(snippet, TSS_POINT_TYPE) == TSS_AGGREGATE_POINT:
+                # a --downsample companion: rebuilt with its snippet when that is touched
+                if (sensor_uri, key) not in touched:
+                    writer.write(SnippetBlock(existing, snippet))
+                continue
+            if (sensor_uri, key) in touched:
+                bucket, delta_ids = touched[(sensor_uri, key)]
+                MergeSnippetPoints(existing, snippet, bucket, delta_ids)
+                merged += 1
+            else:
+                writer.write(SnippetBlock(existing, snippet))
+                kept += 1
+
+        for sensor, windows in delta.items():
+            for key in sorted(windows):
+                bucket = windows[key]
+                bucket.sort()
+                WriteWindow(writer, sensor, key, bucket, windowing)
+
+    print(f"Kept {kept} snippets, merged {merged} into {len(touched)} rebuilt windows.")
+    if final_graph is not None:
+        SaveGraph(output_directory, final_graph, out_format)
+    else:
+        writer.close()
+        print('File written successfully')
+
+def WindowRecords(triples):
+    # Splits built triples into the records TSS_index reads back (RDF_stream.StatementRecords):
+    # the triples of one URI subject followed by those of the blank nodes it refers to.
+    records = {}
+    owner = {}
+    for triple in triples:
+        s, p, o = triple
+        main = owner.get(s, s)
+        records.setdefault(main, []).append(triple)
+        if isinstance(o, BNode):
+            owner[o] = main
+    return list(records.values())
+
+def CopyRange(source, target, start, stop):
+    source.seek(start)
+    while start < stop:
+        block = source.read(min(1 << 20, stop - start))
+        if not block:
+            break
+        target.write(block)
+        start += len(block)
+
+def SpliceTSS(tss_directory, tss_index, delta, touched, output_directory, windowing, index=False):
+    # --update through the index of the file: only the index, the prefix header, the shared
+    # templates and the snippets of the touched windows are read. The output is the file's
+    # bytes with each touched window's snippets (and --downsample companions) replaced by
+    # its rebuilt ones at the place of the first of them; windows the file does not have yet
+    # are added at the end. The index of the output is shifted along rather than rebuilt.
+    from TSS_index import RangeText, ReadRanges, ReadSnippets, SharedTemplates, SnippetEntry, IndexData, SaveIndex
+    fmt = tss_index['format']
+    replaced = defaultdict(list)  # touched window -> its entries in the file
+    for entry in tss_index['snippets']:
+        if entry['sensor']:
+            window = (URIRef(entry['sensor']), windowing.key(Literal(entry['from'], datatype=XSD.dateTime).toPython()))
+            if window in touched:
+                replaced[window].append(entry)
+    dropped = sorted((entry for entries in replaced.values() for entry in entries), key=lambda entry: entry['offset'])
+
+    merged = 0
+    with TSS_metrics.current.stage('merge'):
+        existing = ReadSnippets(tss_directory, tss_index, dropped)
+        for window, entries in replaced.items():
+            bucket, delta_ids = touched[window]
+            for entry in entries:
+                if 'interval' not in entry:
+                    MergeSnippetPoints(existing, URIRef(entry['snippet']), bucket, delta_ids)
+                    merged += 1
+
+        # shared templates stay where they are; rebuilt snippets only link to them
+        templates = {}  # template -> (its values, offset, length) in the file
+        for offset, length in sorted({tuple(entry['template']) for entry in tss_index['snippets'] if isinstance(entry.get('template'), list)}):
+            for template, values in SharedTemplates(list(ReadRanges(tss_directory, tss_index, [(offset, length)]))).items():
+                templates[template] = (values, offset, length)
+                terms.known(template, values.get(SOSA_MADE_BY_SENSOR), values.get(SOSA_OBSERVED_PROPERTY))
+
+        # rebuilt text uses the prefixes the file declares
+        namespaces = {}
+        if fmt == 'turtle':
+            header = Graph(bind_namespaces='none').parse(data=RangeText(tss_directory, tss_index, []), format='turtle')
+            namespaces = {prefix: Namespace(namespace) for prefix, namespace in header.namespaces()}
+        formatter = Formatter(fmt, namespaces)
+        first = {min(entry['offset'] for entry in entries): window for window, entries in replaced.items()}
+        order = [first[offset] for offset in sorted(first)]
+        sensors = {}
+        for sensor, windows in delta.items():
+            for key in sorted(windows):
+                window = (terms.sensor(sensor)[0], key)
+                sensors[window] = sensor
+                if window not in replaced:
+                    order.append(window)
+        rebuilt = {}  # window -> [(text, triples)] per record, built in output order
+        for window in order:
+            bucket = touched[window][0]
+            bucket.sort()
+            rebuilt[window] = [(formatter.format(triples).encode('utf-8'), triples)
+                               for triples in WindowRecords(WindowTriples(sensors[window], window[1], bucket, windowing))]
+
+    segments = []  # (offset in the file, offset in the output) where a copied stretch starts
+    records = []   # (offset, length, triples) of the rebuilt records in the output
+    # written next to the output and renamed, so -o may also be the file being updated
+    temporary = str(output_directory) + '.tmp'
+    with TSS_metrics.current.stage('splice'), open(tss_directory, 'rb') as source, open(temporary, 'wb') as target:
+        def write(window):
+            for text, triples in rebuilt[window]:
+                records.append((target.tell(), len(text), triples))
+                target.write(text)
+
+        position = 0
+        for entry in dropped:
+            segments.append((position, target.tell()))
+            CopyRange(source, target, position, entry['offset'])
+            if entry['offset'] in first:
+                write(first[entry['offset']])
+            position = entry['offset'] + entry['length']
+        segments.append((position, target.tell()))
+        CopyRange(source, target, position, tss_index['size'])
+        added = [window for window in order if window not in replaced]
+        if added and tss_index['size']:
+            source.seek(tss_index['size'] - 1)
+            if source.read(1) != b'\n':
+                target.write(b'\n')
+        for window in added:
+            write(window)
+    os.replace(temporary, output_directory)
+    print(f"Kept {len(tss_index['snippets']) - len(dropped)} snippets, merged {merged} into {len(touched)} rebuilt windows.")
+    print('File written successfully')
+    if not index:
+        return
+
+    starts = [start for start, _ in segments]
+    def moved(offset):
+        start, output_start = segments[bisect_right(starts, offset) - 1]
+        return offset - start + output_start
+
+    shared = {template: (values, moved(offset), length) for template, (values, offset, length) in templates.items()}
+    for offset, length, triples in records:
+        for template, values in SharedTemplates(triples).items():
+            shared[template] = (values, offset, length)
+    removed = {id(entry) for entry in dropped}
+    entries = []
+    for entry in tss_index['snippets']:
+        if id(entry) in removed:
+            continue
+        entry = dict(entry, offset=moved(entry['offset']))
+        if isinstance(entry.get('template'), list):
+            entry['template'] = [moved(entry['template'][0]), entry['template'][1]]
+        entries.append(entry)
+    for offset, length, triples in records:
+        entry = SnippetEntry(triples, offset, length, shared)
+        if entry is not None:
+            entries.append(entry)
+    entries.sort(key=lambda entry: entry['offset'])
+    header_ranges = [[moved(offset), length] for offset, length in tss_index['header']]
+    SaveIndex(output_directory, IndexData(output_directory, fmt, header_ranges, entries))
+
+def PrintMemoryReport(input_directory, in_format=None):
+    # Bytes per point of today's row objects (one tuple of rdflib terms per observation)
+    # against ObservationColumns, for the observations of the given input.
+    def parse(on_observation):
+        ParseIncrementally(input_directory, ObservationAssembler(on_observation), in_format)
+
+    report = MemoryReport(parse, list, ObservationColumns)
+    for name in ('rows', 'columns'):
+        entry = report[name]
+        print(f"{name:8} {entry['points']} points, {entry['bytes']} bytes, {entry['bytes_per_point']:.1f} bytes/point")
+    print(f"reduction {report['reduction']:.1f}x")
+    return report
+
+def StreamedOutput(out_format):
+    # nt is always written while the snippets are built. So is Turtle with shared templates:
+    # rdflib's serializer orders subjects by how often they are referred to, which puts
+    # every shared template after the snippets using it, and TSS2RDF.py --stream would
+    # then hold those snippets until the end of the file.
+    return out_format == 'nt' or terms.shared_templates
+
+def SaveGraph(directory,final_graph,fmt="turtle"):
     print('Started writing file to disk')
-    final_graph.serialize(destination=directory, format="turtle")
+    with TSS_metrics.current.stage('serialize'):
+        final_graph.serialize(destination=directory, format=fmt, encoding="utf-8")
     print('File written successfully')
 
-def main():
+def Convert(args, in_format, windowing):
+    if args.update:
+        UpdateTSS(args.update, args.input, args.output, in_format, args.out_format, windowing, args.index)
+        return
+    if args.stream:
+        StreamTSS(args.input, args.output, in_format, args.out_format, windowing)
+        return
+    if args.store:
+        if StreamedOutput(args.out_format):
+            with OpenWriter(args.output, args.out_format, output_namespaces) as writer:
+                CreateTSSFromStore(args.store, args.input, in_format, writer, windowing)
+            print('File written successfully')
+            return
+        SaveGraph(args.output, CreateTSSFromStore(args.store, args.input, in_format, windowing=windowing), args.out_format)
+        return
+    if args.workers > 1:
+        # the input is parsed and grouped in the workers too
+        grouped = GroupObservationsParallel(args.input, in_format, windowing, args.workers)
+        CreateTSSParallel(grouped, args.output, args.workers, args.out_format, windowing)
+        return
+    if args.engine == 'external':
+        CreateTSSExternal(args.input, args.output, in_format, args.out_format, windowing, args.run_size, args.temp_dir)
+        return
+    Original_graph  = LoadGraph(args.input, in_format)
+    if StreamedOutput(args.out_format):
+        with OpenWriter(args.output, args.out_format, output_namespaces) as writer:
+            if args.engine == 'sparql':
+                CreateTSS(CreateSensorSet(Original_graph), Original_graph, windowing, writer)
+            else:
+                CreateTSSIndexed(Original_graph, writer, windowing)
+        print('File written successfully')
+        return
+    if args.engine == 'sparql':
+        Sensor_set = CreateSensorSet(Original_graph)
+        Final_graph = CreateTSS(Sensor_set,Original_graph,windowing)
+    else:
+        Final_graph = CreateTSSIndexed(Original_graph, windowing=windowing)
+    SaveGraph(args.output,Final_graph,args.out_format)
+
+def CachedConvert(args, in_format, windowing):
+    # --cache: an input converted before with the same options (and converter version) is
+    # copied from the cache; otherwise the windows whose points are cached are reused
+    options = {name: value for name, value in vars(args).items() if name not in UNCACHED_OPTIONS}
+    inputs = [args.input] + ([args.update] if args.update else [])
+    with TSS_cache.ResultCache(args.cache, args.cache_size << 20) as cache:
+        key = cache.file_key('rdf2tss', inputs, options)
+        if cache.fetch(key, args.output):
+            print(f"Output copied from the cache in {args.cache}")
+            return
+        SetFragmentCache(cache, {name: options[name] for name in FRAGMENT_OPTIONS})
+        try:
+            Convert(args, in_format, windowing)
+        finally:
+            SetFragmentCache()
+        cache.store(key, args.output)
+
+def BuildParser():
     parser = argparse.ArgumentParser(description='Process sensor graph files.')
     parser.add_argument('-i', '--input', required=True, help='Input Turtle file path')
     parser.add_argument('-o', '--output', required=True, help='Output Turtle file path')
-    args = parser.parse_args()
+    parser.add_argument('--in-format', choices=IN_FORMATS, help='Input format (default: from the file extension, .nt/.nq or Turtle)')
+    parser.add_argument('--out-format', choices=OUT_FORMATS, default='turtle', help='Output format; nt is written line by line while snippets are built')
+    parser.add_argument('--stream', action='store_true', help='Convert while reading the input instead of loading it into a graph first')
+    parser.add_argument('--engine', choices=['indexed', 'sparql', 'external'], default='indexed', help='indexed: group all observations in one pass over the graph (default); sparql: one SPARQL query per sensor; external: group with an external merge sort on disk, for inputs larger than memory')
+    parser.add_argument('--run-size', type=int, default=RUN_SIZE, help=f'With --engine external: observations sorted in memory per run before spilling to disk (default: {RUN_SIZE})')
+    parser.add_argument('--temp-dir', help='With --engine external: directory for the sorted runs (default: the system temp directory)')
+    parser.add_argument('--workers', type=int, default=1, help='Parse the input in memory-mapped chunks and build snippets in this many processes (uses the indexed engine)')
+    parser.add_argument('--window', choices=UNITS, default='day', help='Calendar window each snippet covers (default: day)')
+    parser.add_argument('--timezone', help='IANA timezone the calendar windows are taken in (default: each timestamp\'s own offset)')
+    parser.add_argument('--max-points', type=int, help='Cut windows into snippets of at most this many points')
+    parser.add_argument('--max-bytes', type=int, help='Cut windows into snippets whose tss:points literal is at most this many bytes')
+    parser.add_argument('--bounds', choices=BOUNDS, default='points', help='points: tss:from/tss:to are the first and last point (default); window: they are the window bounds')
+    parser.add_argument('--sensor', nargs='+', help='Only convert these sensors (sensor URI, literal or id)')
+    parser.add_argument('--property', nargs='+', help='Only convert observations of these observedProperty values')
+    parser.add_argument('--from', dest='start', help='Only convert observations at or after this xsd:dateTime')
+    parser.add_argument('--until', dest='end', help='Only convert observations before this xsd:dateTime')
+    parser.add_argument('--update', metavar='TSS_FILE', help='Incremental mode: the input is a delta of new observations that is merged into this existing TSS file; only the windows it touches are rebuilt')
+    parser.add_argument('--store', metavar='DB', help='Keep the observations in this SQLite file: the first run stores the input, later runs with the same unchanged input read from it instead of parsing again')
+    parser.add_argument('--index', action='store_true', help='Also write a sidecar snippet index (<output>.tssidx) for TSS_index.py query')
+    parser.add_argument('--shared-templates', action='store_true', help='Write one tss:PointTemplate per (sensor, observedProperty), shared by all of its snippets, instead of one per snippet')
+    parser.add_argument('--aggregates', action='store_true', help='Add tss:count, tss:min, tss:max and tss:mean of its values to every snippet')
+    parser.add_argument('--downsample', type=int, nargs='+', metavar='MINUTES', help='Also write a companion snippet per snippet with count/min/max/mean per bucket of this many minutes, e.g. --downsample 1 15')
+    parser.add_argument('--memory-report', action='store_true', help='Only print the per-point memory of row objects vs. columnar buckets for the input')
+    TSS_metrics.AddArguments(parser)
+    TSS_codec.AddArguments(parser)
+    TSS_cache.AddArguments(parser)
+    return parser
+
+def CheckArgs(parser, args):
+    if args.downsample and min(args.downsample) < 1:
+        parser.error('--downsample needs intervals of at least one minute')
+    for option, value in (('--max-points', args.max_points), ('--max-bytes', args.max_bytes), ('--workers', args.workers)):
+        if value is not None and value < 1:
+            parser.error(f'{option} needs a positive number, not {value}')
+    if args.timezone:
+        try:
+            ZoneInfo(args.timezone)
+        except (ZoneInfoNotFoundError, ValueError):
+            parser.error(f'--timezone needs an IANA timezone such as Europe/Brussels, not {args.timezone!r}')
+    for option, value in (('--from', args.start), ('--until', args.end)):
+        if value:
+            try:
+                TimeNanos(value)
+            except ValueError:
+                parser.error(f'{option} needs an xsd:dateTime such as 2025-08-12T00:00:00Z, not {value!r}')
+    if args.workers > 1 and (args.stream or args.update):
+        parser.error('--workers cannot be combined with --stream or --update')
+    if args.update and args.stream:
+        parser.error('--update cannot be combined with --stream')
+    if args.engine == 'sparql' and (args.stream or args.update):
+        parser.error('--engine sparql cannot be combined with --stream or --update')
+    if args.engine == 'external' and (args.stream or args.update or args.workers > 1):
+        parser.error('--engine external cannot be combined with --stream, --update or --workers')
+    if args.run_size < 1:
+        parser.error('--run-size needs at least one observation per run')
+    if args.store and (args.stream or args.update or args.workers > 1 or args.engine != 'indexed'):
+        parser.error('--store cannot be combined with --stream, --update, --workers or --engine sparql/external')
+
+def Run(args):
+    # one conversion for already parsed and checked options (also used by TSS_batch.py)
+    in_format = args.in_format or GuessFormat(args.input)
+    TSS_codec.SetCodec(args.json_codec)
+    SetSharedTemplates(args.shared_templates)
+    SetSelection(args.sensor, args.property, args.start, args.end)
+    SetSummaries(args.aggregates, args.downsample)
+    windowing = Windowing(args.window, args.timezone, args.max_points, args.max_bytes, args.bounds)
 
     print("Program started!")
-    Original_graph  = LoadGraph(args.input)
-    Sensor_set = CreateSensorSet(Original_graph)
-    Final_graph = CreateTSS(Sensor_set,Original_graph)
-    SaveGraph(args.output,Final_graph)
+    if args.memory_report:
+        PrintMemoryReport(args.input, in_format)
+        return
+    instrumented = TSS_metrics.EnableFromArgs(args)
+    if args.cache:
+        CachedConvert(args, in_format, windowing)
+    else:
+        Convert(args, in_format, windowing)
+    if args.index:
+        from TSS_index import CurrentIndex, WriteIndex  # only needed for --index
+        if CurrentIndex(args.output) is None:  # --update may have written it already
+            WriteIndex(args.output, args.out_format)
+    if instrumented:
+        TSS_metrics.Finish()
+
+def main():
+    parser = BuildParser()
+    args = parser.parse_args()
+    CheckArgs(parser, args)
+    Run(args)
 
-    
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,32 +1,184 @@
 from rdflib import Graph,URIRef,Namespace,BNode,Literal
 from rdflib.namespace import XSD,RDF
-import pandas as pd
 import argparse
 from collections import defaultdict
 from datetime import datetime
 import json
+import shutil
+from RDF_stream import IN_FORMATS,OUT_FORMATS,GuessFormat,ParseIncrementally,ParseNTriples,ParseNTriplesLine,StableBNodes,NTriplesFormatter,TurtleFormatter,OpenWriter,GraphWriter
+from RDF_sort import RUN_SIZE,ExternalSorter
 
-def LoadGraph(directory):
+# Blank-node triples whose owner is not known yet are held back; past this many they
+# are sorted under their own label (and then written as _:label blocks, not inlined).
+PENDING_LIMIT = 100000
+_SHARED = object()
+
+def LoadGraph(directory, fmt="turtle"):
     graph = Graph()
     print("Started loading graph...")
-    graph.parse(directory, format="turtle",publicID="https://example.org/")
+    if fmt in ("nt", "nquads"):
+        ParseNTriples(directory, GraphWriter(graph))
+    else:
+        graph.parse(directory, format="turtle",publicID="https://example.org/")
     print("Graph loaded successfully.")
     return graph
 
-def SaveGraph(directory,final_graph):
+def SaveGraph(directory,final_graph,fmt="turtle"):
     print('Started writing file to disk')
-    final_graph.serialize(destination=directory, format="turtle")
+    final_graph.serialize(destination=directory, format=fmt, encoding="utf-8")
+    print('File written successfully')
+
+class SubjectRuns:
+    # Parser sink for --stream: every triple goes to an ExternalSorter as an N-Triples line
+    # behind the key of the subject block it is written in. A blank node referred to
+    # once is keyed under the subject that refers to it, so it comes out next to it and
+    # can be inlined as [ ... ] like rdflib does. Only the blank nodes' owners are kept
+    # in memory, not the triples.
+    def __init__(self, sorter):
+        self.sorter = sorter
+        self.nt = NTriplesFormatter()
+        self.owners = {}    # blank node -> subject referring to it, or _SHARED
+        self.pending = []   # (blank node subject, line) with no owner yet
+
+    def triple(self, s, p, o):
+        if isinstance(o, BNode):
+            self.owners[o] = _SHARED if o in self.owners else s
+        line = self.nt.format([(s, p, o)])
+        if isinstance(s, BNode):
+            self.pending.append((s, line))
+            if len(self.pending) >= PENDING_LIMIT:
+                self.resolve()
+        else:
+            # URIs sort before blank nodes, as in rdflib's output
+            self.sorter.add('0' + str(s) + '\x00' + line)
+
+    def block_key(self, node, final):
+        seen = set()
+        while isinstance(node, BNode):
+            owner = self.owners.get(node)
+            if owner is None and not final:
+                return None
+            if owner is None or owner is _SHARED or node in seen:
+                return '1' + str(node)
+            seen.add(node)
+            node = owner
+        return '0' + str(node)
+
+    def resolve(self, final=False):
+        waiting = []
+        for s, line in self.pending:
+            key = self.block_key(s, final)
+            if key is None:
+                waiting.append((s, line))
+            else:
+                self.sorter.add(key + '\x00' + line)
+        self.pending = waiting
+        if len(waiting) >= PENDING_LIMIT:
+            self.resolve(final=True)
+
+    def shared(self):
+        # labels of the blank nodes that more than one triple refers to
+        return {str(node) for node, owner in self.owners.items() if owner is _SHARED}
+
+def SubjectBlocks(lines):
+    # sorted key + line -> lists of distinct N-Triples lines per subject block
+    key = None
+    block = []
+    for line in lines:
+        line_key, _, text = line.partition('\x00')
+        if line_key != key:
+            if block:
+                yield block
+            key = line_key
+            block = []
+        if not block or block[-1] != text:
+            block.append(text)
+    if block:
+        yield block
+
+class _UsedPrefixes:
+    # namespace manager stand-in that remembers which prefixes the formatted text uses
+    def __init__(self, manager):
+        self.manager = manager
+        self.used = set()
+
+    def normalizeUri(self, uri):
+        text = self.manager.normalizeUri(uri)
+        if not text.startswith('<'):
+            self.used.add(text.partition(':')[0])
+        return text
+
+    def mention(self, triples):
+        # rdflib declares the prefix of every IRI and datatype in the graph, also where the
+        # text does not use it (rdf:first in ( ... ), xsd:integer of a plain number)
+        for s, p, o in triples:
+            for node in (s, o) if p == RDF.type else (s, p, o):
+                if isinstance(node, URIRef):
+                    self.normalizeUri(node)
+                elif isinstance(node, Literal) and node.datatype:
+                    self.normalizeUri(node.datatype)
+
+def PrettifyStream(input_directory, output_directory, in_format=None, run_size=RUN_SIZE, temp_dir=None):
+    # Same Turtle layout as LoadGraph + SaveGraph (subjects sorted, one block per subject,
+    # predicates and objects sorted, single-use blank nodes inlined, only the used
+    # prefixes declared) with memory bounded by run_size triples: the triples are sorted
+    # by subject externally and the blocks are written as they come out of the merge.
+    namespaces = {}
+    with ExternalSorter(run_size, temp_dir) as sorter:
+        sink = SubjectRuns(sorter)
+        ParseIncrementally(input_directory, sink, in_format, namespaces)
+        sink.resolve(final=True)
+        print(f"Sorting {sorter.count} triples ({len(sorter.runs)} runs spilled to disk)...")
+
+        # the prefixes Graph.parse would end up with: rdflib's defaults plus the input's
+        manager = Graph().namespace_manager
+        for prefix, namespace in namespaces.items():
+            manager.bind(prefix, namespace)
+        formatter = TurtleFormatter({prefix: str(namespace) for prefix, namespace in manager.namespaces()})
+        formatter.namespace_manager = _UsedPrefixes(formatter.namespace_manager)
+        shared = sink.shared()
+        bnodes = StableBNodes()
+
+        # the body goes to a temporary file first, since the header lists only used prefixes
+        body = sorter.path('body.ttl')
+        with open(body, 'w', encoding='utf-8') as f:
+            for block in SubjectBlocks(sorter.merged()):
+                triples = [ParseNTriplesLine(line, bnodes) for line in block]
+                formatter.namespace_manager.mention(triples)
+                block_shared = {o for s, p, o in triples if isinstance(o, BNode) and str(o)[2:] in shared}
+                unreferenced = {s for s, p, o in triples if isinstance(s, BNode) and BNode(str(s)[2:]) not in sink.owners}
+                f.write(formatter.format(triples, block_shared, unreferenced))
+        formatter.namespaces = {prefix: namespace for prefix, namespace in formatter.namespaces.items()
+                                if prefix in formatter.namespace_manager.used}
+        with open(output_directory, 'w', encoding='utf-8') as out, open(body, encoding='utf-8') as f:
+            out.write(formatter.header() if formatter.namespaces else '')
+            shutil.copyfileobj(f, out)
     print('File written successfully')
 
 def main():
     parser = argparse.ArgumentParser(description='Process sensor graph files.')
     parser.add_argument('-i', '--input', required=True, help='Input Turtle file path')
     parser.add_argument('-o', '--output', required=True, help='Output Turtle file path')
+    parser.add_argument('--in-format', choices=IN_FORMATS, help='Input format (default: from the file extension, .nt/.nq or Turtle)')
+    parser.add_argument('--out-format', choices=OUT_FORMATS, default='turtle', help='Output format; nt is copied statement by statement without building a graph')
+    parser.add_argument('--stream', action='store_true', help='Sort the triples by subject on disk (external merge sort) instead of loading a graph, so memory stays bounded')
+    parser.add_argument('--run-size', type=int, default=RUN_SIZE, help=f'With --stream: triples sorted in memory per run before spilling to disk (default: {RUN_SIZE})')
+    parser.add_argument('--temp-dir', help='With --stream: directory for the sorted runs (default: the system temp directory)')
     args = parser.parse_args()
+    in_format = args.in_format or GuessFormat(args.input)
 
     print("Program started!")
-    Original_graph  = LoadGraph(args.input)
-    SaveGraph(args.output,Original_graph)
+    if args.out_format == 'nt':
+        # nothing to sort or group, so every parsed triple goes straight to the output
+        with OpenWriter(args.output, args.out_format, {}) as writer:
+            ParseIncrementally(args.input, writer, in_format)
+        print('File written successfully')
+        return
+    if args.stream:
+        PrettifyStream(args.input, args.output, in_format, args.run_size, args.temp_dir)
+        return
+    Original_graph  = LoadGraph(args.input, in_format)
+    SaveGraph(args.output,Original_graph,args.out_format)
 
 if __name__ == "__main__":
     main()    
\ No newline at end of file
@@ -0,0 +1,87 @@
+import heapq
+import os
+import shutil
+import tempfile
+
+# External merge sort of text lines, for data that does not fit in memory.
+# Lines are collected up to run_size, sorted and spilled to a temporary run file;
+# merged() then streams all runs back in order with a k-way merge (heapq.merge). When
+# there are more runs than MERGE_FANIN they are first merged in groups, so no more than
+# MERGE_FANIN files are open at once. Memory is bounded by run_size lines.
+#
+# Lines are compared as Python strings and must end in '\n' without one inside, so a
+# caller that sorts records writes them with a sortable key first.
+
+RUN_SIZE = 500000
+MERGE_FANIN = 64
+
+class ExternalSorter:
+    def __init__(self, run_size=RUN_SIZE, temp_dir=None):
+        self.run_size = run_size
+        self.directory = tempfile.mkdtemp(prefix='tss_sort_', dir=temp_dir)
+        self.buffer = []
+        self.runs = []
+        self.count = 0
+
+    def add(self, line):
+        self.buffer.append(line)
+        self.count += 1
+        if len(self.buffer) >= self.run_size:
+            self.spill()
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def spill(self):
+        if not self.buffer:
+            return
+        self.buffer.sort()
+        run = self.path(f"run{len(self.runs)}")
+        with open(run, 'w', encoding='utf-8', newline='\n') as f:
+            f.writelines(self.buffer)
+        self.runs.append(run)
+        self.buffer = []
+
+    def merge_runs(self, runs, target):
+        files = [open(run, encoding='utf-8', newline='\n') for run in runs]
+        try:
+            with open(target, 'w', encoding='utf-8', newline='\n') as f:
+                f.writelines(heapq.merge(*files))
+        finally:
+            for f in files:
+                f.close()
+        for run in runs:
+            os.remove(run)
+
+    def merged(self):
+        # all lines added so far, in sorted order; a single run is served from memory
+        if not self.runs:
+            self.buffer.sort()
+            yield from self.buffer
+            self.buffer = []
+            return
+        self.spill()
+        level = 0
+        while len(self.runs) > MERGE_FANIN:
+            runs = []
+            for start in range(0, len(self.runs), MERGE_FANIN):
+                target = self.path(f"merge{level}_{start}")
+                self.merge_runs(self.runs[start:start + MERGE_FANIN], target)
+                runs.append(target)
+            self.runs = runs
+            level += 1
+        files = [open(run, encoding='utf-8', newline='\n') for run in self.runs]
+        try:
+            yield from heapq.merge(*files)
+        finally:
+            for f in files:
+                f.close()
+
+    def close(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,492 @@
+from rdflib import Graph,URIRef,BNode,Literal
+from rdflib.namespace import RDF,RDFS
+from rdflib.exceptions import ParserError
+from rdflib.plugins.parsers.notation3 import RDFSink,SinkParser
+from collections import defaultdict
+import mmap
+import re
+
+# Readers and writers for the streaming modes of the converters.
+# Nothing in here keeps a Graph of the data: parsed triples are handed to a sink
+# (any object with a triple(s, p, o) method, same contract as rdflib's N-Triples sink)
+# as soon as they are read, and output is written one subject block at a time.
+
+CHUNK_SIZE = 1 << 20  # characters of Turtle handed to the parser per feed() call
+
+IN_FORMATS = ['turtle', 'nt', 'nquads']
+OUT_FORMATS = ['turtle', 'nt']
+
+def GuessFormat(directory):
+    if str(directory).endswith('.nt'):
+        return 'nt'
+    if str(directory).endswith('.nq'):
+        return 'nquads'
+    return 'turtle'
+
+# Tokens that can hide a '.' from the end-of-statement check: IRIs, strings (long ones may
+# span lines) and comments. Inside [ ] and ( ) a '.' is not allowed, so outside these a '.'
+# that is the last token on a line always ends a statement.
+# (the string patterns are unrolled loops, so a long tss:points literal is matched in one go)
+_TURTLE_TOKEN = re.compile(r'"""|\'\'\'|<[^>\n]*>|"[^"\\\n]*(?:\\.[^"\\\n]*)*"|\'[^\'\\\n]*(?:\\.[^\'\\\n]*)*\'|#')
+_LONG_STRING_END = {
+    '"""': re.compile(r'[^"\\]*(?:(?:\\.|"(?!""))[^"\\]*)*"""', re.DOTALL),
+    "'''": re.compile(r"[^'\\]*(?:(?:\\.|'(?!''))[^'\\]*)*'''", re.DOTALL),
+}
+_TURTLE_SPECIAL = re.compile(r'["\'<#]')
+
+class TurtleLines:
+    # Tells for each line of a Turtle (or N-Triples) file, given in order, whether it ends
+    # a statement: its last token outside IRIs, strings and comments is the '.' terminator.
+    def __init__(self):
+        self.long_quote = None  # delimiter of the long string the previous line left open
+
+    def ends_statement(self, line):
+        if self.long_quote is None and _TURTLE_SPECIAL.search(line) is None:
+            return line.rstrip().endswith('.')
+        code = []
+        position = 0
+        if self.long_quote is not None:
+            position = self.close_long_string(line, 0)
+            if position is None:
+                return False
+            code.append('""')
+        while True:
+            match = _TURTLE_TOKEN.search(line, position)
+            if match is None:
+                code.append(line[position:])
+                break
+            code.append(line[position:match.start()])
+            token = match.group()
+            if token == '#':
+                break
+            if token in _LONG_STRING_END:
+                self.long_quote = token
+                position = self.close_long_string(line, match.end())
+                if position is None:
+                    return False
+            else:
+                position = match.end()
+            code.append('""')
+        return ''.join(code).rstrip().endswith('.')
+
+    def close_long_string(self, line, position):
+        # end of the open long string within line (and closes it), or None when it goes on
+        match = _LONG_STRING_END[self.long_quote].match(line, position)
+        if match is None:
+            return None
+        self.long_quote = None
+        return match.end()
+
+def TurtleStatementChunks(directory, chunk_size=CHUNK_SIZE):
+    # Yields pieces of a Turtle file that always end on a statement terminator,
+    # so each piece can be fed to the same SinkParser (prefixes carry over).
+    buffer = []
+    size = 0
+    lines = TurtleLines()
+    with open(directory, encoding='utf-8') as source:
+        for line in source:
+            buffer.append(line)
+            size += len(line)
+            if lines.ends_statement(line) and size >= chunk_size:
+                yield ''.join(buffer)
+                buffer = []
+                size = 0
+    if buffer:
+        yield ''.join(buffer)
+
+class _ForwardingGraph:
+    # Stands in for the Graph that rdflib's Turtle sink writes to.
+    def __init__(self, sink):
+        self.sink = sink
+
+    def add(self, triple):
+        self.sink.triple(*triple)
+
+def ParseTurtle(directory, sink, publicID="https://example.org/", chunk_size=CHUNK_SIZE, namespaces=None):
+    # namespaces: dict that receives the file's prefix bindings, as Graph.parse would bind them
+    parser = SinkParser(RDFSink(_ForwardingGraph(sink)), baseURI=publicID, turtle=True)
+    parser.startDoc()
+    for chunk in TurtleStatementChunks(directory, chunk_size):
+        parser.feed(chunk)
+    parser.endDoc()
+    if namespaces is not None:
+        namespaces.update(parser._bindings)
+
+# Hand-rolled N-Triples / N-Quads reader: one regex match per line, no tokenizer.
+# The graph label of an N-Quads line is accepted and dropped.
+_IRI = r'<[^>]*>'
+_BNODE = r'_:[^\s.<"]+(?:\.+[^\s.<"]+)*'
+_LITERAL = r'"(?:[^"\\]|\\.)*"(?:@[A-Za-z]+(?:-[A-Za-z0-9]+)*|\^\^<[^>]*>)?'
+_NT_LINE = re.compile(
+    rf'\s*({_IRI}|{_BNODE})\s*({_IRI})\s*({_IRI}|{_BNODE}|{_LITERAL})\s*(?:{_IRI}|{_BNODE})?\s*\.\s*(?:#.*)?$')
+_ESCAPE = re.compile(r'\\(?:u([0-9A-Fa-f]{4})|U([0-9A-Fa-f]{8})|(.))')
+_ESCAPED_CHARS = {'t': '\t', 'b': '\b', 'n': '\n', 'r': '\r', 'f': '\f', '"': '"', "'": "'", '\\': '\\'}
+
+def _unescape_char(match):
+    code = match.group(1) or match.group(2)
+    if code:
+        return chr(int(code, 16))
+    return _ESCAPED_CHARS[match.group(3)]
+
+def _unescape(text):
+    if '\\' not in text:
+        return text
+    return _ESCAPE.sub(_unescape_char, text)
+
+def _nt_term(token, bnodes):
+    first = token[0]
+    if first == '<':
+        return URIRef(_unescape(token[1:-1]))
+    if first == '_':
+        label = token[2:]
+        node = bnodes.get(label)
+        if node is None:
+            node = bnodes[label] = BNode()
+        return node
+    end = token.rindex('"')
+    lexical = _unescape(token[1:end])
+    suffix = token[end + 1:]
+    if suffix.startswith('@'):
+        return Literal(lexical, lang=suffix[1:])
+    if suffix.startswith('^^'):
+        return Literal(lexical, datatype=URIRef(suffix[3:-1]))
+    return Literal(lexical)
+
+def ParseNTriplesLine(line, bnodes, number=None):
+    # -> (s, p, o), or None for blank and comment lines
+    match = _NT_LINE.match(line)
+    if match is None:
+        stripped = line.strip()
+        if not stripped or stripped.startswith('#'):
+            return None
+        raise ParserError(f"Invalid N-Triples line {number or ''}: {stripped[:200]}")
+    s, p, o = match.groups()
+    return _nt_term(s, bnodes), _nt_term(p, bnodes), _nt_term(o, bnodes)
+
+def ParseNTriples(directory, sink):
+    bnodes = {}
+    with open(directory, encoding='utf-8') as source:
+        for number, line in enumerate(source, 1):
+            triple = ParseNTriplesLine(line, bnodes, number)
+            if triple is not None:
+                sink.triple(*triple)
+
+def StatementSpans(directory):
+    # Yields (byte offset, bytes) for every statement of a Turtle or N-Triples file:
+    # runs of lines up to one that ends a statement (see TurtleLines). Blank and
+    # comment lines in front of a statement belong to it.
+    start = offset = 0
+    buffer = []
+    lines = TurtleLines()
+    with open(directory, 'rb') as source:
+        for line in source:
+            buffer.append(line)
+            offset += len(line)
+            if lines.ends_statement(line.decode('utf-8')):
+                yield start, b''.join(buffer)
+                start = offset
+                buffer = []
+    if b''.join(buffer).strip():
+        yield start, b''.join(buffer)
+
+class StatementParser:
+    # Parses statements one at a time (e.g. those from StatementSpans), keeping
+    # prefixes and blank node labels from one call to the next.
+    def __init__(self, fmt='turtle', publicID="https://example.org/"):
+        self.fmt = fmt
+        self.triples = []
+        self.bnodes = {}
+        if fmt == 'turtle':
+            self.parser = SinkParser(RDFSink(_ForwardingGraph(self)), baseURI=publicID, turtle=True)
+            self.parser.startDoc()
+
+    def triple(self, s, p, o):
+        self.triples.append((s, p, o))
+
+    def parse(self, text):
+        if isinstance(text, bytes):
+            text = text.decode('utf-8')
+        self.triples = []
+        if self.fmt == 'turtle':
+            self.parser.feed(text)
+        else:
+            for line in text.splitlines():
+                triple = ParseNTriplesLine(line, self.bnodes)
+                if triple is not None:
+                    self.triples.append(triple)
+        return self.triples
+
+def IsDirective(text):
+    words = text.split(None, 1)
+    return bool(words) and words[0].lower() in (b'@prefix', b'@base', b'prefix', b'base')
+
+def StatementRecords(directory, fmt='turtle'):
+    # Yields (byte offset, length, triples) for every subject record of a file: a statement
+    # plus the statements right after it about the same subject or about blank nodes it
+    # refers to (in N-Triples, a snippet's lines and then its template's lines).
+    # Prefix/base directives come out on their own with triples None.
+    parser = StatementParser(fmt)
+    # current record: [offset, length, triples, main subject, blank nodes it refers to]
+    record = None
+    for offset, text in StatementSpans(directory):
+        if IsDirective(text):
+            parser.parse(text)
+            yield offset, len(text), None
+            continue
+        triples = parser.parse(text)
+        if not triples:
+            continue
+        subjects = {s for s, p, o in triples if not isinstance(s, BNode)}
+        blank_subjects = {s for s, p, o in triples if isinstance(s, BNode)}
+        continues = record is not None and (
+            subjects == {record[3]} or (not subjects and blank_subjects <= record[4]))
+        if continues:
+            record[1] = offset + len(text) - record[0]
+            record[2].extend(triples)
+        else:
+            if record is not None:
+                yield record[0], record[1], record[2]
+            main = next(iter(subjects)) if subjects else None
+            record = [offset, len(text), list(triples), main, set()]
+        record[4].update(o for s, p, o in triples if isinstance(o, BNode))
+    if record is not None:
+        yield record[0], record[1], record[2]
+
+# Chunked reading for parallel parsing. The file is memory-mapped and cut at statement
+# ends (see TurtleLines), so every chunk can be parsed on its own by a worker after the
+# prefix/base directives that come before it. Files with long strings (""" or ''') stay
+# in one chunk: they are the only tokens that span lines, so without them every line
+# starts outside a string and can be checked without reading the file from its start.
+MIN_CHUNK_BYTES = 1 << 18
+_DIRECTIVE_LINE = re.compile(rb'(?im)^[ \t]*(?:@prefix|@base|prefix|base)\b[^\n]*\n?')
+
+def _statement_end(mapped, position):
+    # offset just after the first line that starts at or after `position` and ends a statement
+    size = len(mapped)
+    if position > 0 and mapped[position - 1:position] != b'\n':
+        position = mapped.find(b'\n', position)
+        position = size if position == -1 else position + 1
+    lines = TurtleLines()
+    while position < size:
+        end = mapped.find(b'\n', position)
+        end = size if end == -1 else end + 1
+        if lines.ends_statement(mapped[position:end].decode('utf-8')):
+            return end
+        position = end
+    return size
+
+def MappedChunks(directory, parts, fmt='turtle'):
+    # -> [(start, end, directives before start)] covering the whole file
+    with open(directory, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        size = len(mapped)
+        if size == 0:
+            return []
+        parts = max(1, min(parts, size // MIN_CHUNK_BYTES))
+        if fmt == 'turtle' and (mapped.find(b'"""') != -1 or mapped.find(b"'''") != -1):
+            parts = 1
+        directives = [] if fmt != 'turtle' else [(m.start(), m.group()) for m in _DIRECTIVE_LINE.finditer(mapped)]
+        chunks = []
+        start = 0
+        for n in range(1, parts + 1):
+            if start >= size:
+                break
+            if n == parts:
+                end = size
+            elif fmt == 'turtle':
+                end = _statement_end(mapped, max(start, size * n // parts))
+            else:
+                end = mapped.find(b'\n', max(start, size * n // parts))
+                end = size if end == -1 else end + 1
+            header = b''.join(text if text.endswith(b'\n') else text + b'\n' for offset, text in directives if offset < start)
+            chunks.append((start, end, header))
+            start = end
+        return chunks
+
+def ReadChunk(directory, start, end):
+    with open(directory, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        return mapped[start:end]
+
+class StableBNodes(dict):
+    # N-Triples blank node labels -> the same BNode in every process reading the file,
+    # so observations split over two chunks still come together.
+    def get(self, label, default=None):
+        return BNode('nt' + label)
+
+def ParseChunk(text, sink, fmt='turtle', publicID="https://example.org/"):
+    if isinstance(text, bytes):
+        text = text.decode('utf-8')
+    if fmt == 'turtle':
+        parser = SinkParser(RDFSink(_ForwardingGraph(sink)), baseURI=publicID, turtle=True)
+        parser.startDoc()
+        parser.feed(text)
+        parser.endDoc()
+        return
+    bnodes = StableBNodes()
+    for line in text.splitlines():
+        triple = ParseNTriplesLine(line, bnodes)
+        if triple is not None:
+            sink.triple(*triple)
+
+def ParseIncrementally(directory, sink, fmt=None, namespaces=None):
+    print("Started streaming input...")
+    if (fmt or GuessFormat(directory)) in ('nt', 'nquads'):
+        ParseNTriples(directory, sink)
+    else:
+        ParseTurtle(directory, sink, namespaces=namespaces)
+    print("Input streamed successfully.")
+
+class TurtleFormatter:
+    # Formats triples as Turtle subject blocks in the layout of rdflib's serializer. Every
+    # format() call becomes one or more subject blocks; blank nodes used exactly once as an
+    # object inside the call are inlined as [ ... ], and RDF lists whose cells are all
+    # inside the call as ( ... ).
+    def __init__(self, namespaces):
+        self.namespaces = namespaces
+        self.namespace_manager = Graph(bind_namespaces='none').namespace_manager
+        for prefix, namespace in namespaces.items():
+            self.namespace_manager.bind(prefix, namespace)
+
+    def header(self):
+        lines = [f"@prefix {prefix}: <{namespace}> .\n" for prefix, namespace in sorted(self.namespaces.items())]
+        return ''.join(lines) + "\n"
+
+    def label(self, term):
+        if term == RDF.nil:
+            return '()'
+        if isinstance(term, Literal):
+            return term._literal_n3(use_plain=True, qname_callback=self.namespace_manager.normalizeUri)
+        return term.n3(self.namespace_manager)
+
+    def items(self, node, by_subject, inline):
+        # the members of the list starting at node, or None when it is not a list that can
+        # be written as ( ... ): every cell has just rdf:first and rdf:rest, as rdflib checks
+        members = []
+        while node != RDF.nil:
+            predicates = by_subject.get(node) if node in inline else None
+            if not predicates or set(predicates) != {RDF.first, RDF.rest} or \
+                    len(predicates[RDF.first]) != 1 or len(predicates[RDF.rest]) != 1:
+                return None
+            members.append(predicates[RDF.first][0])
+            node = predicates[RDF.rest][0]
+        return members
+
+    def object(self, obj, by_subject, inline, lists, depth):
+        if obj in lists:
+            return '(' + ''.join(' ' + self.object(item, by_subject, inline, lists, depth + 1) for item in lists[obj]) + ' )'
+        if obj in inline:
+            return '[ ' + self.predicate_objects(obj, by_subject, inline, lists, depth + 1) + ' ]'
+        return self.label(obj)
+
+    def predicate_objects(self, subject, by_subject, inline, lists, depth=0):
+        # depth counts like rdflib's: predicates after the first are indented one step
+        # deeper than the block they belong to, further objects of a predicate two steps
+        predicates = by_subject[subject]
+        ordered = sorted(predicates, key=lambda p: (p != RDF.type, p != RDFS.label, p))
+        lines = []
+        for predicate in ordered:
+            objects = [self.object(obj, by_subject, inline, lists, depth + 1) for obj in sorted(predicates[predicate])]
+            verb = 'a' if predicate == RDF.type else self.label(predicate)
+            lines.append(verb + ' ' + (',\n' + '    ' * (depth + 2)).join(objects))
+        return (' ;\n' + '    ' * (depth + 1)).join(lines)
+
+    def format(self, triples, shared=(), unreferenced=()):
+        # shared: blank nodes that are referred to from outside these triples too;
+        # unreferenced: blank node subjects nothing refers to, written as [] like rdflib does
+        by_subject = defaultdict(lambda: defaultdict(list))
+        references = defaultdict(int)
+        for s, p, o in triples:
+            by_subject[s][p].append(o)
+            if isinstance(o, BNode):
+                references[o] += 1
+        inline = {node for node, count in references.items() if count == 1 and node in by_subject and node not in shared}
+        # the rest of a list cell is a list too, but is written by the list it belongs to
+        rests = {o for s, p, o in triples if p == RDF.rest and set(by_subject[s]) == {RDF.first, RDF.rest}}
+        lists = {}
+        cells = set()
+        for node in inline - rests:
+            members = self.items(node, by_subject, inline)
+            if members is not None:
+                lists[node] = members
+        for head in lists:
+            # the cells after the head are written by it, not as blocks or [ ... ] of their own
+            node = by_subject[head][RDF.rest][0]
+            while node != RDF.nil:
+                cells.add(node)
+                node = by_subject[node][RDF.rest][0]
+        blocks = []
+        for subject in by_subject:
+            if subject in inline or subject in cells:
+                continue
+            label = '[]' if subject in unreferenced else self.label(subject)
+            blocks.append(label + ' ' + self.predicate_objects(subject, by_subject, inline, lists) + ' .\n\n')
+        return ''.join(blocks)
+
+def _nt_label(term):
+    if isinstance(term, Literal):
+        quoted = '"%s"' % str(term).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"').replace('\r', '\\r')
+        if term.language:
+            return f"{quoted}@{term.language}"
+        if term.datatype:
+            return f"{quoted}^^<{term.datatype}>"
+        return quoted
+    return term.n3()
+
+class NTriplesFormatter:
+    # Same interface as TurtleFormatter; N-Triples needs no header and no grouping.
+    def header(self):
+        return ''
+
+    def format(self, triples):
+        return ''.join(f"{_nt_label(s)} {_nt_label(p)} {_nt_label(o)} .\n" for s, p, o in triples)
+
+def Formatter(fmt, namespaces):
+    if fmt == 'nt':
+        return NTriplesFormatter()
+    return TurtleFormatter(namespaces)
+
+class StreamWriter:
+    # Writes output incrementally: the header first, then every write() call
+    # is formatted and appended straight away.
+    def __init__(self, directory, formatter):
+        self.formatter = formatter
+        self.file = open(directory, 'w', encoding='utf-8')
+        self.file.write(self.formatter.header())
+
+    def write(self, triples):
+        self.file.write(self.formatter.format(triples))
+
+    # lets a StreamWriter be used directly as a parser sink
+    def triple(self, s, p, o):
+        self.file.write(self.formatter.format([(s, p, o)]))
+
+    def write_fragment(self, text):
+        # text that was already formatted, e.g. by a formatter in a worker process
+        self.file.write(text)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def TurtleWriter(directory, namespaces):
+    return StreamWriter(directory, TurtleFormatter(namespaces))
+
+def OpenWriter(directory, fmt, namespaces):
+    print(f'Started writing {fmt} output to disk')
+    return StreamWriter(directory, Formatter(fmt, namespaces))
+
+class GraphWriter:
+    # Writer that collects into an rdflib Graph, for the paths that serialize with rdflib at the end.
+    def __init__(self, graph):
+        self.graph = graph
+
+    def triple(self, s, p, o):
+        self.graph.add((s, p, o))
+
+    def write(self, triples):
+        for triple in triples:
+            self.graph.add(triple)
@@ -1,121 +1,371 @@
 from rdflib import Graph,URIRef,Namespace,BNode,Literal
 from rdflib.namespace import XSD,RDF
-import pandas as pd
 import argparse
-from collections import defaultdict
+from collections import defaultdict,deque
 from datetime import datetime
 import json
+import multiprocessing
+import re
+from functools import lru_cache
+from RDF_stream import IN_FORMATS,OUT_FORMATS,GuessFormat,ParseNTriples,StatementRecords,Formatter,OpenWriter,GraphWriter
+import TSS_metrics
+import TSS_codec
+import TSS_cache
 
-def LoadGraph(directory):
+def LoadGraph(directory, fmt="turtle"):
     graph = Graph()
     print("Started loading graph...")
-    graph.parse(directory, format="turtle",publicID="https://example.org/")
+    with TSS_metrics.current.stage('parse'):
+        if fmt in ("nt", "nquads"):
+            ParseNTriples(directory, GraphWriter(graph))
+        else:
+            graph.parse(directory, format="turtle",publicID="https://example.org/")
     print("Graph loaded successfully.")
     return graph
 
-def CreateRDF(graph):
-    # Nested dict: subject -> predicate -> list of objects
-    #results = defaultdict(lambda: defaultdict(list))
-
-    #Create RDF
-    prefix_tss = Namespace('https://w3id.org/tss#')
-    prefix_ex  = Namespace('http://example.org/')
-    prefix_sosa  = Namespace('http://www.w3.org/ns/sosa/')
-    prefix_xsd  = Namespace('http://www.w3.org/2001/XMLSchema#')
-    final_graph = Graph()
-    final_graph.bind('tss', prefix_tss)
-    final_graph.bind('ex', prefix_ex)
-    final_graph.bind('sosa', prefix_sosa)
-    final_graph.bind('xsd', prefix_xsd)
-    print('Started creating final graph')
+RDF_TYPE = URIRef("http://www.w3.org/1999/02/22-rdf-syntax-ns#type")
+SOSA_OBSERVATION = URIRef("http://www.w3.org/ns/sosa/Observation")
+SOSA_RESULT_TIME = URIRef("http://www.w3.org/ns/sosa/resultTime")
+SOSA_HAS_SIMPLE_RESULT = URIRef("http://www.w3.org/ns/sosa/hasSimpleResult")
+
+# Superset of the strings float() accepts (digits, sign, point, exponent, '_', surrounding
+# whitespace, inf/nan); a string that does not match is not a number, without trying float().
+_MAYBE_NUMBER = re.compile(r'\s*[-+]?(?:[\d_]*\.?[\d_]*(?:[eE][-+]?[\d_]+)?|inf(?:inity)?|nan)\s*', re.IGNORECASE)
+# Typed literals by (datatype or None for a guessed type, lexical). Readings repeat within
+# and across snippets, and so do timestamps across the sensors of a file, so most
+# literals are built once. Cleared when it gets this big.
+LITERAL_CACHE_SIZE = 1 << 16
+_literals = {}
+# --stream: warn when this many snippets wait for a shared template that comes later
+WAITING_WARNING = 10000
+
+def GuessLiteral(value):
+    # the typing CreateRDF has always done: boolean, else decimal, else string.
+    # value is a string, or a JSON number/boolean in hand-written snippets.
+    if isinstance(value, bool):
+        return Literal(json.dumps(value), datatype=XSD.boolean)
+    if str(value) in ("true", "false"):
+        return Literal(value.lower(), datatype=XSD.boolean)
+    if _MAYBE_NUMBER.fullmatch(str(value)):
+        try:
+            return Literal(float(value), datatype=XSD.decimal)  # Attempt to convert to a number
+        except ValueError:
+            pass
+    return Literal(value, datatype=XSD.string) # If it's not a number, store it as a string
+
+@lru_cache(maxsize=64)
+def ContextDatatypes(context):
+    # (time datatype, value datatype) declared by a tss:context JSON-LD context, e.g.
+    # {"@context": {"value": {"@id": "...hasSimpleResult", "@type": "...#integer"}}};
+    # None where it declares nothing
+    try:
+        parsed = json.loads(context)
+    except ValueError:
+        return None, None
+    terms = parsed.get('@context', parsed) if isinstance(parsed, dict) else {}
+    if not isinstance(terms, dict):
+        return None, None
+
+    def datatype(name):
+        entry = terms.get(name)
+        if not isinstance(entry, dict) or not isinstance(entry.get('@type'), str) or entry['@type'].startswith('@'):
+            return None
+        prefix, colon, local = entry['@type'].partition(':')
+        if colon and isinstance(terms.get(prefix), str) and not local.startswith('//'):
+            return URIRef(terms[prefix] + local)  # compact IRI such as xsd:integer
+        return URIRef(entry['@type'])
+
+    return datatype('time'), datatype('value')
+
+def TypedLiterals(values, datatype=None):
+    # Types a whole snippet's times or values at once. Each distinct lexical form is
+    # classified and built once (see _literals); the points share the Literal objects.
+    # Without a datatype the type is guessed as GuessLiteral does.
+    if len(_literals) > LITERAL_CACHE_SIZE:
+        _literals.clear()
+    literals = []
+    for value in values:
+        if type(value) is not str:
+            # a JSON number or boolean (hand-written snippets): not cached, since True == 1
+            literals.append(GuessLiteral(value) if datatype is None else Literal(json.dumps(value), datatype=datatype))
+            continue
+        literal = _literals.get((datatype, value))
+        if literal is None:
+            literal = _literals[(datatype, value)] = GuessLiteral(value) if datatype is None else Literal(value, datatype=datatype)
+        literals.append(literal)
+    return literals
+
+def ExpandPoints(points_json, context=None):
+    # Turns one tss:points literal (JSON array, or packed when typed tss:PackedPoints)
+    # into observation triples. Returns the triples and the point ids in array order.
+    # The snippet's tss:context, when given, decides the datatypes of times and values.
+    time_datatype, value_datatype = ContextDatatypes(str(context)) if context is not None else (None, None)
+    point_ids = []
+    times = []
+    values = []
+    for point in TSS_codec.DecodeLiteral(points_json): #json array
+        point_ids.append(URIRef(point['id']))
+        times.append(point['time'])
+        values.append(point['value'])
+    #now convert them from strings, a whole snippet at a time
+    times = TypedLiterals(times, time_datatype or XSD.dateTime)
+    values = TypedLiterals(values, value_datatype)
 
-    snippet_id_dic = {} #this dictionary is designed to bind snippet subject to point id from array. 
+    triples = []
+    for json_id, json_time, json_value in zip(point_ids, times, values):
+        triples.append((json_id, RDF_TYPE, SOSA_OBSERVATION))
+        triples.append((json_id, SOSA_RESULT_TIME, json_time))
+        triples.append((json_id, SOSA_HAS_SIMPLE_RESULT, json_value))
+    return triples, point_ids
 
-    get_snippet_query = '''
-    PREFIX sosa: <http://www.w3.org/ns/sosa/>
-    PREFIX tss:  <https://w3id.org/tss#>
-    PREFIX rdf:  <http://www.w3.org/1999/02/22-rdf-syntax-ns#>
-    PREFIX xsd:  <http://www.w3.org/2001/XMLSchema#>
+prefix_tss = Namespace('https://w3id.org/tss#')
+prefix_ex  = Namespace('http://example.org/')
+prefix_sosa  = Namespace('http://www.w3.org/ns/sosa/')
+prefix_xsd  = Namespace('http://www.w3.org/2001/XMLSchema#')
+output_namespaces = {'tss': prefix_tss, 'ex': prefix_ex, 'sosa': prefix_sosa, 'xsd': prefix_xsd}
 
-    SELECT ?snippet ?P ?O ?about ?aboutP ?aboutO
-    WHERE {
-    ?snippet a tss:Snippet .
-    ?snippet ?P ?O .
+def ExpandSnippet(points_literals, template, context=None):
+    # All observation triples of one snippet: its points, then the template's
+    # (predicate, object) pairs copied onto every point. Returns them with the point count.
+    triples = []
+    point_ids = []
+    for points_json in points_literals:
+        expanded, ids = ExpandPoints(points_json, context)
+        triples.extend(expanded)
+        point_ids.extend(ids)
+    for aboutP, aboutO in template:
+        triples.extend((json_id, aboutP, aboutO) for json_id in point_ids)
+    return triples, len(point_ids)
 
-    OPTIONAL {
-        ?snippet tss:about ?about .
-        ?about ?aboutP ?aboutO .
-    }
-    }
+def SnippetSensor(graph, snippet):
+    # sensor id the snippet is counted under in the metrics
+    sensor = graph.value(graph.value(snippet, URIRef("https://w3id.org/tss#about")), prefix_sosa.madeBySensor)
+    return str(sensor).rstrip('/').split('/')[-1].split('#')[-1] if sensor is not None else ''
+
+def CreateRDF(graph, writer=None):
+    # Without a writer the observations are collected in a new graph and returned;
+    # with one they are written out snippet by snippet.
+    final_graph = None
+    if writer is None:
+        final_graph = Graph()
+        for prefix, namespace in output_namespaces.items():
+            final_graph.bind(prefix, namespace)
+        writer = GraphWriter(final_graph)
+    print('Started creating final graph')
 
-            '''
     tss_points = URIRef("https://w3id.org/tss#points")
+    tss_about = URIRef("https://w3id.org/tss#about")
     tss_Snippet = URIRef("https://w3id.org/tss#Snippet")
     tss_PointTemplate = URIRef("https://w3id.org/tss#PointTemplate")
+    tss_context = URIRef("https://w3id.org/tss#context")
+    tss_pointType = URIRef("https://w3id.org/tss#pointType")
+    tss_AggregatePoint = URIRef("https://w3id.org/tss#AggregatePoint")
+
+    # Each tss:points literal is parsed exactly once, and the template triples are then
+    # copied onto that snippet's points only, so the expansion is linear in the number of points.
+    with TSS_metrics.current.stage('expand'):
+        for subj in graph.subjects(RDF.type, tss_Snippet):
+            if graph.value(subj, tss_pointType) == tss_AggregatePoint:
+                continue  # a downsampled companion, not observations
+            points_literals = list(graph.objects(subj, tss_points))
+            template = [(aboutP, aboutO) for about in graph.objects(subj, tss_about)
+                        for aboutP, aboutO in graph.predicate_objects(about) if aboutO != tss_PointTemplate]
+            triples, count = ExpandSnippet(points_literals, template, graph.value(subj, tss_context))
+            writer.write(triples)
+            TSS_metrics.current.snippet(SnippetSensor(graph, subj), count, sum(map(len, points_literals)))
+
+    print('Final graph created successfully')
+    return final_graph
+
+def SnippetTasks(directory, fmt="turtle"):
+    # Reads a TSS file one snippet record at a time (see RDF_stream.StatementRecords) and
+    # yields (sensor id, tss:points literals, template pairs, tss:context) per snippet,
+    # without a Graph.
+    # Templates shared by several snippets (--shared-templates) are records of their own;
+    # they are remembered, and a snippet read before its template waits for it.
+    tss_Snippet = prefix_tss.Snippet
+    shared = {}                  # shared template -> its pairs
+    waiting = defaultdict(list)  # shared template not read yet -> [(points literals, about nodes)]
+    held = 0                     # snippets in waiting
+    warned = False
+
+    def task(points_literals, abouts, by_subject, context):
+        template = []
+        sensor = ''
+        for about in abouts:
+            for aboutP, aboutO in by_subject.get(about) or shared.get(about, ()):
+                if aboutO == prefix_tss.PointTemplate:
+                    continue
+                if aboutP == prefix_sosa.madeBySensor:
+                    sensor = str(aboutO).rstrip('/').split('/')[-1].split('#')[-1]
+                template.append((aboutP, aboutO))
+        return sensor, points_literals, template, context
 
+    def missing(abouts, by_subject):
+        return [about for about in abouts if isinstance(about, URIRef) and about not in by_subject and about not in shared]
 
-    for subj, pred, obj, about, aboutP, aboutO in graph.query(get_snippet_query):
-        # store snippet triples
-        if subj and pred and obj:
-            if pred == tss_points: #this is where i should focus on derefrencing the json object
-                #results[subj][pred].append(obj)
-                parsed = json.loads(str(obj)) #json array
-                for point in parsed:
-                    json_id = point['id']
-                    json_time = point['time']
-                    json_value = point['value']
-                    #now convert them from strings and add them to final graph
-                    json_time = Literal(json_time,datatype=XSD.dateTime)
-                    
-                    if str(json_value) in ["true", "false"]:
-                        json_value = Literal(json_value.lower(), datatype=XSD.boolean)
+    for offset, length, triples in StatementRecords(directory, fmt):
+        if not triples:
+            continue
+        by_subject = defaultdict(list)
+        for s, p, o in triples:
+            by_subject[s].append((p, o))
+        for subj, pairs in by_subject.items():
+            if isinstance(subj, URIRef) and (RDF.type, prefix_tss.PointTemplate) in pairs:
+                shared[subj] = pairs
+                for points_literals, abouts, context in waiting.pop(subj, ()):
+                    held -= 1
+                    still_missing = missing(abouts, {})
+                    if still_missing:
+                        waiting[still_missing[0]].append((points_literals, abouts, context))
+                        held += 1
                     else:
-                        try:
-                            json_value = Literal(float(json_value), datatype=XSD.decimal)  # Attempt to convert to a number
-                        except ValueError:
-                            json_value = Literal(json_value, datatype=XSD.string) # If it's not a number, store it as a string
-
-                    #json_value = Literal(json_value,datatype=XSD.decimal) #it is not always a decimal. sometimes it is a boolean value. it is replaced with the if else block above.
-                    json_id = URIRef(json_id)
-
-                    snippet_id_dic[json_id] = subj  #the dictionary is mapped in reverse because json_id is unique, subject is not.
-                    final_graph.add((json_id,URIRef("http://www.w3.org/1999/02/22-rdf-syntax-ns#type"),URIRef("http://www.w3.org/ns/sosa/Observation")))
-                    final_graph.add((json_id,URIRef("http://www.w3.org/ns/sosa/resultTime"),json_time))
-                    final_graph.add((json_id,URIRef("http://www.w3.org/ns/sosa/hasSimpleResult"),json_value))
-
-                #final_graph.add((subj, pred, obj)) #instead of adding the entire json object, will break it down and add each element as object.
-                
-            if obj == tss_Snippet:
+                        yield task(points_literals, abouts, {}, context)
+        for subj, pairs in by_subject.items():
+            if (RDF.type, tss_Snippet) not in pairs or (prefix_tss.pointType, prefix_tss.AggregatePoint) in pairs:
                 continue
+            points_literals = [o for p, o in pairs if p == prefix_tss.points]
+            abouts = [o for p, o in pairs if p == prefix_tss.about]
+            context = next((o for p, o in pairs if p == prefix_tss.context), None)
+            not_read = missing(abouts, by_subject)
+            if not_read:
+                waiting[not_read[0]].append((points_literals, abouts, context))
+                held += 1
+                if held >= WAITING_WARNING and not warned:
+                    warned = True
+                    print(f"Warning: {held} snippets are held in memory until their shared templates are read; "
+                          "this file writes its templates after the snippets that use them. Converting it again "
+                          "with RDF2TSS_per_day_V2.py writes each template first.")
+                continue
+            yield task(points_literals, abouts, by_subject, context)
+    # templates that never showed up: expand the points without them
+    for snippets in waiting.values():
+        for points_literals, abouts, context in snippets:
+            yield task(points_literals, abouts, {}, context)
 
-        # # store about triples
-        if about and aboutP and aboutO:
-            if aboutO != tss_PointTemplate:
-            #results[subj][aboutP].append(aboutO)
-            #final_graph.add((subj, aboutP, aboutO))
-                for key,value in snippet_id_dic.items():
-                    #remember key id of reading, value is subject snippet
-                    if subj==URIRef(value):
-                        final_graph.add((key, aboutP, aboutO))
+_expand_formatter = None
 
-    print('Final graph created successfully')
-    return final_graph
+def InitExpandWorker(out_format, json_codec=TSS_codec.DEFAULT_CODEC):
+    global _expand_formatter
+    TSS_metrics.Reset()
+    TSS_codec.SetCodec(json_codec)
+    _expand_formatter = Formatter(out_format, output_namespaces)
+
+def ExpandFragment(task):
+    # Runs in a --workers process: decodes and types one snippet's points and
+    # returns the observations already formatted.
+    sensor, points_literals, template, context = task
+    triples, count = ExpandSnippet(points_literals, template, context)
+    return _expand_formatter.format(triples), sensor, count, sum(map(len, points_literals))
 
-def SaveGraph(directory,final_graph):
+def BoundedImap(pool, function, tasks, window):
+    # Like Pool.imap (results in task order), which would read its whole input up front,
+    # but with at most `window` tasks in flight: a new task is submitted each time the
+    # oldest result is taken, so memory does not grow with the input and the workers
+    # keep going while a slow snippet is waited for.
+    pending = deque()
+    for task in tasks:
+        pending.append(pool.apply_async(function, (task,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+def StreamRDF(input_directory, output_directory, in_format="turtle", out_format="turtle", workers=1):
+    # Streaming expansion: snippets are read one record at a time, expanded (in `workers`
+    # processes when more than one) and written out in input order as they come back.
+    print(f"Expanding snippets in streaming mode with {workers} worker(s)...")
+    snippet_count = 0
+    with OpenWriter(output_directory, out_format, output_namespaces) as writer:
+        with TSS_metrics.current.stage('stream'):
+            tasks = SnippetTasks(input_directory, in_format)
+            if workers > 1:
+                pool = multiprocessing.Pool(workers, initializer=InitExpandWorker, initargs=(out_format, TSS_codec.codec_name))
+                results = BoundedImap(pool, ExpandFragment, tasks, workers * 16)
+            else:
+                pool = None
+                InitExpandWorker(out_format, TSS_codec.codec_name)
+                results = map(ExpandFragment, tasks)
+            try:
+                for fragment, sensor, count, json_bytes in results:
+                    writer.write_fragment(fragment)
+                    TSS_metrics.current.snippet(sensor, count, json_bytes)
+                    snippet_count += 1
+            finally:
+                if pool is not None:
+                    pool.close()
+                    pool.join()
+    print(f"Observations written: {snippet_count} snippets expanded.")
+
+def SaveGraph(directory,final_graph,fmt="turtle"):
     print('Started writing file to disk')
-    final_graph.serialize(destination=directory, format="turtle")
+    with TSS_metrics.current.stage('serialize'):
+        final_graph.serialize(destination=directory, format=fmt, encoding="utf-8")
     print('File written successfully')
 
-def main():
+def Convert(args, in_format):
+    if args.stream:
+        StreamRDF(args.input, args.output, in_format, args.out_format, args.workers)
+    elif args.out_format == 'nt':
+        Original_graph  = LoadGraph(args.input, in_format)
+        with OpenWriter(args.output, args.out_format, output_namespaces) as writer:
+            CreateRDF(Original_graph, writer)
+        print('File written successfully')
+    else:
+        Original_graph  = LoadGraph(args.input, in_format)
+        Final_graph = CreateRDF(Original_graph)
+        SaveGraph(args.output,Final_graph,args.out_format)
+
+def CachedConvert(args, in_format):
+    # --cache: a TSS file expanded before with the same options is copied from the cache
+    options = {name: value for name, value in vars(args).items()
+               if name not in ('input', 'output', 'cache', 'cache_size', 'metrics', 'profile')}
+    with TSS_cache.ResultCache(args.cache, args.cache_size << 20) as cache:
+        key = cache.file_key('tss2rdf', [args.input], options)
+        if cache.fetch(key, args.output):
+            print(f"Output copied from the cache in {args.cache}")
+            return
+        Convert(args, in_format)
+        cache.store(key, args.output)
+
+def BuildParser():
     parser = argparse.ArgumentParser(description='Process sensor graph files.')
     parser.add_argument('-i', '--input', required=True, help='Input Turtle file path')
     parser.add_argument('-o', '--output', required=True, help='Output Turtle file path')
-    args = parser.parse_args()
+    parser.add_argument('--in-format', choices=IN_FORMATS, help='Input format (default: from the file extension, .nt/.nq or Turtle)')
+    parser.add_argument('--out-format', choices=OUT_FORMATS, default='turtle', help='Output format; nt is written line by line while snippets are expanded')
+    parser.add_argument('--stream', action='store_true', help='Expand snippets while reading the input instead of loading it into a graph first')
+    parser.add_argument('--workers', type=int, default=1, help='With --stream: decode and expand snippets in this many processes')
+    TSS_metrics.AddArguments(parser)
+    TSS_codec.AddArguments(parser)
+    TSS_cache.AddArguments(parser)
+    return parser
+
+def CheckArgs(parser, args):
+    if args.workers < 1:
+        parser.error(f'--workers needs a positive number, not {args.workers}')
+    if args.workers > 1 and not args.stream:
+        parser.error('--workers needs --stream')
+
+def Run(args):
+    # one conversion for already parsed and checked options (also used by TSS_batch.py)
+    in_format = args.in_format or GuessFormat(args.input)
+    TSS_codec.SetCodec(args.json_codec)
 
     print("Program started!")
-    Original_graph  = LoadGraph(args.input)
-    Final_graph = CreateRDF(Original_graph)
-    SaveGraph(args.output,Final_graph)
+    instrumented = TSS_metrics.EnableFromArgs(args)
+    if args.cache:
+        CachedConvert(args, in_format)
+    else:
+        Convert(args, in_format)
+    if instrumented:
+        TSS_metrics.Finish()
+
+def main():
+    parser = BuildParser()
+    args = parser.parse_args()
+    CheckArgs(parser, args)
+    Run(args)
 
 if __name__ == "__main__":
     main()    
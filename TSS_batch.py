@@ -0,0 +1,238 @@
+import argparse
+import asyncio
+import contextlib
+import hashlib
+import importlib
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from fnmatch import fnmatch
+from TSS_cache import FileHash
+
+# Batch conversion of many input files by one long-running process.
+#
+#   python TSS_batch.py -i dumps/ -o tss/ --jobs 4 -- --window day --out-format nt
+#   find dumps -name '*.nt' | python TSS_batch.py -i - -o tss/
+#   python TSS_batch.py -i dumps/ -o tss/ --watch 60
+#
+# Inputs (files, directories or '-' for paths on stdin) go through an asyncio queue to
+# --jobs warm worker processes that import the converter once and then call its Run()
+# per file, so a file costs no interpreter start or imports. Everything after '--' is
+# passed to the converter as its options. A manifest in the output directory records
+# the SHA-256 of every converted input together with the options; an input whose
+# content and options are unchanged (and whose output is still there) is skipped.
+# Inputs whose size and mtime did not change since then are skipped without hashing.
+
+DIRECTIONS = {'rdf2tss': ('RDF2TSS_per_day_V2', '_tss'), 'tss2rdf': ('TSS2RDF', '_rdf')}
+MANIFEST = '.tss_batch.json'
+DEFAULT_PATTERNS = ['*.ttl', '*.nt', '*.nq']
+
+_converter = None
+
+def InitBatchWorker(direction):
+    global _converter
+    _converter = importlib.import_module(DIRECTIONS[direction][0])
+
+def ConvertFile(task):
+    # Runs in a warm worker process. Returns (seconds, converter output); the converter's
+    # progress messages are captured instead of interleaving on the console.
+    input_directory, output_directory, options = task
+    import TSS_metrics
+    TSS_metrics.Reset()
+    parser = _converter.BuildParser()
+    args = parser.parse_args(['-i', input_directory, '-o', output_directory] + options)
+    _converter.CheckArgs(parser, args)
+    log = io.StringIO()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(log):
+        _converter.Run(args)
+    return time.perf_counter() - start, log.getvalue()
+
+def OutputPath(input_directory, output_dir, direction, out_format):
+    stem = os.path.splitext(os.path.basename(input_directory))[0]
+    return os.path.join(output_dir, stem + DIRECTIONS[direction][1] + ('.nt' if out_format == 'nt' else '.ttl'))
+
+class Manifest:
+    def __init__(self, output_dir):
+        self.directory = os.path.join(output_dir, MANIFEST)
+        self.entries = {}
+        if os.path.exists(self.directory):
+            with open(self.directory, encoding='utf-8') as f:
+                self.entries = json.load(f)
+
+    def untouched(self, input_directory, options_key, output_directory):
+        # same size and mtime as when it was converted with these options: no need to hash
+        entry = self.entries.get(os.path.abspath(input_directory))
+        stat = os.stat(input_directory)
+        return (entry is not None and entry['key'].endswith(':' + options_key) and os.path.exists(output_directory)
+                and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns)
+
+    def writer(self, output_directory):
+        # the input last converted to output_directory, or None
+        for input_directory, entry in self.entries.items():
+            if entry['output'] == output_directory:
+                return input_directory
+        return None
+
+    def unchanged(self, input_directory, key, output_directory):
+        entry = self.entries.get(os.path.abspath(input_directory))
+        return entry is not None and entry['key'] == key and os.path.exists(output_directory)
+
+    def record(self, input_directory, key, output_directory, seconds):
+        stat = os.stat(input_directory)
+        self.entries[os.path.abspath(input_directory)] = {'key': key, 'output': output_directory, 'seconds': round(seconds, 3),
+                                                          'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+        temporary = self.directory + '.tmp'
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, indent=1)
+        os.replace(temporary, self.directory)
+
+def ListInputs(paths, patterns, output_dir):
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                full = os.path.join(path, name)
+                if not os.path.isfile(full) or not any(fnmatch(name, p) for p in patterns):
+                    continue
+                # outputs written next to the inputs are not inputs
+                if os.path.abspath(path) == os.path.abspath(output_dir) and \
+                        any(os.path.splitext(name)[0].endswith(suffix) for module, suffix in DIRECTIONS.values()):
+                    continue
+                found.append(full)
+        elif path != '-':
+            found.append(path)
+    return found
+
+class BatchRunner:
+    def __init__(self, args, options, out_format):
+        self.args = args
+        self.options = options
+        self.out_format = out_format
+        self.manifest = Manifest(args.output)
+        self.options_key = hashlib.sha256(json.dumps([args.direction] + options).encode('utf-8')).hexdigest()
+        self.counts = {'converted': 0, 'skipped': 0, 'failed': 0}
+        self.queued = set()
+        self.targets = {}  # output path -> the input it is written from
+
+    def target(self, input_directory):
+        # The output path of an input. Inputs with the same stem (a.ttl and a.nt, or the
+        # same name in two directories) would overwrite each other's output, so only the
+        # first one seen (in this run or an earlier one, when it still exists) gets it.
+        output_directory = OutputPath(input_directory, self.args.output, self.args.direction, self.out_format)
+        source = os.path.abspath(input_directory)
+        owner = self.targets.get(output_directory)
+        if owner is None:
+            owner = self.manifest.writer(output_directory)
+            if owner is None or not os.path.exists(owner):
+                owner = source
+            self.targets[output_directory] = owner
+        if owner != source:
+            raise ValueError(f"its output {output_directory} is already written from {owner}; rename one of them")
+        return output_directory
+
+    async def worker(self, queue, pool):
+        loop = asyncio.get_running_loop()
+        while True:
+            input_directory = await queue.get()
+            try:
+                await self.convert(loop, pool, input_directory)
+            finally:
+                self.queued.discard(input_directory)
+                queue.task_done()
+
+    async def convert(self, loop, pool, input_directory):
+        try:
+            output_directory = self.target(input_directory)
+            if self.manifest.untouched(input_directory, self.options_key, output_directory):
+                self.counts['skipped'] += 1
+                return
+            # hashing is I/O bound, so it runs on a thread and not in a converter process
+            content_hash = await loop.run_in_executor(None, FileHash, input_directory)
+            key = content_hash + ':' + self.options_key
+            if self.manifest.unchanged(input_directory, key, output_directory):
+                # touched but the same content: remember the new mtime
+                self.manifest.record(input_directory, key, output_directory, 0)
+                self.counts['skipped'] += 1
+                print(f"unchanged  {input_directory}")
+                return
+            seconds, log = await loop.run_in_executor(pool, ConvertFile, (input_directory, output_directory, self.options))
+        except BaseException as error:
+            if isinstance(error, asyncio.CancelledError):
+                raise
+            self.counts['failed'] += 1
+            print(f"failed     {input_directory}: {error!r}")
+            return
+        self.manifest.record(input_directory, key, output_directory, seconds)
+        self.counts['converted'] += 1
+        print(f"converted  {input_directory} -> {output_directory} ({seconds:.2f}s)")
+
+    async def enqueue(self, queue, input_directory):
+        if input_directory in self.queued:
+            return
+        self.queued.add(input_directory)
+        await queue.put(input_directory)
+
+    async def produce(self, queue):
+        loop = asyncio.get_running_loop()
+        for input_directory in ListInputs(self.args.input, self.args.pattern, self.args.output):
+            await self.enqueue(queue, input_directory)
+        if '-' in self.args.input:
+            # a queue of paths on stdin, one per line, until EOF
+            while True:
+                line = await loop.run_in_executor(None, sys.stdin.readline)
+                if not line:
+                    break
+                if line.strip():
+                    await self.enqueue(queue, line.strip())
+        while self.args.watch:
+            # new and changed files are found on the next scan; unchanged ones are
+            # skipped by their hash, so rescanning everything is cheap
+            await queue.join()
+            await asyncio.sleep(self.args.watch)
+            for input_directory in ListInputs(self.args.input, self.args.pattern, self.args.output):
+                await self.enqueue(queue, input_directory)
+
+    async def run(self):
+        # the queue is bounded, so a long stdin queue or a large directory is not read ahead
+        queue = asyncio.Queue(maxsize=self.args.jobs * 2)
+        with ProcessPoolExecutor(self.args.jobs, initializer=InitBatchWorker, initargs=(self.args.direction,)) as pool:
+            workers = [asyncio.create_task(self.worker(queue, pool)) for _ in range(self.args.jobs)]
+            await self.produce(queue)
+            await queue.join()
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        return self.counts
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert many files with warm worker processes, skipping unchanged inputs.',
+                                     epilog='Options after -- are passed to the converter, e.g. -- --window week --out-format nt')
+    parser.add_argument('-i', '--input', nargs='+', required=True, help="Input files and/or directories; '-' reads paths from stdin")
+    parser.add_argument('-o', '--output', required=True, help='Output directory (holds the manifest of converted inputs)')
+    parser.add_argument('--direction', choices=sorted(DIRECTIONS), default='rdf2tss', help='rdf2tss: RDF2TSS_per_day_V2.py (default); tss2rdf: TSS2RDF.py')
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1, help='Worker processes (default: CPU count)')
+    parser.add_argument('--pattern', nargs='+', default=DEFAULT_PATTERNS, help='File name patterns picked up from input directories (default: *.ttl *.nt *.nq)')
+    parser.add_argument('--watch', type=float, metavar='SECONDS', help='Keep running and rescan the inputs every SECONDS')
+    argv = sys.argv[1:]
+    options = argv[argv.index('--') + 1:] if '--' in argv else []
+    args = parser.parse_args(argv[:argv.index('--')] if '--' in argv else argv)
+
+    # check the converter options once, before any worker starts
+    converter = importlib.import_module(DIRECTIONS[args.direction][0])
+    converter_parser = converter.BuildParser()
+    converter_args = converter_parser.parse_args(['-i', 'input', '-o', 'output'] + options)
+    converter.CheckArgs(converter_parser, converter_args)
+
+    os.makedirs(args.output, exist_ok=True)
+    start = time.perf_counter()
+    counts = asyncio.run(BatchRunner(args, options, converter_args.out_format).run())
+    print(f"{counts['converted']} converted, {counts['skipped']} unchanged, {counts['failed']} failed in {time.perf_counter() - start:.1f}s")
+    if counts['failed']:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
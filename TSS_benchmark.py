@@ -0,0 +1,239 @@
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime,timedelta,timezone
+from TSS_metrics import PeakRSS
+
+# Benchmark harness for both conversion directions.
+#
+#   python TSS_benchmark.py generate -o synthetic.nt --sensors 10 --days 7 --points-per-day 1440
+#   python TSS_benchmark.py run --sensors 10 --days 7 --points-per-day 1440 --results bench.json
+#   python TSS_benchmark.py startup --budget 1.0
+#
+# 'generate' writes a synthetic SOSA observation file shaped like archived/rdf_data.ttl.
+# 'run' generates one, then runs every case in a fresh process (so peak RSS is per case)
+# through the converter's own command line, and reports the stages its --metrics records.
+# 'startup' times `--help` of every entry point in fresh interpreters and checks that no
+# module pulls in imports it does not need; it exits non-zero when either regresses.
+
+CASES = ['rdf2tss-indexed', 'rdf2tss-sparql', 'rdf2tss-stream', 'tss2rdf']
+
+SOSA = 'http://www.w3.org/ns/sosa/'
+XSD = 'http://www.w3.org/2001/XMLSchema#'
+RDF_TYPE = 'http://www.w3.org/1999/02/22-rdf-syntax-ns#type'
+
+# result kinds handed out round robin over the sensors: numeric, boolean, string
+RESULT_KINDS = [('River Stage', 'double'), ('Gate Open', 'boolean'), ('Status', 'string')]
+STATUSES = ['normal', 'alert', 'maintenance']
+
+def GenerateSOSA(directory, sensors=5, days=7, points_per_day=1440, seed=0, start=datetime(2025, 8, 12, tzinfo=timezone.utc)):
+    # N-Triples (also valid Turtle), ordered by sensor then time like the exported data
+    rng = random.Random(seed)
+    step = timedelta(seconds=86400 / points_per_day)
+    count = 0
+    with open(directory, 'w', encoding='utf-8') as f:
+        for n in range(sensors):
+            sensor_id = str(24002000 + n)
+            observed_property, kind = RESULT_KINDS[n % len(RESULT_KINDS)]
+            level = rng.uniform(10, 50)
+            t = start
+            for i in range(days * points_per_day):
+                if kind == 'double':
+                    level += rng.gauss(0, 0.05)
+                    value = f'"{round(level, 2)}"^^<{XSD}double>'
+                elif kind == 'boolean':
+                    value = f'"{"true" if rng.random() < 0.5 else "false"}"^^<{XSD}boolean>'
+                else:
+                    value = f'"{rng.choice(STATUSES)}"'
+                time_lexical = t.isoformat()
+                observation = f'<http://example.com/reading_{sensor_id}_{time_lexical.replace(":", "%3A").replace("+", "%2B")}>'
+                f.write(f'{observation} <{RDF_TYPE}> <{SOSA}Observation> .\n')
+                f.write(f'{observation} <{SOSA}hasSimpleResult> {value} .\n')
+                f.write(f'{observation} <{SOSA}madeBySensor> "{sensor_id}" .\n')
+                f.write(f'{observation} <{SOSA}observedProperty> "{observed_property}" .\n')
+                f.write(f'{observation} <{SOSA}resultTime> "{time_lexical}"^^<{XSD}dateTime> .\n')
+                t += step
+                count += 1
+    return count
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+STARTUP_SCRIPTS = ['TSS_cli.py', 'RDF2TSS_per_day_V2.py', 'TSS2RDF.py', 'RDF_prettify.py', 'TSS_index.py', 'TSS_batch.py']
+# modules that must not be loaded just by importing a module; the converters only
+# need sqlite3 for --store and asyncio for batch mode, and nothing needs pandas or numpy
+UNWANTED_IMPORTS = {
+    'TSS_cli': ['rdflib', 'pandas', 'numpy'],
+    'RDF2TSS_per_day_V2': ['pandas', 'numpy', 'sqlite3', 'asyncio'],
+    'TSS2RDF': ['pandas', 'numpy', 'sqlite3', 'asyncio'],
+    'RDF_prettify': ['pandas', 'numpy', 'sqlite3', 'asyncio'],
+    'TSS_index': ['pandas', 'numpy', 'sqlite3', 'asyncio'],
+}
+
+def StartupTimes(repeat=5):
+    # wall time of `python SCRIPT --help` in a fresh interpreter, per script
+    times = {}
+    for script in ['-c pass'] + STARTUP_SCRIPTS:
+        command = [sys.executable, '-c', 'pass'] if script == '-c pass' else [sys.executable, os.path.join(HERE, script), '--help']
+        runs = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            subprocess.run(command, cwd=HERE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+            runs.append(time.perf_counter() - start)
+        times[script] = {'min': min(runs), 'median': statistics.median(runs)}
+    return times
+
+def UnwantedImports():
+    # module -> unwanted modules it loaded
+    found = {}
+    for module, unwanted in UNWANTED_IMPORTS.items():
+        code = f"import sys, json, {module}; print(json.dumps([m for m in {unwanted!r} if m in sys.modules]))"
+        result = subprocess.run([sys.executable, '-c', code], cwd=HERE, capture_output=True, text=True, check=True)
+        found[module] = json.loads(result.stdout.strip().splitlines()[-1])
+    return found
+
+def StartupCheck(args):
+    times = StartupTimes(args.repeat)
+    imports = UnwantedImports()
+    failures = []
+    for script, entry in times.items():
+        over = script != '-c pass' and entry['min'] > args.budget
+        print(f"{script:24} min {entry['min']:.3f}s  median {entry['median']:.3f}s{'  OVER BUDGET' if over else ''}")
+        if over:
+            failures.append(f"{script} takes {entry['min']:.3f}s to start (budget {args.budget}s)")
+    for module, loaded in imports.items():
+        if loaded:
+            print(f"{module} imports {', '.join(loaded)}")
+            failures.append(f"{module} imports {', '.join(loaded)}")
+    results = {'timestamp': datetime.now(timezone.utc).isoformat(), 'python': platform.python_version(),
+               'budget_seconds': args.budget, 'startup': times, 'unwanted_imports': imports, 'failures': failures}
+    with open(args.results, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.results}")
+    return failures
+
+# converter options of every case, after -i/-o
+CASE_OPTIONS = {
+    'rdf2tss-indexed': [],
+    'rdf2tss-sparql': ['--engine', 'sparql'],
+    'rdf2tss-stream': ['--stream'],
+    'tss2rdf': [],
+}
+
+def RunCase(task):
+    # Runs in its own process: one command-line run of the converter, through the same
+    # parser, checks and Run() as the script. Its stages are read back from --metrics;
+    # the converters' progress prints are swallowed.
+    case, input_directory, tss_directory, output_directory = task
+    if case == 'tss2rdf':
+        import TSS2RDF as converter
+        input_directory = tss_directory
+    else:
+        import RDF2TSS_per_day_V2 as converter
+    metrics = output_directory + '.metrics.jsonl'
+    parser = converter.BuildParser()
+    args = parser.parse_args(['-i', input_directory, '-o', output_directory, '--metrics', metrics] + CASE_OPTIONS[case])
+    converter.CheckArgs(parser, args)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        converter.Run(args)
+    wall_seconds = time.perf_counter() - start
+    with open(metrics, encoding='utf-8') as f:
+        events = [json.loads(line) for line in f]
+    os.remove(metrics)
+    stages = [{'stage': e['stage'], 'seconds': e['seconds'], 'peak_rss_kb': e['peak_rss_kb']} for e in events if e['event'] == 'stage_end']
+    return {'case': case, 'wall_seconds': wall_seconds, 'peak_rss_kb': PeakRSS(), 'stages': stages}
+
+def RunIsolated(task):
+    # a fresh interpreter per run, so peak RSS is not carried over from an earlier case
+    with multiprocessing.get_context('spawn').Pool(1) as pool:
+        return pool.apply(RunCase, (task,))
+
+def RunBenchmark(args, directory):
+    input_directory = os.path.join(directory, 'synthetic.nt')
+    tss_directory = os.path.join(directory, 'synthetic_tss.ttl')
+    print(f"Generating {args.sensors} sensors x {args.days} days x {args.points_per_day} points/day...")
+    points = GenerateSOSA(input_directory, args.sensors, args.days, args.points_per_day, args.seed)
+
+    # tss2rdf reads the output of the default converter
+    cases = list(args.cases)
+    if 'tss2rdf' in cases and 'rdf2tss-indexed' in cases:
+        cases.remove('rdf2tss-indexed')
+        cases.insert(0, 'rdf2tss-indexed')
+    elif 'tss2rdf' in cases:
+        RunIsolated(('rdf2tss-indexed', input_directory, None, tss_directory))
+
+    runs = []
+    for case in cases:
+        for repeat in range(args.repeat):
+            output_directory = tss_directory if case == 'rdf2tss-indexed' else os.path.join(directory, f'{case}.ttl')
+            result = RunIsolated((case, input_directory, tss_directory, output_directory))
+            result['repeat'] = repeat
+            runs.append(result)
+            stages = ', '.join(f"{s['stage']} {s['seconds']:.2f}s" for s in result['stages'])
+            peak = 'unknown' if result['peak_rss_kb'] is None else f"{result['peak_rss_kb'] / 1024:.0f} MB"
+            print(f"{case}: {result['wall_seconds']:.2f}s, peak RSS {peak} ({stages})")
+
+    import rdflib
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'rdflib': rdflib.__version__,
+        'platform': platform.platform(),
+        'data': {'sensors': args.sensors, 'days': args.days, 'points_per_day': args.points_per_day,
+                 'seed': args.seed, 'points': points, 'bytes': os.path.getsize(input_directory)},
+        'runs': runs,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic SOSA data and benchmark both converters.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    generate = commands.add_parser('generate', help='Only write a synthetic SOSA observation file')
+    generate.add_argument('-o', '--output', required=True, help='Output N-Triples file path')
+    run = commands.add_parser('run', help='Generate data and time every stage of the selected cases')
+    run.add_argument('--results', default='benchmark_results.json', help='JSON results file (default: benchmark_results.json)')
+    run.add_argument('--cases', nargs='+', choices=CASES, default=CASES, help='Cases to run (default: all)')
+    run.add_argument('--repeat', type=int, default=1, help='Runs per case, each in a fresh process')
+    run.add_argument('--keep', metavar='DIR', help='Keep the generated data and outputs in this directory')
+    startup = commands.add_parser('startup', help='Time --help of every entry point and check for unneeded imports')
+    startup.add_argument('--budget', type=float, default=1.0, help='Fail when a script needs more than this many seconds to start (default: 1.0)')
+    startup.add_argument('--repeat', type=int, default=5, help='Runs per script; the fastest counts')
+    startup.add_argument('--results', default='startup_results.json', help='JSON results file (default: startup_results.json)')
+    for command in (generate, run):
+        command.add_argument('--sensors', type=int, default=5, help='Number of sensors; result kinds alternate numeric, boolean, string')
+        command.add_argument('--days', type=int, default=7, help='Days of observations per sensor')
+        command.add_argument('--points-per-day', type=int, default=1440, help='Observations per sensor per day')
+        command.add_argument('--seed', type=int, default=0, help='Random seed, so runs are reproducible')
+    args = parser.parse_args()
+
+    if args.command == 'startup':
+        failures = StartupCheck(args)
+        for failure in failures:
+            print(f"FAILED: {failure}")
+        sys.exit(1 if failures else 0)
+
+    if args.command == 'generate':
+        points = GenerateSOSA(args.output, args.sensors, args.days, args.points_per_day, args.seed)
+        print(f"Wrote {points} observations to {args.output}")
+        return
+
+    if args.keep:
+        os.makedirs(args.keep, exist_ok=True)
+        results = RunBenchmark(args, args.keep)
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            results = RunBenchmark(args, directory)
+    with open(args.results, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.results}")
+
+if __name__ == "__main__":
+    main()
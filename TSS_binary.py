@@ -0,0 +1,164 @@
+import base64
+import json
+import os
+import struct
+import zlib
+from array import array
+from rdflib import URIRef
+from TSS_columns import ObservationColumns
+
+# Packed binary encoding of tss:points, an alternative to the JSON array.
+# The literal is base64 of a zlib-compressed payload, typed tss:PackedPoints so readers
+# can tell it from JSON. It keeps exactly what the JSON holds, so decoding gives the same
+# point dicts (and the same lexical forms) the JSON would have given:
+#
+#   header      magic 'TSP1', point count (uint32), flags (uint8)
+#   times       first epoch-nanosecond timestamp, then the deltas, as zigzag varints
+#   offsets     int16 UTC offset code per point (TSS_columns.NAIVE / UTC_Z / minutes)
+#   kinds       int8 per point (float, integer, true, false, or kept lexical form)
+#   values      float64 per point
+#   properties  JSON list of the distinct observedProperty strings, plus an int32 index
+#               per point when there is more than one
+#   lexical     JSON {position: [time, value]} of the lexical forms the columns can not rebuild
+#   ids         the ids' common prefix, then either the numeric suffixes as zigzag varint
+#               deltas (ID_NUMERIC) or the remaining suffixes joined by newlines
+#
+# All multi-byte numbers are little-endian; every section after the header is
+# length-prefixed (uint32).
+
+DATATYPE = URIRef('https://w3id.org/tss#PackedPoints')
+MAGIC = b'TSP1'
+ID_NUMERIC = 1
+MULTIPLE_PROPERTIES = 2
+
+def _zigzag_varints(numbers):
+    out = bytearray()
+    for n in numbers:
+        n = (n << 1) ^ (n >> 63) if n < 0 else n << 1
+        while n > 0x7f:
+            out.append((n & 0x7f) | 0x80)
+            n >>= 7
+        out.append(n)
+    return bytes(out)
+
+def _read_zigzag_varints(data, count):
+    numbers = []
+    position = 0
+    for _ in range(count):
+        n = shift = 0
+        while True:
+            byte = data[position]
+            position += 1
+            n |= (byte & 0x7f) << shift
+            shift += 7
+            if byte < 0x80:
+                break
+        numbers.append((n >> 1) ^ -(n & 1))
+    return numbers
+
+def _sections(payload, position):
+    while position < len(payload):
+        (length,) = struct.unpack_from('<I', payload, position)
+        position += 4
+        yield payload[position:position + length]
+        position += length
+
+def _little_endian(column):
+    if struct.pack('=h', 1) != struct.pack('<h', 1):
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+def _from_little_endian(typecode, data):
+    column = array(typecode)
+    column.frombytes(data)
+    if struct.pack('=h', 1) != struct.pack('<h', 1):
+        column.byteswap()
+    return column
+
+def _is_number(text):
+    return text.isdigit() and (text == '0' or not text.startswith('0')) and len(text) < 19
+
+def PackPoints(bucket):
+    # ObservationColumns -> base64 text of the packed encoding
+    count = len(bucket)
+    flags = 0
+    times = bucket.times
+    time_deltas = [times[0]] + [times[i] - times[i - 1] for i in range(1, count)] if count else []
+
+    ids = bucket.ids
+    prefix = os.path.commonprefix(ids) if ids else ''
+    suffixes = [point_id[len(prefix):] for point_id in ids]
+    if suffixes and all(_is_number(suffix) for suffix in suffixes):
+        flags |= ID_NUMERIC
+        numbers = [int(suffix) for suffix in suffixes]
+        id_data = _zigzag_varints([numbers[0]] + [numbers[i] - numbers[i - 1] for i in range(1, count)])
+    else:
+        id_data = '\n'.join(suffixes).encode('utf-8')
+
+    property_table = [str(p) for p in bucket.property_table]
+    property_data = b''
+    if len(property_table) > 1:
+        flags |= MULTIPLE_PROPERTIES
+        property_data = _little_endian(bucket.properties)
+
+    sections = [
+        _zigzag_varints(time_deltas),
+        _little_endian(bucket.offsets),
+        _little_endian(bucket.kinds),
+        _little_endian(bucket.values),
+        json.dumps(property_table).encode('utf-8'),
+        property_data,
+        json.dumps({str(i): kept for i, kept in bucket.lexical.items()}).encode('utf-8') if bucket.lexical else b'',
+        prefix.encode('utf-8'),
+        id_data,
+    ]
+    payload = MAGIC + struct.pack('<IB', count, flags) + b''.join(struct.pack('<I', len(s)) + s for s in sections)
+    return base64.b64encode(zlib.compress(payload, 9)).decode('ascii')
+
+def UnpackPoints(text):
+    # base64 text of the packed encoding -> ObservationColumns (properties as strings)
+    payload = zlib.decompress(base64.b64decode(text))
+    if payload[:4] != MAGIC:
+        raise ValueError("Not a packed tss:points literal (bad magic)")
+    count, flags = struct.unpack_from('<IB', payload, 4)
+    (time_data, offset_data, kind_data, value_data, property_json, property_data,
+     lexical_json, prefix, id_data) = _sections(payload, 9)
+
+    bucket = ObservationColumns()
+    times = array('q')
+    total = 0
+    for delta in _read_zigzag_varints(time_data, count):
+        total += delta
+        times.append(total)
+    bucket.times = times
+    bucket.offsets = _from_little_endian('h', offset_data)
+    bucket.kinds = _from_little_endian('b', kind_data)
+    bucket.values = _from_little_endian('d', value_data)
+    bucket.property_table = json.loads(property_json)
+    bucket.property_index = {p: i for i, p in enumerate(bucket.property_table)}
+    if flags & MULTIPLE_PROPERTIES:
+        bucket.properties = _from_little_endian('i', property_data)
+    else:
+        bucket.properties = array('i', bytes(4 * count))
+    if lexical_json:
+        bucket.lexical = {int(i): tuple(kept) for i, kept in json.loads(lexical_json).items()}
+
+    prefix = prefix.decode('utf-8')
+    if flags & ID_NUMERIC:
+        number = 0
+        ids = []
+        for delta in _read_zigzag_varints(id_data, count):
+            number += delta
+            ids.append(prefix + str(number))
+        bucket.ids = ids
+    else:
+        bucket.ids = [prefix + suffix for suffix in id_data.decode('utf-8').split('\n')] if count else []
+    return bucket
+
+def PackedPointDicts(text):
+    # same point dicts json.loads() gives for the JSON encoding
+    bucket = UnpackPoints(text)
+    for i in range(len(bucket)):
+        yield {"time": bucket.time_lexical(i), "value": bucket.value_lexical(i),
+               "id": bucket.ids[i], "observedProperty": bucket.observed_property(i)}
@@ -0,0 +1,156 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from functools import lru_cache
+
+# Content-addressed cache of conversion results (--cache DIR), so a retried or repeated
+# run costs a hash of its input and a copy.
+#
+#   files/<key>      whole output files; the key is the SHA-256 of the converter, its
+#                    version, the options and the SHA-256 of every input file
+#   fragments/<key>  formatted text of one (sensor, window), keyed by the version, the
+#                    options that shape a snippet and a digest of the window's points,
+#                    so a changed input only rebuilds the windows whose points changed;
+#                    a first JSON line holds its snippets' [sensor, points, json_bytes],
+#                    so a hit reports the same --metrics events as a build
+#
+# The converter version is the hash of the scripts' sources, so any code change starts
+# from an empty cache. Entries are written to a temporary file and renamed into place,
+# so concurrent runs (TSS_batch.py jobs, --workers) never see half an entry. An entry's
+# mtime is its last use; when the cache is closed the least recently used entries are
+# removed until it is within its size limit.
+
+CACHE_SIZE_MB = 1024
+KINDS = ('files', 'fragments')
+
+def FileHash(directory):
+    digest = hashlib.sha256()
+    with open(directory, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+@lru_cache(maxsize=None)
+def ConverterVersion():
+    # SHA-256 of all scripts next to this one
+    digest = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(__file__))
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.py'):
+            digest.update(name.encode('utf-8'))
+            digest.update(FileHash(os.path.join(directory, name)).encode('ascii'))
+    return digest.hexdigest()
+
+def CacheKey(*parts):
+    text = json.dumps([ConverterVersion()] + list(parts), sort_keys=True, default=str)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class ResultCache:
+    def __init__(self, directory, max_bytes=CACHE_SIZE_MB << 20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        for kind in KINDS:
+            os.makedirs(os.path.join(directory, kind), exist_ok=True)
+        self.hits = {kind: 0 for kind in KINDS}
+        self.misses = {kind: 0 for kind in KINDS}
+
+    def entry(self, kind, key):
+        return os.path.join(self.directory, kind, key)
+
+    def used(self, kind, key):
+        # returns the entry's path after marking it as just used, or None when it is missing
+        path = self.entry(kind, key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses[kind] += 1
+            return None
+        self.hits[kind] += 1
+        return path
+
+    def add(self, kind, key, write):
+        # write(f) fills a temporary file that then becomes the entry
+        descriptor, temporary = tempfile.mkstemp(prefix='.tmp', dir=os.path.join(self.directory, kind))
+        try:
+            with os.fdopen(descriptor, 'wb') as f:
+                write(f)
+            os.replace(temporary, self.entry(kind, key))
+        except BaseException:
+            os.remove(temporary)
+            raise
+
+    # whole files
+
+    def file_key(self, converter, inputs, options):
+        # options: {name: value} of everything that changes the output
+        return CacheKey(converter, [FileHash(directory) for directory in inputs], options)
+
+    def fetch(self, key, output_directory):
+        # copies the cached output to output_directory; False when it is not cached
+        path = self.used('files', key)
+        if path is None:
+            return False
+        shutil.copyfile(path, output_directory)
+        return True
+
+    def store(self, key, output_directory):
+        with open(output_directory, 'rb') as source:
+            self.add('files', key, lambda f: shutil.copyfileobj(source, f))
+
+    # fragments
+
+    def fragment_key(self, options, *parts):
+        return CacheKey(options, *parts)
+
+    def get(self, key):
+        # (text, snippets) or None when it is not cached
+        path = self.used('fragments', key)
+        if path is None:
+            return None
+        with open(path, encoding='utf-8', newline='') as f:
+            snippets = json.loads(f.readline())
+            return f.read(), snippets
+
+    def put(self, key, text, snippets=()):
+        entry = json.dumps(list(snippets)) + '\n' + text
+        self.add('fragments', key, lambda f: f.write(entry.encode('utf-8')))
+
+    def evict(self):
+        entries = []
+        for kind in KINDS:
+            with os.scandir(os.path.join(self.directory, kind)) as scan:
+                for item in scan:
+                    if item.is_file() and not item.name.startswith('.tmp'):
+                        stat = item.stat()
+                        entries.append((stat.st_mtime_ns, stat.st_size, item.path))
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        return removed
+
+    def close(self):
+        removed = self.evict()
+        summary = ', '.join(f"{kind} {self.hits[kind]} hits/{self.misses[kind]} misses"
+                            for kind in KINDS if self.hits[kind] or self.misses[kind])
+        if summary or removed:
+            print(f"Cache: {summary or 'unused'}" + (f", evicted {removed} entries" if removed else ''))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def AddArguments(parser):
+    parser.add_argument('--cache', metavar='DIR', help='Reuse results cached in this directory for the same input content, converter version and options, and cache new ones')
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE_MB, metavar='MB', help=f'Size limit of --cache; least recently used entries are removed beyond it (default: {CACHE_SIZE_MB})')
@@ -0,0 +1,45 @@
+import importlib
+import sys
+
+# One entry point for all the tools:
+#
+#   python TSS_cli.py rdf2tss -i observations.ttl -o tss.ttl
+#   python TSS_cli.py tss2rdf -i tss.ttl -o observations.ttl
+#
+# Nothing but the standard library is imported until a command is chosen; the command's
+# module (and with it rdflib) is imported only then, so `python TSS_cli.py --help` and
+# mistyped commands return at once. Each command takes the same options as its script.
+
+COMMANDS = {
+    'rdf2tss': ('RDF2TSS_per_day_V2', 'SOSA observations to time series snippets'),
+    'tss2rdf': ('TSS2RDF', 'time series snippets back to SOSA observations'),
+    'prettify': ('RDF_prettify', 'rewrite an RDF file as pretty Turtle or N-Triples'),
+    'index': ('TSS_index', 'build or query the sidecar snippet index of a TSS file'),
+    'batch': ('TSS_batch', 'convert many files with warm worker processes'),
+    'benchmark': ('TSS_benchmark', 'synthetic data, stage timings and the startup check'),
+}
+
+def Usage():
+    lines = ['usage: TSS_cli.py COMMAND [options]', '', 'commands:']
+    lines += [f'  {name:10} {description}' for name, (module, description) in COMMANDS.items()]
+    lines += ['', 'Run TSS_cli.py COMMAND --help for the options of a command.']
+    return '\n'.join(lines)
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] in ('-h', '--help'):
+        print(Usage())
+        return 0 if argv else 2
+    command = argv[0]
+    if command not in COMMANDS:
+        print(Usage(), file=sys.stderr)
+        print(f"\nTSS_cli.py: unknown command {command!r}", file=sys.stderr)
+        return 2
+    module = importlib.import_module(COMMANDS[command][0])
+    # the command's own argparse sees its options and names itself in messages
+    sys.argv = [f'TSS_cli.py {command}'] + argv[1:]
+    module.main()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+import json
+import re
+import TSS_binary
+
+# Codecs for the tss:points JSON array. Every codec writes the same text as
+# json.dumps() of the list of point dicts the converters have always produced:
+#   [{"time": "...", "value": "...", "id": "...", "observedProperty": "..."}, ...]
+#
+#   stdlib  builds the dicts and calls json.dumps / json.loads (the reference)
+#   fast    writes the array straight from ObservationColumns; decodes with json.loads
+#   lazy    writes like fast; decodes one point at a time, so a huge array is never
+#           held as a list of dicts (a little slower than json.loads overall)
+#
+#   packed  not JSON: the compressed binary encoding of TSS_binary.py, typed tss:PackedPoints
+#
+# A codec is an object with encode(bucket) -> str, decode(text) -> iterable of point
+# dicts and the datatype of the literal it writes (None for JSON); RegisterCodec() adds
+# more (e.g. one backed by an optional JSON library).
+
+class StdlibCodec:
+    datatype = None
+
+    def encode(self, bucket):
+        points = [{"time": bucket.time_lexical(i), "value": bucket.value_lexical(i),
+                   "id": bucket.ids[i], "observedProperty": str(bucket.observed_property(i))}
+                  for i in range(len(bucket))]
+        return json.dumps(points)
+
+    def decode(self, text):
+        return json.loads(text)
+
+_WHITESPACE = re.compile(r'\s*')
+_raw_decode = json.JSONDecoder().raw_decode
+
+def IterPoints(text):
+    # Lazy decoder: yields one point dict at a time, each decoded by json's C scanner
+    # straight out of the array text, so only the current point exists as a dict.
+    position = _WHITESPACE.match(text, text.index('[') + 1).end()
+    if text[position] == ']':
+        return
+    while True:
+        point, position = _raw_decode(text, position)
+        yield point
+        if text.startswith(', {', position):
+            # the converters' own separator
+            position += 2
+            continue
+        position = _WHITESPACE.match(text, position).end()
+        if text[position] == ']':
+            return
+        if text[position] != ',':
+            raise ValueError(f"Malformed tss:points array at character {position}")
+        position = _WHITESPACE.match(text, position + 1).end()
+
+class FastCodec:
+    datatype = None
+
+    def encode(self, bucket):
+        return bucket.points_json()
+
+    def decode(self, text):
+        return json.loads(text)
+
+class LazyCodec(FastCodec):
+    def decode(self, text):
+        return IterPoints(text)
+
+class PackedCodec:
+    datatype = TSS_binary.DATATYPE
+
+    def encode(self, bucket):
+        return TSS_binary.PackPoints(bucket)
+
+    def decode(self, text):
+        return TSS_binary.PackedPointDicts(text)
+
+CODECS = {'stdlib': StdlibCodec(), 'fast': FastCodec(), 'lazy': LazyCodec(), 'packed': PackedCodec()}
+DEFAULT_CODEC = 'fast'
+codec = CODECS[DEFAULT_CODEC]
+codec_name = DEFAULT_CODEC
+
+def RegisterCodec(name, new_codec):
+    CODECS[name] = new_codec
+
+def SetCodec(name):
+    global codec, codec_name
+    if name not in CODECS:
+        raise ValueError(f"Unknown JSON codec {name!r}, expected one of {sorted(CODECS)}")
+    codec = CODECS[name]
+    codec_name = name
+    return codec
+
+def EncodePoints(bucket):
+    return codec.encode(bucket)
+
+def DecodePoints(text):
+    return codec.decode(text)
+
+def DecodeLiteral(literal):
+    # point dicts of a tss:points literal; its datatype decides between packed and JSON,
+    # whatever codec was selected for writing
+    if getattr(literal, 'datatype', None) == TSS_binary.DATATYPE:
+        return TSS_binary.PackedPointDicts(str(literal))
+    json_codec = codec if codec.datatype is None else CODECS[DEFAULT_CODEC]
+    return json_codec.decode(str(literal))
+
+def AddArguments(parser):
+    parser.add_argument('--points-codec', '--json-codec', dest='json_codec', choices=sorted(CODECS), default=DEFAULT_CODEC,
+                        help='tss:points codec: fast writes JSON straight from the columns (default); lazy also decodes one point at a time; stdlib uses json.dumps/json.loads (all three write the same JSON); packed writes the compressed binary encoding')
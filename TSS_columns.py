@@ -0,0 +1,272 @@
+from array import array
+from bisect import bisect_left
+from datetime import datetime,timedelta,timezone
+import hashlib
+from json.encoder import encode_basestring_ascii
+from itertools import compress
+import math
+import tracemalloc
+
+# Columnar bucket of observations (one sensor, one snippet window).
+# Instead of one tuple of four rdflib terms per observation, every field is a column:
+#   times      int64 epoch nanoseconds (UTC; naive timestamps are read as UTC)
+#   offsets    int16 UTC offset in minutes used to write the timestamp back
+#   values     float64 reading
+#   kinds      int8 how values[i] is written back (the validity/boolean mask)
+#   ids        observation ids as plain strings
+#   properties int32 index into the interned observedProperty table
+# Timestamps and readings are written back in their canonical form. When that would not
+# reproduce the input's lexical form exactly, the original strings are kept in `lexical`,
+# so the JSON is always identical to str() of the original terms.
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+NAIVE = -32768     # offsets: timestamp had no timezone
+UTC_Z = 32767      # offsets: UTC written with a trailing Z
+
+OVERRIDE, FLOAT, INTEGER, TRUE, FALSE = range(5)
+
+def EpochNanos(t):
+    if t.tzinfo is None:
+        t = t.replace(tzinfo=timezone.utc)
+    delta = t - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000000 + delta.microseconds * 1000
+
+def FormatTime(nanos, offset):
+    t = EPOCH + timedelta(microseconds=nanos // 1000)
+    if offset == NAIVE:
+        return t.replace(tzinfo=None).isoformat()
+    if offset == UTC_Z:
+        return t.replace(tzinfo=None).isoformat() + 'Z'
+    return t.astimezone(timezone(timedelta(minutes=offset))).isoformat()
+
+def TimeFromNanos(nanos, offset):
+    # datetime the columns stand for (naive when the timestamp had no timezone)
+    t = EPOCH + timedelta(microseconds=nanos // 1000)
+    if offset == NAIVE:
+        return t.replace(tzinfo=None)
+    if offset == UTC_Z:
+        return t
+    return t.astimezone(timezone(timedelta(minutes=offset)))
+
+def EncodeValue(lexical):
+    # returns (kind, value); kind OVERRIDE means the lexical form has to be kept as is
+    if lexical == 'true':
+        return TRUE, 1.0
+    if lexical == 'false':
+        return FALSE, 0.0
+    try:
+        value = float(lexical)
+    except ValueError:
+        return OVERRIDE, float('nan')
+    if repr(value) == lexical:
+        return FLOAT, value
+    if value.is_integer() and abs(value) < 2 ** 53 and str(int(value)) == lexical:
+        return INTEGER, value
+    return OVERRIDE, value
+
+def FormatValue(kind, value):
+    if kind == FLOAT:
+        return repr(value)
+    if kind == INTEGER:
+        return str(int(value))
+    if kind == TRUE:
+        return 'true'
+    return 'false'
+
+def EncodeRow(row):
+    # the arguments of ObservationColumns.append_encoded for one observation row
+    time_lexical = str(row.TIME)
+    t = row.TIME.toPython()
+    nanos = EpochNanos(t)
+    if t.tzinfo is None:
+        offset = NAIVE
+    else:
+        offset = int(t.utcoffset().total_seconds()) // 60
+        if offset == 0 and time_lexical.endswith('Z'):
+            offset = UTC_Z
+    keep_time = None if FormatTime(nanos, offset) == time_lexical else time_lexical
+
+    value_lexical = str(row.READING)
+    kind, value = EncodeValue(value_lexical)
+    keep_value = value_lexical if kind == OVERRIDE else None
+    return nanos, offset, value, kind, str(row.OBSERVATION), row.observedProperty, keep_time, keep_value
+
+class ObservationColumns:
+    __slots__ = ('times', 'offsets', 'values', 'kinds', 'ids', 'properties',
+                 'property_table', 'property_index', 'lexical')
+
+    def __init__(self, rows=()):
+        self.times = array('q')
+        self.offsets = array('h')
+        self.values = array('d')
+        self.kinds = array('b')
+        self.ids = []
+        self.properties = array('i')
+        self.property_table = []   # rdflib terms, in order of first appearance
+        self.property_index = {}
+        self.lexical = {}          # position -> (time lexical or None, value lexical or None)
+        for row in rows:
+            self.append(row)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def append(self, row):
+        # row: anything with the base_query fields (Observation or a SPARQL result row)
+        self.append_encoded(*EncodeRow(row))
+
+    def append_encoded(self, nanos, offset, value, kind, observation_id, observed_property, keep_time=None, keep_value=None):
+        # appends a point that is already in column form (e.g. read back from TSS_store)
+        if keep_time is not None or keep_value is not None:
+            self.lexical[len(self.ids)] = (keep_time, keep_value)
+
+        index = self.property_index.get(observed_property)
+        if index is None:
+            index = self.property_index[observed_property] = len(self.property_table)
+            self.property_table.append(observed_property)
+
+        self.times.append(nanos)
+        self.offsets.append(offset)
+        self.values.append(value)
+        self.kinds.append(kind)
+        self.ids.append(observation_id)
+        self.properties.append(index)
+
+    def extend(self, other):
+        # appends the points of another bucket (e.g. one built in a worker process)
+        start = len(self.ids)
+        remap = []
+        for term in other.property_table:
+            index = self.property_index.get(term)
+            if index is None:
+                index = self.property_index[term] = len(self.property_table)
+                self.property_table.append(term)
+            remap.append(index)
+        self.times.extend(other.times)
+        self.offsets.extend(other.offsets)
+        self.values.extend(other.values)
+        self.kinds.extend(other.kinds)
+        self.ids.extend(other.ids)
+        self.properties.extend(array('i', [remap[i] for i in other.properties]))
+        for i, kept in other.lexical.items():
+            self.lexical[start + i] = kept
+
+    def sort(self):
+        # stable, so observations with equal times keep their input order
+        order = sorted(range(len(self.ids)), key=self.times.__getitem__)
+        if all(i == position for position, i in enumerate(order)):
+            return
+        self.times = array('q', [self.times[i] for i in order])
+        self.offsets = array('h', [self.offsets[i] for i in order])
+        self.values = array('d', [self.values[i] for i in order])
+        self.kinds = array('b', [self.kinds[i] for i in order])
+        self.ids = [self.ids[i] for i in order]
+        self.properties = array('i', [self.properties[i] for i in order])
+        self.lexical = {position: self.lexical[i] for position, i in enumerate(order) if i in self.lexical}
+
+    def time_lexical(self, i):
+        kept = self.lexical.get(i)
+        if kept is not None and kept[0] is not None:
+            return kept[0]
+        return FormatTime(self.times[i], self.offsets[i])
+
+    def value_lexical(self, i):
+        kept = self.lexical.get(i)
+        if kept is not None and kept[1] is not None:
+            return kept[1]
+        return FormatValue(self.kinds[i], self.values[i])
+
+    def digest(self):
+        # SHA-256 of everything the points are written from (for --cache fragment keys)
+        digest = hashlib.sha256()
+        for column in (self.times, self.offsets, self.values, self.kinds, self.properties):
+            digest.update(column.tobytes())
+        digest.update('\n'.join(self.ids).encode('utf-8'))
+        digest.update(repr([term.n3() for term in self.property_table]).encode('utf-8'))
+        digest.update(repr(sorted(self.lexical.items())).encode('utf-8'))
+        return digest.hexdigest()
+
+    def observed_property(self, i):
+        return self.property_table[self.properties[i]]
+
+    def slice(self, start, stop):
+        piece = ObservationColumns()
+        piece.times = self.times[start:stop]
+        piece.offsets = self.offsets[start:stop]
+        piece.values = self.values[start:stop]
+        piece.kinds = self.kinds[start:stop]
+        piece.ids = self.ids[start:stop]
+        piece.properties = self.properties[start:stop]
+        piece.property_table = self.property_table
+        piece.property_index = self.property_index
+        piece.lexical = {i - start: kept for i, kept in self.lexical.items() if start <= i < stop}
+        return piece
+
+    def point_json(self, i, property_json=None):
+        # Same text as json.dumps() of one point dict, without building the dict.
+        if property_json is None:
+            observed_property = encode_basestring_ascii(str(self.observed_property(i)))
+        else:
+            observed_property = property_json[self.properties[i]]
+        return ('{"time": ' + encode_basestring_ascii(self.time_lexical(i))
+                + ', "value": ' + encode_basestring_ascii(self.value_lexical(i))
+                + ', "id": ' + encode_basestring_ascii(self.ids[i])
+                + ', "observedProperty": ' + observed_property + '}')
+
+    def numeric_mask(self, start=0, stop=None):
+        # 1 for the points whose value is a finite number: not a boolean, not a string (NaN)
+        values = self.values[start:stop]
+        kinds = self.kinds[start:stop]
+        return [kind != TRUE and kind != FALSE and math.isfinite(value) for value, kind in zip(values, kinds)]
+
+    def aggregate(self, start=0, stop=None):
+        # count of points in [start, stop), plus min/max/mean of the numeric ones (None without any)
+        stop = len(self.ids) if stop is None else stop
+        numbers = list(compress(self.values[start:stop], self.numeric_mask(start, stop)))
+        if not numbers:
+            return stop - start, None, None, None
+        return stop - start, min(numbers), max(numbers), math.fsum(numbers) / len(numbers)
+
+    def downsample(self, step_ns):
+        # [(bucket start nanos, offset of its first point, count, min, max, mean)] for buckets
+        # of step_ns aligned to the epoch; the points are sorted, so every bucket is one range
+        buckets = []
+        start = 0
+        times = self.times
+        while start < len(times):
+            bucket_start = times[start] - times[start] % step_ns
+            stop = bisect_left(times, bucket_start + step_ns, start + 1)
+            buckets.append((bucket_start, self.offsets[start]) + self.aggregate(start, stop))
+            start = stop
+        return buckets
+
+    def points_json(self):
+        # Same text as json.dumps() of the list of point dicts.
+        property_json = [encode_basestring_ascii(str(p)) for p in self.property_table]
+        return '[' + ', '.join(self.point_json(i, property_json) for i in range(len(self.ids))) + ']'
+
+def MemoryReport(parse, make_row_bucket, make_column_bucket):
+    # parse(on_observation) feeds every observation of the input to on_observation(sensor, row).
+    # Each representation is built from a fresh parse and measured with tracemalloc, so the
+    # rdflib terms referenced by the row objects are counted as part of them.
+    report = {}
+    for name, make_bucket in (('rows', make_row_bucket), ('columns', make_column_bucket)):
+        buckets = {}
+        count = [0]
+
+        def add(sensor, row):
+            key = (sensor, row.TIME.toPython().date())
+            bucket = buckets.get(key)
+            if bucket is None:
+                bucket = buckets[key] = make_bucket()
+            bucket.append(row)
+            count[0] += 1
+
+        tracemalloc.start()
+        parse(add)
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        report[name] = {'points': count[0], 'bytes': retained, 'bytes_per_point': retained / max(count[0], 1)}
+        del buckets
+    report['reduction'] = report['rows']['bytes'] / max(report['columns']['bytes'], 1)
+    return report
@@ -0,0 +1,231 @@
+from rdflib import Graph,URIRef,Literal,Namespace
+from rdflib.namespace import XSD,RDF
+import argparse
+import json
+import os
+from functools import lru_cache
+from RDF_stream import OUT_FORMATS,GuessFormat,StatementRecords,OpenWriter
+from TSS_columns import EpochNanos
+import TSS2RDF
+
+# Sidecar index for TSS files: one entry per snippet with its sensor, observedProperty,
+# tss:from / tss:to and the byte range of the snippet in the file. A lookup then reads
+# only the prefix header and the matching byte ranges instead of parsing the whole file.
+#
+# Works on Turtle (each snippet is one statement, template inlined) and on N-Triples
+# where a snippet's lines and its template's lines are next to each other, which is how
+# the converters' nt writer lays them out. Templates shared by many snippets
+# (--shared-templates) are records of their own; an entry then also holds the byte
+# range of its template, which is read along with the snippet.
+
+prefix_tss = Namespace('https://w3id.org/tss#')
+prefix_sosa = Namespace('http://www.w3.org/ns/sosa/')
+INDEX_SUFFIX = '.tssidx'
+
+def IndexPath(directory):
+    return str(directory) + INDEX_SUFFIX
+
+def SharedTemplates(triples):
+    # template URI -> {predicate: object} for the shared templates in one record
+    templates = {}
+    for s, p, o in triples:
+        if isinstance(s, URIRef) and p == RDF.type and o == prefix_tss.PointTemplate:
+            templates[s] = {tp: to for ts, tp, to in triples if ts == s}
+    return templates
+
+def SnippetEntry(triples, offset, length, templates=None):
+    # templates: shared template URI -> ({predicate: object}, offset, length) read so far
+    snippets = [s for s, p, o in triples if p == RDF.type and o == prefix_tss.Snippet]
+    if not snippets:
+        return None
+    snippet = snippets[0]
+    values = {}
+    for s, p, o in triples:
+        values.setdefault((s, p), o)
+    template = values.get((snippet, prefix_tss.about))
+    time_from = values.get((snippet, prefix_tss["from"]))
+    # the converters write tss:to, the hand-written samples use tss:until
+    time_to = values.get((snippet, prefix_tss.to)) or values.get((snippet, prefix_tss.until)) or time_from
+    if time_from is None:
+        return None
+    entry = {
+        'snippet': str(snippet),
+        'sensor': str(values.get((template, prefix_sosa.madeBySensor), '')),
+        'property': str(values.get((template, prefix_sosa.observedProperty), '')),
+        'from': str(time_from),
+        'to': str(time_to),
+        'from_ns': EpochNanos(time_from.toPython()),
+        'to_ns': EpochNanos(time_to.toPython()),
+        'offset': offset,
+        'length': length,
+    }
+    interval = values.get((snippet, prefix_tss.interval))
+    if interval is not None:
+        # a --downsample companion; normalized as rdflib parses it (PT60M -> PT1H)
+        entry['interval'] = str(Literal(str(interval), datatype=XSD.duration))
+    if (template, RDF.type) not in values and isinstance(template, URIRef):
+        # a shared template; BuildIndex fills it in when it was not read yet
+        entry['template'] = str(template)
+        if templates is not None and template in templates:
+            ResolveTemplate(entry, templates[template])
+    return entry
+
+def ResolveTemplate(entry, shared):
+    template_values, offset, length = shared
+    entry['sensor'] = str(template_values.get(prefix_sosa.madeBySensor, ''))
+    entry['property'] = str(template_values.get(prefix_sosa.observedProperty, ''))
+    entry['template'] = [offset, length]
+
+def BuildIndex(directory, fmt=None):
+    fmt = fmt or GuessFormat(directory)
+    print("Started indexing snippets...")
+    header = []
+    entries = []
+    templates = {}
+    for offset, length, triples in StatementRecords(directory, fmt):
+        if triples is None:
+            header.append([offset, length])
+            continue
+        for template, template_values in SharedTemplates(triples).items():
+            templates[template] = (template_values, offset, length)
+        entry = SnippetEntry(triples, offset, length, templates)
+        if entry is not None:
+            entries.append(entry)
+    for entry in entries:
+        # shared templates that came after their snippets
+        if isinstance(entry.get('template'), str) and URIRef(entry['template']) in templates:
+            ResolveTemplate(entry, templates[URIRef(entry['template'])])
+
+    print(f"Indexed {len(entries)} snippets.")
+    return IndexData(directory, fmt, header, entries)
+
+def IndexData(directory, fmt, header, entries):
+    # the index of a file as it is on disk now
+    stat = os.stat(directory)
+    return {'data': os.path.basename(str(directory)), 'format': fmt, 'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns, 'header': header, 'snippets': entries}
+
+def SaveIndex(directory, index):
+    with open(IndexPath(directory), 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    print(f"Index written to {IndexPath(directory)}")
+
+def WriteIndex(directory, fmt=None):
+    index = BuildIndex(directory, fmt)
+    SaveIndex(directory, index)
+    return index
+
+def LoadIndex(directory):
+    with open(IndexPath(directory), encoding='utf-8') as f:
+        index = json.load(f)
+    stat = os.stat(directory)
+    if stat.st_size != index['size'] or stat.st_mtime_ns != index['mtime_ns']:
+        raise ValueError(f"{IndexPath(directory)} is out of date, rebuild it with: python TSS_index.py build -i {directory}")
+    return index
+
+def CurrentIndex(directory):
+    # the index of a file, or None when it has none or it is out of date
+    try:
+        return LoadIndex(directory)
+    except (FileNotFoundError, ValueError):
+        return None
+
+def TimeNanos(text):
+    return EpochNanos(Literal(text, datatype=XSD.dateTime).toPython())
+
+@lru_cache(maxsize=None)
+def Duration(text):
+    # xsd:duration lexical -> comparable value, so PT60M matches PT1H; ill-typed text stays a str
+    return Literal(text, datatype=XSD.duration).toPython()
+
+def FindSnippets(index, sensor=None, observed_property=None, start=None, end=None, interval=None):
+    # sensor matches the full sensor URI or its last path segment (the raw sensor id);
+    # start/end are xsd:dateTime strings, a snippet matches when its range overlaps them.
+    # Without interval only snippets of observations match, with it (e.g. "PT15M") only
+    # the downsampled companions of the same duration.
+    start_ns = TimeNanos(start) if start else None
+    end_ns = TimeNanos(end) if end else None
+    found = []
+    for entry in index['snippets']:
+        if interval is None:
+            if 'interval' in entry:
+                continue
+        elif 'interval' not in entry or Duration(entry['interval']) != Duration(interval):
+            continue
+        if sensor and entry['sensor'] != sensor and not entry['sensor'].endswith('/' + sensor):
+            continue
+        if observed_property and entry['property'] != observed_property:
+            continue
+        if start_ns is not None and entry['to_ns'] < start_ns:
+            continue
+        if end_ns is not None and entry['from_ns'] > end_ns:
+            continue
+        found.append(entry)
+    return found
+
+def RangeText(directory, index, ranges):
+    # the file's prefix header followed by the given (offset, length) byte ranges
+    parts = []
+    with open(directory, 'rb') as f:
+        for offset, length in list(index['header']) + list(ranges):
+            f.seek(offset)
+            parts.append(f.read(length))
+    return b''.join(parts).decode('utf-8')
+
+def ReadRanges(directory, index, ranges, graph=None):
+    graph = Graph() if graph is None else graph
+    graph.parse(data=RangeText(directory, index, ranges), format='nt' if index['format'] != 'turtle' else 'turtle',
+                publicID="https://example.org/")
+    return graph
+
+def ReadSnippets(directory, index, entries):
+    # a Graph holding only the given snippets (and their templates)
+    # shared templates, once each
+    ranges = sorted({tuple(entry['template']) for entry in entries if isinstance(entry.get('template'), list)})
+    return ReadRanges(directory, index, ranges + [(entry['offset'], entry['length']) for entry in entries])
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or query the snippet index of a TSS file.')
+    commands = parser.add_subparsers(dest='command', required=True)
+    build = commands.add_parser('build', help='Index a TSS file (writes <file>' + INDEX_SUFFIX + ')')
+    build.add_argument('-i', '--input', required=True, help='TSS file path')
+    query = commands.add_parser('query', help='Find snippets through the index and expand them to observations')
+    query.add_argument('-i', '--input', required=True, help='Indexed TSS file path')
+    query.add_argument('-o', '--output', help='Output file for the expanded observations (default: only list the matching snippets)')
+    query.add_argument('--out-format', choices=OUT_FORMATS, default='turtle', help='Output format')
+    query.add_argument('--sensor', help='Sensor URI or sensor id')
+    query.add_argument('--property', help='observedProperty')
+    query.add_argument('--from', dest='start', help='Only snippets ending at or after this xsd:dateTime')
+    query.add_argument('--until', dest='end', help='Only snippets starting at or before this xsd:dateTime')
+    query.add_argument('--interval', help='Return the downsampled companions of this interval (e.g. PT15M) as they are, instead of expanding observations')
+    args = parser.parse_args()
+    if getattr(args, 'interval', None) and isinstance(Duration(args.interval), str):
+        parser.error(f'--interval needs an xsd:duration such as PT15M, not {args.interval!r}')
+
+    if args.command == 'build':
+        WriteIndex(args.input)
+        return
+
+    index = LoadIndex(args.input)
+    entries = FindSnippets(index, args.sensor, args.property, args.start, args.end, args.interval)
+    if not args.output:
+        for entry in entries:
+            print(json.dumps(entry))
+        return
+    print(f"{len(entries)} matching snippets")
+    snippets = ReadSnippets(args.input, index, entries)
+    if args.interval:
+        # companions hold bucket summaries, not observations to expand
+        for prefix, namespace in TSS2RDF.output_namespaces.items():
+            snippets.bind(prefix, namespace)
+        TSS2RDF.SaveGraph(args.output, snippets, args.out_format)
+        return
+    if args.out_format == 'nt':
+        with OpenWriter(args.output, args.out_format, TSS2RDF.output_namespaces) as writer:
+            TSS2RDF.CreateRDF(snippets, writer)
+        print('File written successfully')
+        return
+    TSS2RDF.SaveGraph(args.output, TSS2RDF.CreateRDF(snippets), args.out_format)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import contextlib
+import cProfile
+import io
+import json
+import pstats
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+
+# Stage timers, per-sensor counters and optional profiling for both converters.
+# The converters always report to `current`; nothing is written unless Enable() was
+# called (--metrics / --profile), so a plain run only pays for a few counter updates.
+#
+# With --metrics FILE every event is one JSON line, flushed as it happens so a long run
+# can be followed with tail -f:
+#   {"event": "stage_start", "stage": "parse", "t": 0.0}
+#   {"event": "stage_end", "stage": "parse", "t": 3.1, "seconds": 3.1, "peak_rss_kb": 412000}
+#   {"event": "snippet", "t": 3.5, "sensor": "24002042", "points": 1440, "json_bytes": 201000}
+#   {"event": "sensor", "sensor": "24002042", "observations": ..., "snippets": ..., "json_bytes": ...}
+#   {"event": "summary", "seconds": ..., "observations": ..., "observations_per_second": ..., ...}
+
+PROFILERS = ['cprofile', 'tracemalloc']
+TOP_ENTRIES = 25
+
+def PeakRSS():
+    # kilobytes (ru_maxrss is in bytes on macOS); None where there is no resource module (Windows)
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+class Metrics:
+    def __init__(self, directory=None, profiler=None, profile_directory=None):
+        self.start = time.perf_counter()
+        self.file = open(directory, 'w', encoding='utf-8') if directory else None
+        self.stages = defaultdict(float)
+        self.sensors = defaultdict(lambda: {'observations': 0, 'snippets': 0, 'json_bytes': 0})
+        self.profiler = profiler
+        self.profile_directory = profile_directory
+        self.profile = None
+        self.recorded = None
+        if profiler == 'cprofile':
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+        elif profiler == 'tracemalloc':
+            tracemalloc.start()
+
+    def emit(self, event, **fields):
+        if self.file is None:
+            return
+        record = {'event': event, 't': round(time.perf_counter() - self.start, 6)}
+        record.update(fields)
+        self.file.write(json.dumps(record) + '\n')
+        self.file.flush()
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        self.emit('stage_start', stage=name)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - started
+            self.stages[name] += seconds
+            fields = {'stage': name, 'seconds': round(seconds, 6), 'peak_rss_kb': PeakRSS()}
+            if self.profiler == 'tracemalloc':
+                fields['traced_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+            self.emit('stage_end', **fields)
+
+    @contextlib.contextmanager
+    def recording(self):
+        # collects the snippet() calls of a block as [sensor, points, json_bytes], so they
+        # can be kept with a cached result and replayed when it is used again
+        recorded = self.recorded = []
+        try:
+            yield recorded
+        finally:
+            self.recorded = None
+
+    def snippet(self, sensor, points, json_bytes):
+        if self.recorded is not None:
+            self.recorded.append([sensor, points, json_bytes])
+        counts = self.sensors[sensor]
+        counts['observations'] += points
+        counts['snippets'] += 1
+        counts['json_bytes'] += json_bytes
+        self.emit('snippet', sensor=sensor, points=points, json_bytes=json_bytes)
+
+    def take_sensors(self):
+        # counters collected so far, cleared (used by worker processes to hand them back)
+        sensors = dict(self.sensors)
+        self.sensors.clear()
+        return sensors
+
+    def merge_sensors(self, sensors):
+        for sensor, counts in sensors.items():
+            for name, value in counts.items():
+                self.sensors[sensor][name] += value
+            self.emit('snippets', sensor=sensor, **counts)
+
+    def summary(self):
+        seconds = time.perf_counter() - self.start
+        observations = sum(c['observations'] for c in self.sensors.values())
+        return {
+            'seconds': round(seconds, 6),
+            'sensors': len(self.sensors),
+            'observations': observations,
+            'snippets': sum(c['snippets'] for c in self.sensors.values()),
+            'json_bytes': sum(c['json_bytes'] for c in self.sensors.values()),
+            'observations_per_second': round(observations / seconds, 1) if seconds else None,
+            'peak_rss_kb': PeakRSS(),
+            'stages': {name: round(value, 6) for name, value in self.stages.items()},
+        }
+
+    def close(self):
+        for sensor in sorted(self.sensors):
+            self.emit('sensor', sensor=sensor, **self.sensors[sensor])
+        summary = self.summary()
+        if self.profiler == 'cprofile':
+            self.profile.disable()
+            if self.profile_directory:
+                self.profile.dump_stats(self.profile_directory)
+                print(f"cProfile stats written to {self.profile_directory}")
+            report = io.StringIO()
+            pstats.Stats(self.profile, stream=report).sort_stats('cumulative').print_stats(TOP_ENTRIES)
+            print(report.getvalue())
+        elif self.profiler == 'tracemalloc':
+            snapshot = tracemalloc.take_snapshot()
+            summary['traced_peak_bytes'] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            top = snapshot.statistics('lineno')[:TOP_ENTRIES]
+            summary['allocations'] = [{'where': str(stat.traceback), 'bytes': stat.size, 'count': stat.count} for stat in top]
+            print("Largest live allocations:")
+            for stat in top:
+                print(f"  {stat}")
+        self.emit('summary', **summary)
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        return summary
+
+current = Metrics()
+
+def Enable(directory=None, profiler=None, profile_directory=None):
+    # replaces the default (silent) collector; call Finish() at the end of the run
+    global current
+    current = Metrics(directory, profiler, profile_directory)
+    return current
+
+def Reset():
+    # silent collector for a worker process: a forked worker would otherwise inherit the
+    # parent's collector and write its events into the parent's --metrics file
+    global current
+    current = Metrics()
+    return current
+
+def Finish():
+    summary = current.close()
+    peak = summary['peak_rss_kb']
+    print(f"{summary['observations']} observations in {summary['snippets']} snippets, "
+          f"{summary['observations_per_second']} observations/s, peak RSS {'unknown' if peak is None else f'{peak // 1024} MB'}")
+    return summary
+
+def AddArguments(parser):
+    parser.add_argument('--metrics', metavar='FILE', help='Write stage timers, per-sensor counters and a summary as JSON lines to this file')
+    parser.add_argument('--profile', choices=PROFILERS, help='cprofile: print the hottest functions (and save stats to <output>.prof); tracemalloc: track Python allocations and print the largest')
+
+def EnableFromArgs(args):
+    # True when the run should end with Finish()
+    if not (args.metrics or args.profile):
+        return False
+    profile_directory = args.output + '.prof' if args.profile == 'cprofile' else None
+    Enable(args.metrics, args.profile, profile_directory)
+    return True
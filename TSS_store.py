@@ -0,0 +1,147 @@
+import os
+import sqlite3
+from rdflib.util import from_n3
+from TSS_columns import ObservationColumns,TimeFromNanos
+
+# Persistent observation store (SQLite) for repeated conversions of the same input.
+# The first run streams the input once into an observations table in column form
+# (the same encoding as TSS_columns) with an index on (sensor, time); later runs only
+# check that the input file is unchanged and then read each sensor back with an index
+# range scan, one sensor at a time, so re-windowing never reparses the input and only
+# one sensor's observations are in memory.
+
+BATCH_SIZE = 50000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS source (path TEXT, size INTEGER, mtime_ns INTEGER, observations INTEGER);
+CREATE TABLE IF NOT EXISTS terms (id INTEGER PRIMARY KEY, n3 TEXT UNIQUE NOT NULL);
+CREATE TABLE IF NOT EXISTS observations (
+    sensor INTEGER NOT NULL,
+    time_ns INTEGER NOT NULL,
+    time_offset INTEGER NOT NULL,
+    value REAL,
+    kind INTEGER NOT NULL,
+    id TEXT NOT NULL,
+    property INTEGER NOT NULL,
+    time_lexical TEXT,
+    value_lexical TEXT
+);
+"""
+INDEX = "CREATE INDEX IF NOT EXISTS observations_sensor_time ON observations (sensor, time_ns)"
+
+class ObservationStore:
+    def __init__(self, directory):
+        self.directory = directory
+        self.connection = sqlite3.connect(directory)
+        self.connection.executescript(SCHEMA)
+        self.term_ids = {}
+        self.terms = {}
+
+    def close(self):
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def is_current(self, input_directory):
+        # True when the store already holds this exact input file
+        row = self.connection.execute("SELECT path, size, mtime_ns FROM source").fetchone()
+        if row is None:
+            return False
+        stat = os.stat(input_directory)
+        return row == (os.path.abspath(input_directory), stat.st_size, stat.st_mtime_ns)
+
+    def term_id(self, term):
+        key = term.n3()
+        term_id = self.term_ids.get(key)
+        if term_id is None:
+            self.connection.execute("INSERT OR IGNORE INTO terms (n3) VALUES (?)", (key,))
+            term_id = self.connection.execute("SELECT id FROM terms WHERE n3 = ?", (key,)).fetchone()[0]
+            self.term_ids[key] = term_id
+        return term_id
+
+    def term(self, term_id):
+        term = self.terms.get(term_id)
+        if term is None:
+            n3 = self.connection.execute("SELECT n3 FROM terms WHERE id = ?", (term_id,)).fetchone()[0]
+            term = self.terms[term_id] = from_n3(n3)
+        return term
+
+    def clear(self):
+        with self.connection:
+            self.connection.execute("DELETE FROM source")
+            self.connection.execute("DELETE FROM observations")
+            self.connection.execute("DROP INDEX IF EXISTS observations_sensor_time")
+
+    def insert(self, buffers):
+        # buffers: sensor -> ObservationColumns of observations not stored yet
+        rows = []
+        for sensor, bucket in buffers.items():
+            sensor_id = self.term_id(sensor)
+            property_ids = [self.term_id(p) for p in bucket.property_table]
+            for i in range(len(bucket)):
+                keep_time, keep_value = bucket.lexical.get(i, (None, None))
+                rows.append((sensor_id, bucket.times[i], bucket.offsets[i], bucket.values[i], bucket.kinds[i],
+                             bucket.ids[i], property_ids[bucket.properties[i]], keep_time, keep_value))
+        self.connection.executemany("INSERT INTO observations VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        buffers.clear()
+        return len(rows)
+
+    def ingest(self, input_directory, parse):
+        # parse(on_observation) feeds every observation of the input to on_observation(sensor, row)
+        self.clear()
+        buffers = {}
+        count = [0, 0]
+
+        def add(sensor, row):
+            bucket = buffers.get(sensor)
+            if bucket is None:
+                bucket = buffers[sensor] = ObservationColumns()
+            bucket.append(row)
+            count[1] += 1
+            if count[1] >= BATCH_SIZE:
+                count[0] += self.insert(buffers)
+                count[1] = 0
+
+        with self.connection:
+            parse(add)
+            count[0] += self.insert(buffers)
+            self.connection.execute(INDEX)
+            stat = os.stat(input_directory)
+            self.connection.execute("INSERT INTO source VALUES (?, ?, ?, ?)",
+                                    (os.path.abspath(input_directory), stat.st_size, stat.st_mtime_ns, count[0]))
+        return count[0]
+
+    def sensors(self):
+        # sensor terms in the order they were first stored
+        ids = [row[0] for row in self.connection.execute("SELECT DISTINCT sensor FROM observations ORDER BY sensor")]
+        return [(sensor_id, self.term(sensor_id)) for sensor_id in ids]
+
+    def windows(self, sensor_id, windowing, selected=None):
+        # window key -> ObservationColumns of one sensor, sorted by time, from one index range scan.
+        # selected: a Selection whose time range narrows the scan and whose properties filter it
+        windows = {}
+        query = ("SELECT time_ns, time_offset, value, kind, id, property, time_lexical, value_lexical "
+                 "FROM observations WHERE sensor = ?")
+        parameters = [sensor_id]
+        if selected is not None and selected.start_ns is not None:
+            query += " AND time_ns >= ?"
+            parameters.append(selected.start_ns)
+        if selected is not None and selected.end_ns is not None:
+            query += " AND time_ns < ?"
+            parameters.append(selected.end_ns)
+        properties = selected.properties if selected is not None else None
+        rows = self.connection.execute(query + " ORDER BY time_ns, rowid", parameters)
+        for nanos, offset, value, kind, observation_id, property_id, keep_time, keep_value in rows:
+            if properties is not None and str(self.term(property_id)) not in properties:
+                continue
+            key = windowing.key(TimeFromNanos(nanos, offset))
+            bucket = windows.get(key)
+            if bucket is None:
+                bucket = windows[key] = ObservationColumns()
+            bucket.append_encoded(nanos, offset, float('nan') if value is None else value, kind,
+                                  observation_id, self.term(property_id), keep_time, keep_value)
+        return windows
@@ -0,0 +1,109 @@
+from datetime import timedelta,timezone
+from zoneinfo import ZoneInfo
+from TSS_columns import NAIVE,UTC_Z
+
+UNITS = ['hour', 'day', 'week', 'month']
+BOUNDS = ['points', 'window']
+
+def FormatLocal(local, offset):
+    # naive local datetime + TSS_columns offset code -> xsd:dateTime lexical form
+    if offset == NAIVE:
+        return local.isoformat()
+    if offset == UTC_Z:
+        return local.isoformat() + 'Z'
+    return local.replace(tzinfo=timezone(timedelta(minutes=offset))).isoformat()
+
+class Windowing:
+    # Decides which window an observation belongs to and how a window is cut into snippets.
+    # Calendar windows (hour/day/week/month, weeks start on Monday) are taken in `timezone`
+    # when one is given, otherwise in each timestamp's own offset, which is the original
+    # per-day grouping. A window is then cut further so that no snippet has more than
+    # max_points points or a tss:points literal longer than max_bytes.
+    #
+    # bounds='points' keeps tss:from/tss:to at the first and last point of each snippet.
+    # bounds='window' sets them to the window start and (exclusive) end; when a window is
+    # cut, each piece runs from its first point up to the first point of the next piece.
+    def __init__(self, unit='day', timezone_name=None, max_points=None, max_bytes=None, bounds='points'):
+        if unit not in UNITS:
+            raise ValueError(f"Unknown window unit {unit!r}, expected one of {UNITS}")
+        if bounds not in BOUNDS:
+            raise ValueError(f"Unknown bounds {bounds!r}, expected one of {BOUNDS}")
+        self.unit = unit
+        self.timezone = ZoneInfo(timezone_name) if timezone_name else None
+        self.max_points = max_points
+        self.max_bytes = max_bytes
+        self.bounds = bounds
+
+    def floor(self, local):
+        if self.unit == 'hour':
+            return local.replace(minute=0, second=0, microsecond=0)
+        start = local.replace(hour=0, minute=0, second=0, microsecond=0)
+        if self.unit == 'week':
+            start -= timedelta(days=start.weekday())
+        elif self.unit == 'month':
+            start = start.replace(day=1)
+        return start
+
+    def next_start(self, start):
+        if self.unit == 'hour':
+            return start + timedelta(hours=1)
+        if self.unit == 'day':
+            return start + timedelta(days=1)
+        if self.unit == 'week':
+            return start + timedelta(days=7)
+        if start.month == 12:
+            return start.replace(year=start.year + 1, month=1)
+        return start.replace(month=start.month + 1)
+
+    def key(self, t):
+        # window start as a naive local datetime, so keys of one run always compare
+        if self.timezone is not None:
+            if t.tzinfo is None:
+                t = t.replace(tzinfo=timezone.utc)
+            t = t.astimezone(self.timezone)
+        return self.floor(t.replace(tzinfo=None))
+
+    def window_bounds(self, key, bucket):
+        end = self.next_start(key)
+        if self.timezone is not None:
+            return key.replace(tzinfo=self.timezone).isoformat(), end.replace(tzinfo=self.timezone).isoformat()
+        # no timezone given: use the offset of the window's first point
+        offset = bucket.offsets[0]
+        return FormatLocal(key, offset), FormatLocal(end, offset)
+
+    def cuts(self, bucket):
+        # start positions of the snippets a sorted bucket is cut into
+        starts = [0]
+        if not self.max_points and not self.max_bytes:
+            return starts
+        count = 0
+        size = 2  # the [ ]
+        for i in range(len(bucket)):
+            point_size = len(bucket.point_json(i)) + 2 if self.max_bytes else 0
+            if count and ((self.max_points and count >= self.max_points)
+                          or (self.max_bytes and size + point_size > self.max_bytes)):
+                starts.append(i)
+                count = 0
+                size = 2
+            count += 1
+            size += point_size
+        return starts
+
+    def pieces(self, key, bucket):
+        # -> [(piece, tss:from lexical, tss:to lexical)]; None means first/last point time
+        starts = self.cuts(bucket)
+        if len(starts) == 1:
+            pieces = [bucket]
+        else:
+            stops = starts[1:] + [len(bucket)]
+            pieces = [bucket.slice(start, stop) for start, stop in zip(starts, stops)]
+        if self.bounds == 'points':
+            return [(piece, None, None) for piece in pieces]
+
+        window_start, window_end = self.window_bounds(key, bucket)
+        result = []
+        for n, piece in enumerate(pieces):
+            lower = window_start if n == 0 else piece.time_lexical(0)
+            upper = window_end if n == len(pieces) - 1 else pieces[n + 1].time_lexical(0)
+            result.append((piece, lower, upper))
+        return result
@@ -0,0 +1,24 @@
+import os
+import sys
+
+# the scripts are top-level modules in the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SOSA_PREFIXES = ['@prefix sosa: <http://www.w3.org/ns/sosa/> .', '@prefix xsd: <http://www.w3.org/2001/XMLSchema#> .']
+
+def Convert(module, arguments):
+    # one command-line run of a converter script
+    parser = module.BuildParser()
+    args = parser.parse_args([str(argument) for argument in arguments])
+    module.CheckArgs(parser, args)
+    module.Run(args)
+
+def WriteObservations(path, points, observed_property='River Stage'):
+    # points: (sensor, observation id, xsd:dateTime lexical, value lexical) -> Turtle file
+    lines = list(SOSA_PREFIXES)
+    for sensor, point_id, time, value in points:
+        lines.append(f'<http://example.com/{point_id}> a sosa:Observation ; sosa:madeBySensor "{sensor}" ; '
+                     f'sosa:observedProperty "{observed_property}" ; '
+                     f'sosa:resultTime "{time}"^^xsd:dateTime ; sosa:hasSimpleResult "{value}" .')
+    path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    return path
@@ -0,0 +1,106 @@
+import json
+from decimal import Decimal
+import pytest
+from rdflib import Graph, Literal, URIRef
+from rdflib.compare import isomorphic
+from rdflib.namespace import RDF
+import RDF2TSS_per_day_V2
+import TSS2RDF
+from RDF2TSS_per_day_V2 import SensorURI, TSS_SNIPPET, TSS_POINTS, TSS_POINT_TYPE, SOSA_OBSERVATION
+from RDF2TSS_per_day_V2 import TSS_ABOUT, TSS_POINT_TEMPLATE
+from RDF2TSS_per_day_V2 import TSS_COUNT, TSS_MIN, TSS_MAX, TSS_MEAN, TSS_INTERVAL, TSS_SUMMARIZES
+from RDF_stream import StatementRecords
+from conftest import Convert, WriteObservations
+
+def test_sensor_ids_are_unique_per_uri():
+    a = SensorURI(URIRef('http://ex/siteA/temp'))
+    b = SensorURI(URIRef('http://ex/siteB/temp'))
+    assert a[0] != b[0] and a[1] != b[1]
+    assert a[1].startswith('temp_') and b[1].startswith('temp_')
+    # the same URI always gets the same id, in any process
+    assert SensorURI(URIRef('http://ex/siteA/temp')) == a
+
+def test_minted_sensor_ids_are_kept():
+    assert SensorURI(Literal('24002042')) == (URIRef('http://example.org/sensor/24002042'), '24002042')
+    assert SensorURI(URIRef('http://example.org/sensor/24002042')) == (URIRef('http://example.org/sensor/24002042'), '24002042')
+
+def SnippetGraph(path):
+    graph = Graph().parse(str(path), format='turtle')
+    return graph, sorted(graph.subjects(RDF.type, TSS_SNIPPET))
+
+def test_pieces_with_equal_timestamps_get_distinct_snippets(tmp_path):
+    points = [('s1', f'o{n}', '2025-08-12T00:00:00Z', str(n)) for n in range(5)]
+    source = WriteObservations(tmp_path / 'observations.ttl', points)
+    tss = tmp_path / 'tss.ttl'
+    Convert(RDF2TSS_per_day_V2, ['-i', source, '-o', tss, '--max-points', '2'])
+    graph, snippets = SnippetGraph(tss)
+    assert len(snippets) == 3
+    assert sum(len(json.loads(graph.value(snippet, TSS_POINTS))) for snippet in snippets) == 5
+
+    observations = tmp_path / 'rdf.nt'
+    Convert(TSS2RDF, ['-i', tss, '-o', observations, '--out-format', 'nt'])
+    assert len(set(Graph().parse(str(observations), format='nt').subjects(RDF.type, SOSA_OBSERVATION))) == 5
+
+def test_aggregates_and_downsampled_companions(tmp_path):
+    times = ['00:00', '00:20', '00:40', '01:10']
+    points = [('s1', f'o{n}', f'2025-08-12T{time}:00Z', value) for n, (time, value) in enumerate(zip(times, ['4', '1.5', '7', '2.5']))]
+    source = WriteObservations(tmp_path / 'observations.ttl', points)
+    tss = tmp_path / 'tss.ttl'
+    Convert(RDF2TSS_per_day_V2, ['-i', source, '-o', tss, '--aggregates', '--downsample', '30'])
+    graph, snippets = SnippetGraph(tss)
+    snippet = [s for s in snippets if graph.value(s, TSS_POINT_TYPE) == SOSA_OBSERVATION][0]
+    assert [graph.value(snippet, p).toPython() for p in (TSS_COUNT, TSS_MIN, TSS_MAX, TSS_MEAN)] == [4, 1.5, 7, Decimal('3.75')]
+
+    companion = graph.value(predicate=TSS_SUMMARIZES, object=snippet)
+    assert str(graph.value(companion, TSS_INTERVAL)) == 'PT30M'
+    buckets = json.loads(graph.value(companion, TSS_POINTS))
+    assert [(b['count'], b['min'], b['max']) for b in buckets] == [(2, 1.5, 4), (1, 7, 7), (1, 2.5, 2.5)]
+
+def test_shared_templates_come_before_their_snippets(tmp_path):
+    points = [(f's{n % 2}', f'o{n}', f'2025-08-{10 + n // 2:02d}T00:00:00Z', str(n)) for n in range(8)]
+    source = WriteObservations(tmp_path / 'observations.ttl', points)
+    tss = tmp_path / 'tss.ttl'
+    Convert(RDF2TSS_per_day_V2, ['-i', source, '-o', tss, '--shared-templates'])
+    seen = set()
+    snippets = 0
+    for offset, length, triples in StatementRecords(str(tss), 'turtle'):
+        for s, p, o in triples or ():
+            if p == RDF.type and o == TSS_POINT_TEMPLATE:
+                seen.add(s)
+            if p == TSS_ABOUT:
+                assert o in seen
+                snippets += 1
+    assert len(seen) == 2 and snippets == 8
+
+@pytest.mark.parametrize('arguments', [['--timezone', 'Nowhere/Zone'], ['--max-points', '0'], ['--max-bytes', '-1'],
+                                       ['--workers', '0'], ['--update', 'tss.ttl', '--workers', '2'],
+                                       ['--update', 'tss.ttl', '--stream'], ['--stream', '--engine', 'sparql']])
+def test_invalid_options_are_rejected(arguments, capsys):
+    parser = RDF2TSS_per_day_V2.BuildParser()
+    args = parser.parse_args(['-i', 'observations.ttl', '-o', 'out.ttl'] + arguments)
+    with pytest.raises(SystemExit):
+        RDF2TSS_per_day_V2.CheckArgs(parser, args)
+    assert arguments[0] in capsys.readouterr().err
+
+def test_workers_leave_the_metrics_file_to_the_main_process(tmp_path):
+    points = [(f's{s}', f'o{s}_{n}', f'2025-08-{12 + n % 3}T00:{n:02d}:00Z', str(n)) for s in range(3) for n in range(12)]
+    source = WriteObservations(tmp_path / 'observations.ttl', points)
+    metrics = tmp_path / 'metrics.jsonl'
+    Convert(RDF2TSS_per_day_V2, ['-i', source, '-o', tmp_path / 'tss.ttl', '--workers', '2', '--metrics', metrics])
+    events = [json.loads(line) for line in metrics.read_text().splitlines()]
+    # snippet events would come from the workers; the main process reports their counters as 'snippets'
+    assert not [event for event in events if event['event'] == 'snippet']
+    assert sum(event['observations'] for event in events if event['event'] == 'snippets') == len(points)
+    assert events[-1]['event'] == 'summary' and events[-1]['observations'] == len(points)
+
+def test_external_engine_matches_the_indexed_engine(tmp_path):
+    # out of order, over two sensors and two days, so the runs need merging
+    points = [(f's{n % 2}', f'o{n}', f'2025-08-{12 + n % 3 // 2}T{(17 * n) % 24:02d}:{n:02d}:00Z', str(n)) for n in range(20)]
+    source = WriteObservations(tmp_path / 'observations.ttl', points)
+    Convert(RDF2TSS_per_day_V2, ['-i', source, '-o', tmp_path / 'indexed.ttl'])
+    runs = tmp_path / 'runs'
+    runs.mkdir()
+    Convert(RDF2TSS_per_day_V2, ['-i', source, '-o', tmp_path / 'external.ttl', '--engine', 'external',
+                                 '--run-size', '3', '--temp-dir', runs])
+    assert isomorphic(Graph().parse(str(tmp_path / 'indexed.ttl')), Graph().parse(str(tmp_path / 'external.ttl')))
+    assert not list(runs.iterdir())
@@ -0,0 +1,24 @@
+from RDF_prettify import LoadGraph, SaveGraph, PrettifyStream
+
+# lists (nested, empty, holding blank nodes), multi-valued predicates at every depth and
+# an unreferenced blank node subject; no URI subject is referred to and no blank node
+# is shared, the two cases where the layouts still differ
+LAYOUT_TURTLE = '''@prefix ex: <http://example.org/> .
+@prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#> .
+ex:a a ex:Thing, ex:Other ;
+    rdfs:label "A" ;
+    ex:list ( 1 2 ex:c ) ;
+    ex:empty () ;
+    ex:multi ex:x, ex:y, ex:z ;
+    ex:nested [ ex:p 1, 2 ; ex:q ( "x" [ ex:r 3 ; ex:s 4 ] ( 5 6 ) ) ; ex:t [ ex:u 7 ; ex:v 8, 9 ] ] .
+ex:b ex:two "t1", "t2"@en ; ex:when "2025-08-12T00:00:00Z"^^<http://www.w3.org/2001/XMLSchema#dateTime> .
+[] ex:top 1 ; ex:top2 2 .
+'''
+
+def test_stream_layout_matches_rdflib(tmp_path):
+    source = tmp_path / 'layout.ttl'
+    source.write_text(LAYOUT_TURTLE, encoding='utf-8')
+    in_memory, streamed = tmp_path / 'in_memory.ttl', tmp_path / 'streamed.ttl'
+    SaveGraph(str(in_memory), LoadGraph(str(source)))
+    PrettifyStream(str(source), str(streamed), run_size=4, temp_dir=str(tmp_path))
+    assert streamed.read_text(encoding='utf-8') == in_memory.read_text(encoding='utf-8')
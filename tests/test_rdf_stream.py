@@ -0,0 +1,75 @@
+from rdflib import Graph
+from rdflib.compare import isomorphic
+from RDF_stream import TurtleLines, ParseTurtle, GraphWriter
+
+# Valid Turtle where a line-based check finds '.' at line ends that do not end a statement:
+# in trailing comments, long strings ("""/''') and IRIs with '#'.
+TRICKY_TURTLE = '''@prefix ex: <http://example.org/> .
+@prefix sosa: <http://www.w3.org/ns/sosa/> .
+# a comment line.
+ex:o1 a sosa:Observation ; # reading no.
+    sosa:hasSimpleResult "1.5" ; # unit: m.
+    sosa:madeBySensor <http://example.org/sensor#a.> .
+ex:o2 a sosa:Observation ;
+    ex:note """first line ends in a dot.
+second line too.
+""" ;
+    ex:other \'\'\'a single-quoted long string.
+ending here.\'\'\' ;
+    ex:short "a # that is no comment." , 'it\\'s fine.' .
+ex:o3 ex:p ex:o . # done.
+ex:o4 ex:p [ ex:q "x" ] . ex:o5 ex:p ex:o .
+'''
+
+def test_statement_ends():
+    lines = TurtleLines()
+    ends = [lines.ends_statement(line) for line in TRICKY_TURTLE.splitlines(True)]
+    assert ends == [True, True, False, False, False, True,
+                    False, False, False, False, False, False, True, True, True]
+
+def test_parse_turtle_cut_at_every_statement(tmp_path):
+    path = tmp_path / 'tricky.ttl'
+    path.write_text(TRICKY_TURTLE, encoding='utf-8')
+    streamed = Graph()
+    # chunk_size=1 hands the parser one statement at a time
+    ParseTurtle(str(path), GraphWriter(streamed), chunk_size=1)
+    expected = Graph().parse(str(path), format='turtle', publicID="https://example.org/")
+    assert len(streamed) == len(expected) == 12
+    assert isomorphic(streamed, expected)
+
+def test_mapped_chunks_end_on_statements(tmp_path):
+    import RDF_stream
+    from RDF_stream import MappedChunks, ReadChunk, ParseChunk
+    # no long strings, so the file may be cut into several chunks
+    body = '\n'.join(line for line in TRICKY_TURTLE.splitlines()[:6]) + '\n'
+    path = tmp_path / 'comments.ttl'
+    path.write_text(body + ''.join(f'ex:s{i} ex:p "v{i}." ; # no. {i}.\n    ex:q ex:o .\n' for i in range(200)), encoding='utf-8')
+    minimum = RDF_stream.MIN_CHUNK_BYTES
+    RDF_stream.MIN_CHUNK_BYTES = 64
+    try:
+        chunks = MappedChunks(str(path), 16)
+    finally:
+        RDF_stream.MIN_CHUNK_BYTES = minimum
+    assert len(chunks) == 16
+    parsed = Graph()
+    for start, end, header in chunks:
+        ParseChunk(header + ReadChunk(str(path), start, end), GraphWriter(parsed))
+    expected = Graph().parse(str(path), format='turtle', publicID="https://example.org/")
+    assert len(parsed) == len(expected) == 403
+    assert isomorphic(parsed, expected)
+
+def test_statement_spans_keep_commented_statements_whole(tmp_path):
+    from RDF_stream import StatementSpans
+    path = tmp_path / 'tricky.ttl'
+    path.write_bytes(TRICKY_TURTLE.encode('utf-8'))
+    spans = list(StatementSpans(str(path)))
+    data = path.read_bytes()
+    # byte ranges that cover the file and each parse on their own after the prefixes
+    assert b''.join(text for offset, text in spans) == data
+    assert all(data[offset:offset + len(text)] == text for offset, text in spans)
+    header = b''.join(text for offset, text in spans[:2])
+    total = 0
+    for offset, text in spans[2:]:
+        total += len(Graph().parse(data=(header + text).decode('utf-8'), format='turtle'))
+    assert [text.count(b'\n') for offset, text in spans[2:]] == [4, 7, 1, 1]
+    assert total == 12
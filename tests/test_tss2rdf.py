@@ -0,0 +1,44 @@
+import json
+from rdflib import Literal, URIRef
+from rdflib.namespace import XSD
+from TSS2RDF import GuessLiteral, ExpandPoints, SOSA_HAS_SIMPLE_RESULT
+
+def test_guess_literal():
+    assert GuessLiteral(True) == Literal('true', datatype=XSD.boolean)
+    assert GuessLiteral(False) == Literal('false', datatype=XSD.boolean)
+    assert GuessLiteral('true') == Literal('true', datatype=XSD.boolean)
+    assert GuessLiteral(1) == Literal(1.0, datatype=XSD.decimal)
+    assert GuessLiteral('1.5') == Literal(1.5, datatype=XSD.decimal)
+    assert GuessLiteral('high') == Literal('high', datatype=XSD.string)
+
+def test_json_values_of_hand_written_snippets():
+    points = [{"time": "2025-08-12T00:00:00Z", "value": value, "id": f"http://ex/o{i}", "observedProperty": "p"}
+              for i, value in enumerate([True, 1, "true"])]
+    triples, ids = ExpandPoints(Literal(json.dumps(points)))
+    values = {s: o for s, p, o in triples if p == SOSA_HAS_SIMPLE_RESULT}
+    assert values[URIRef('http://ex/o0')] == Literal('true', datatype=XSD.boolean)
+    assert values[URIRef('http://ex/o1')] == Literal(1.0, datatype=XSD.decimal)
+    assert values[URIRef('http://ex/o2')] == Literal('true', datatype=XSD.boolean)
+
+def test_bounded_imap_keeps_order_and_bound():
+    import time
+    from multiprocessing.pool import ThreadPool
+    from TSS2RDF import BoundedImap
+    submitted = []
+    taken = []
+
+    def tasks():
+        for n in range(40):
+            # never more than `window` tasks submitted ahead of the results taken
+            assert len(submitted) - len(taken) <= 4
+            submitted.append(n)
+            yield n
+
+    def work(n):
+        time.sleep(0.02 if n % 7 == 0 else 0)  # a few slow ones
+        return n * n
+
+    with ThreadPool(3) as pool:
+        for result in BoundedImap(pool, work, tasks(), 4):
+            taken.append(result)
+    assert taken == [n * n for n in range(40)]
@@ -0,0 +1,39 @@
+import argparse
+import asyncio
+from rdflib import Graph
+import TSS_batch
+from conftest import WriteObservations
+
+def Batch(inputs, output):
+    args = argparse.Namespace(input=[str(path) for path in inputs], output=str(output), direction='rdf2tss', jobs=1,
+                              pattern=TSS_batch.DEFAULT_PATTERNS, watch=None)
+    output.mkdir(exist_ok=True)
+    return asyncio.run(TSS_batch.BatchRunner(args, [], 'turtle').run())
+
+def test_batch_converts_and_skips_unchanged_inputs(tmp_path):
+    inputs = tmp_path / 'dumps'
+    inputs.mkdir()
+    WriteObservations(inputs / 'a.ttl', [('s1', 'o1', '2025-08-12T00:00:00Z', '1')])
+    WriteObservations(inputs / 'b.ttl', [('s2', 'o2', '2025-08-12T00:00:00Z', '2')])
+    output = tmp_path / 'tss'
+    assert Batch([inputs], output) == {'converted': 2, 'skipped': 0, 'failed': 0}
+    assert sorted(path.name for path in output.glob('*.ttl')) == ['a_tss.ttl', 'b_tss.ttl']
+    assert Batch([inputs], output) == {'converted': 0, 'skipped': 2, 'failed': 0}
+
+    WriteObservations(inputs / 'b.ttl', [('s2', 'o2', '2025-08-12T00:00:00Z', '3')])
+    assert Batch([inputs], output) == {'converted': 1, 'skipped': 1, 'failed': 0}
+
+def test_inputs_with_the_same_output_are_not_overwritten(tmp_path):
+    inputs = tmp_path / 'dumps'
+    inputs.mkdir()
+    WriteObservations(inputs / 'a.ttl', [('s1', 'o1', '2025-08-12T00:00:00Z', '1')])
+    other = WriteObservations(tmp_path / 'other.ttl', [('s9', 'o9', '2025-08-12T00:00:00Z', '9')])
+    Graph().parse(str(other), format='turtle').serialize(str(inputs / 'a.nt'), format='nt', encoding='utf-8')
+    output = tmp_path / 'tss'
+    assert Batch([inputs / 'a.ttl'], output)['converted'] == 1
+    written = (output / 'a_tss.ttl').read_bytes()
+
+    # a.nt maps to the same a_tss.ttl, in this run and in a later one
+    assert Batch([inputs], output) == {'converted': 0, 'skipped': 1, 'failed': 1}
+    assert Batch([inputs / 'a.nt'], output)['failed'] == 1
+    assert (output / 'a_tss.ttl').read_bytes() == written
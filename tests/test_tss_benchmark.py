@@ -0,0 +1,11 @@
+import TSS_benchmark
+
+def test_cases_run_the_converters_command_line(tmp_path):
+    source = str(tmp_path / 'synthetic.nt')
+    TSS_benchmark.GenerateSOSA(source, sensors=2, days=1, points_per_day=24)
+    tss = str(tmp_path / 'synthetic_tss.ttl')
+    result = TSS_benchmark.RunCase(('rdf2tss-indexed', source, None, tss))
+    assert [stage['stage'] for stage in result['stages']] == ['parse', 'grouping', 'build', 'serialize']
+    result = TSS_benchmark.RunCase(('tss2rdf', source, tss, str(tmp_path / 'rdf.ttl')))
+    assert [stage['stage'] for stage in result['stages']] == ['parse', 'expand', 'serialize']
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['rdf.ttl', 'synthetic.nt', 'synthetic_tss.ttl']
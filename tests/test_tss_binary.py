@@ -0,0 +1,83 @@
+import json
+from collections import namedtuple
+import pytest
+from rdflib import Graph, Literal, URIRef
+from rdflib.compare import isomorphic
+from rdflib.namespace import XSD
+from TSS_columns import ObservationColumns
+from TSS_binary import PackPoints, UnpackPoints, PackedPointDicts
+import RDF2TSS_per_day_V2
+import TSS2RDF
+from conftest import Convert
+
+Row = namedtuple('Row', ['OBSERVATION', 'TIME', 'READING', 'observedProperty'])
+
+def Bucket(points):
+    # points: (id, xsd:dateTime lexical, value lexical, observedProperty)
+    bucket = ObservationColumns()
+    for point_id, time, value, observed_property in points:
+        bucket.append(Row(URIRef(point_id), Literal(time, datatype=XSD.dateTime), Literal(value), Literal(observed_property)))
+    bucket.sort()
+    return bucket
+
+CASES = {
+    'times': [('http://ex/o1', '2025-08-12T00:00:00', '1', 'p'),                  # naive
+              ('http://ex/o2', '2025-08-12T00:01:00Z', '2', 'p'),                 # Z
+              ('http://ex/o3', '2025-08-12T02:02:00+02:00', '3', 'p'),            # offset
+              ('http://ex/o4', '2025-08-12T00:03:00.250000-05:30', '4', 'p'),
+              ('http://ex/o5', '2025-08-12T00:04:00.5+00:00', '5', 'p')],         # non-canonical
+    'values': [('http://ex/o1', '2025-08-12T00:00:00Z', '1.50', 'p'),
+               ('http://ex/o2', '2025-08-12T00:01:00Z', 'NaN', 'p'),
+               ('http://ex/o3', '2025-08-12T00:02:00Z', 'true', 'p'),
+               ('http://ex/o4', '2025-08-12T00:03:00Z', 'false', 'p'),
+               ('http://ex/o5', '2025-08-12T00:04:00Z', '-0.0', 'p'),
+               ('http://ex/o6', '2025-08-12T00:05:00Z', '1e3', 'p'),
+               ('http://ex/o7', '2025-08-12T00:06:00Z', 'high', 'p'),
+               ('http://ex/o8', '2025-08-12T00:07:00Z', '34.54', 'p'),
+               ('http://ex/o9', '2025-08-12T00:08:00Z', '12345678901234567890', 'p')],
+    'numeric ids': [('http://ex/r9', '2025-08-12T00:00:00Z', '1', 'p'),
+                    ('http://ex/r10', '2025-08-12T00:01:00Z', '2', 'p'),
+                    ('http://ex/r7', '2025-08-12T00:02:00Z', '3', 'p')],
+    'text ids': [('http://ex/reading_a', '2025-08-12T00:00:00Z', '1', 'p'),
+                 ('http://ex/reading_b', '2025-08-12T00:01:00Z', '2', 'p'),
+                 ('http://ex/other', '2025-08-12T00:02:00Z', '3', 'p')],
+    'leading zeros': [('http://ex/o01', '2025-08-12T00:00:00Z', '1', 'p'),
+                      ('http://ex/o02', '2025-08-12T00:01:00Z', '2', 'p'),
+                      ('http://ex/o3', '2025-08-12T00:02:00Z', '3', 'p')],
+    'prefix only': [('http://ex/o1', '2025-08-12T00:00:00Z', '1', 'p'),
+                    ('http://ex/o10', '2025-08-12T00:01:00Z', '2', 'p')],
+    'single point': [('http://ex/only', '2025-08-12T00:00:00Z', '7.5', 'p')],
+    'properties': [('http://ex/o1', '2025-08-12T00:00:00Z', '1', 'River Stage'),
+                   ('http://ex/o2', '2025-08-12T00:01:00Z', '2', 'Water temperature'),
+                   ('http://ex/o3', '2025-08-12T00:02:00Z', '3', 'River Stage'),
+                   ('http://ex/o4', '2025-08-12T00:03:00Z', '4', 'Discharge "m3/s"')],
+}
+
+@pytest.mark.parametrize('name', sorted(CASES))
+def test_packed_round_trip(name):
+    bucket = Bucket(CASES[name])
+    text = PackPoints(bucket)
+    assert UnpackPoints(text).points_json() == bucket.points_json()
+    assert list(PackedPointDicts(text)) == json.loads(bucket.points_json())
+
+def test_packed_conversion_matches_json(tmp_path):
+    lines = ['@prefix sosa: <http://www.w3.org/ns/sosa/> .', '@prefix xsd: <http://www.w3.org/2001/XMLSchema#> .']
+    for name in sorted(CASES):
+        for number, (point_id, time, value, observed_property) in enumerate(CASES[name]):
+            sensor = f'"{name.replace(" ", "_")}"'
+            lines.append(f'<{point_id}_{name.replace(" ", "_")}> a sosa:Observation ; sosa:madeBySensor {sensor} ; '
+                         f'sosa:observedProperty {json.dumps(observed_property)} ; '
+                         f'sosa:resultTime "{time}"^^xsd:dateTime ; sosa:hasSimpleResult "{value}" .')
+    source = tmp_path / 'observations.ttl'
+    source.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+
+    expanded = {}
+    for codec in ('fast', 'packed'):
+        tss = tmp_path / f'{codec}_tss.ttl'
+        Convert(RDF2TSS_per_day_V2, ['-i', str(source), '-o', str(tss), '--points-codec', codec])
+        assert ('PackedPoints' in tss.read_text(encoding='utf-8')) == (codec == 'packed')
+        observations = tmp_path / f'{codec}_rdf.nt'
+        Convert(TSS2RDF, ['-i', str(tss), '-o', str(observations), '--out-format', 'nt'])
+        expanded[codec] = Graph().parse(str(observations), format='nt')
+    assert len(expanded['packed']) == len(expanded['fast']) > 0
+    assert isomorphic(expanded['packed'], expanded['fast'])
@@ -0,0 +1,46 @@
+import json
+import re
+from rdflib import Graph
+from rdflib.compare import isomorphic
+import RDF2TSS_per_day_V2
+from conftest import Convert, WriteObservations
+
+def DayPoints(day, values):
+    # one window (the day) of sensor s1
+    return [('s1', f'o{day}_{n}', f'2025-08-{day}T00:{n:02d}:00Z', value) for n, value in enumerate(values)]
+
+def CachedRun(tmp_path, capsys, points, name, options=()):
+    # converts with --cache and --metrics; returns the output, the cache counters and the metrics events
+    source = WriteObservations(tmp_path / f'{name}.ttl', points)
+    output = tmp_path / f'{name}.nt'
+    metrics = tmp_path / f'{name}.jsonl'
+    capsys.readouterr()
+    Convert(RDF2TSS_per_day_V2, ['-i', source, '-o', output, '--out-format', 'nt', '--cache', tmp_path / 'cache',
+                                 '--metrics', metrics] + list(options))
+    counters = re.search(r'fragments (\d+) hits/(\d+) misses', capsys.readouterr().out)
+    events = [json.loads(line) for line in metrics.read_text().splitlines()]
+    return output.read_text(), tuple(map(int, counters.groups())), events
+
+def test_fragment_hits_report_the_same_metrics_as_misses(tmp_path, capsys):
+    first = DayPoints(12, ['1', '2', '3']) + DayPoints(13, ['4', '5'])
+    text, counters, events = CachedRun(tmp_path, capsys, first, 'first')
+    assert counters == (0, 2)
+    built = [event for event in events if event['event'] == 'snippet']
+
+    # day 13 changed: day 12 comes from the cache
+    second = DayPoints(12, ['1', '2', '3']) + DayPoints(13, ['4', '6'])
+    text, counters, events = CachedRun(tmp_path, capsys, second, 'second')
+    assert counters == (1, 1)
+    snippets = [event for event in events if event['event'] == 'snippet']
+    assert [(e['sensor'], e['points'], e['json_bytes']) for e in snippets] == [(e['sensor'], e['points'], e['json_bytes']) for e in built]
+    assert events[-1]['observations'] == 5
+
+    Convert(RDF2TSS_per_day_V2, ['-i', tmp_path / 'second.ttl', '-o', tmp_path / 'plain.nt', '--out-format', 'nt'])
+    assert isomorphic(Graph().parse(data=text, format='nt'), Graph().parse(str(tmp_path / 'plain.nt'), format='nt'))
+
+def test_fragments_are_rebuilt_when_their_options_change(tmp_path, capsys):
+    points = DayPoints(12, ['1', '2', '3']) + DayPoints(13, ['4', '5'])
+    CachedRun(tmp_path, capsys, points, 'first')
+    _, counters, events = CachedRun(tmp_path, capsys, points, 'second', ['--max-points', '2'])
+    assert counters == (0, 2)
+    assert len([event for event in events if event['event'] == 'snippet']) == 3
@@ -0,0 +1,31 @@
+import sys
+from rdflib import Graph, Literal
+from rdflib.namespace import RDF, XSD
+import RDF2TSS_per_day_V2
+import TSS_index
+from RDF2TSS_per_day_V2 import TSS_SNIPPET, TSS_INTERVAL, TSS_AGGREGATE_POINT, TSS_POINT_TYPE
+from conftest import Convert, WriteObservations
+
+def Query(monkeypatch, arguments):
+    monkeypatch.setattr(sys, 'argv', ['TSS_index.py', 'query'] + [str(argument) for argument in arguments])
+    TSS_index.main()
+
+def test_downsampled_companions_are_found_by_interval(tmp_path, monkeypatch):
+    points = [('s1', f'o{n}', f'2025-08-12T{n // 6:02d}:{n % 6 * 10:02d}:00Z', str(n)) for n in range(24)]
+    source = WriteObservations(tmp_path / 'observations.ttl', points)
+    tss = tmp_path / 'tss.ttl'
+    Convert(RDF2TSS_per_day_V2, ['-i', source, '-o', tss, '--downsample', '60', '--index'])
+    assert '"PT60M"^^xsd:duration' in tss.read_text(encoding='utf-8')
+
+    for interval in ('PT60M', 'PT1H'):
+        companions = tmp_path / f'{interval}.ttl'
+        Query(monkeypatch, ['-i', tss, '-o', companions, '--interval', interval])
+        graph = Graph().parse(str(companions), format='turtle')
+        snippets = list(graph.subjects(RDF.type, TSS_SNIPPET))
+        assert len(snippets) == 1
+        assert graph.value(snippets[0], TSS_POINT_TYPE) == TSS_AGGREGATE_POINT
+        assert graph.value(snippets[0], TSS_INTERVAL).toPython() == Literal('PT1H', datatype=XSD.duration).toPython()
+
+    index = TSS_index.LoadIndex(str(tss))
+    assert TSS_index.FindSnippets(index, interval='PT30M') == []
+    assert len(TSS_index.FindSnippets(index)) == 1
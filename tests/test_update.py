@@ -0,0 +1,44 @@
+import pytest
+from rdflib import Graph
+from rdflib.compare import isomorphic
+import RDF2TSS_per_day_V2
+import TSS_index
+from conftest import Convert, WriteObservations
+
+BASE = [('s1', 'o1', '2025-08-12T01:00:00Z', '1'),
+        ('s1', 'o2', '2025-08-12T03:00:00Z', '2'),
+        ('s1', 'o3', '2025-08-13T01:00:00Z', '3'),
+        ('s2', 'o4', '2025-08-12T02:00:00Z', '4'),
+        ('s2', 'o5', '2025-08-14T02:00:00Z', '5')]
+DELTA = [('s1', 'o2', '2025-08-12T03:00:00Z', '20'),    # same id: replaces the old point
+         ('s1', 'o6', '2025-08-12T02:00:00Z', '6'),     # a window the file already has
+         ('s2', 'o7', '2025-08-15T00:00:00Z', '7'),     # a new window
+         ('s3', 'o8', '2025-08-12T00:00:00Z', '8')]     # a new sensor
+MERGED = [point for point in BASE if point[1] != 'o2'] + DELTA
+
+def Graphs(directory, fmt):
+    return Graph().parse(str(directory), format=fmt)
+
+@pytest.mark.parametrize('indexed', [True, False])
+@pytest.mark.parametrize('options', [[], ['--out-format', 'nt'], ['--shared-templates'], ['--downsample', '60']])
+def test_update_matches_a_full_conversion(tmp_path, monkeypatch, indexed, options):
+    fmt = 'nt' if 'nt' in options else 'turtle'
+    base = WriteObservations(tmp_path / 'base.ttl', BASE)
+    delta = WriteObservations(tmp_path / 'delta.ttl', DELTA)
+    merged = WriteObservations(tmp_path / 'merged.ttl', MERGED)
+    existing, updated, expected = (tmp_path / f'{name}.{"nt" if fmt == "nt" else "ttl"}' for name in ('existing', 'updated', 'expected'))
+    Convert(RDF2TSS_per_day_V2, ['-i', base, '-o', existing] + options + (['--index'] if indexed else []))
+    with monkeypatch.context() as patch:
+        if indexed:
+            # with an index the existing file is never loaded as a whole
+            patch.setattr(RDF2TSS_per_day_V2, 'LoadGraph', None)
+        Convert(RDF2TSS_per_day_V2, ['-i', delta, '--update', existing, '-o', updated, '--index'] + options)
+    Convert(RDF2TSS_per_day_V2, ['-i', merged, '-o', expected] + options)
+    assert isomorphic(Graphs(updated, fmt), Graphs(expected, fmt))
+
+    # the index written along with the update finds the same snippets as a rebuilt one
+    index = TSS_index.LoadIndex(str(updated))
+    rebuilt = TSS_index.BuildIndex(str(updated), fmt)
+    snippet = lambda entry: {key: value for key, value in entry.items() if key not in ('offset', 'length', 'template')}
+    assert sorted(map(str, map(snippet, index['snippets']))) == sorted(map(str, map(snippet, rebuilt['snippets'])))
+    assert isomorphic(TSS_index.ReadSnippets(str(updated), index, index['snippets']), Graphs(expected, fmt))